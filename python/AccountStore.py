@@ -0,0 +1,87 @@
+import hashlib
+import hmac
+import os
+
+from RecordWriter import locked
+
+HASH_PREFIX = "pbkdf2_sha256"
+
+
+class AccountStore:
+    def __init__(self, file_name, iterations=100000):
+        self.file_name = file_name  # Text file with one "username,password record" line per account change
+        self.iterations = iterations  # PBKDF2 rounds used for newly stored passwords
+        self.accounts = {}  # Username -> stored password record
+        self._loaded_size = 0  # How much of the file is already in self.accounts
+
+    def _refresh(self):
+        """Reads any lines appended to the file since the last read (by this or another process)."""
+        try:
+            size = os.path.getsize(self.file_name)
+        except FileNotFoundError:
+            return False
+        if size < self._loaded_size:  # File was replaced, start over
+            self.accounts = {}
+            self._loaded_size = 0
+        if size > self._loaded_size:
+            with open(self.file_name, "rb") as file:
+                file.seek(self._loaded_size)
+                data = file.read(size - self._loaded_size)
+            complete = data.rfind(b"\n") + 1  # Leave a half-written last line for the next read
+            for line in data[:complete].decode().splitlines():
+                if ',' not in line or not line.strip():
+                    continue
+                username, stored = line.strip().split(",", 1)
+                self.accounts[username] = stored  # Later lines (e.g. rehashed passwords) win
+            self._loaded_size += complete
+        return True
+
+    def _hash_password(self, password, salt=None, iterations=None):
+        """Returns a salted PBKDF2 record for the password."""
+        salt = salt if salt is not None else os.urandom(16)
+        iterations = iterations or self.iterations
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+        return f"{HASH_PREFIX}${iterations}${salt.hex()}${digest.hex()}"
+
+    def _check_password(self, password, stored):
+        """Checks a password against a stored record, accepting old plaintext records."""
+        if not stored.startswith(HASH_PREFIX + "$"):
+            return hmac.compare_digest(password.encode(), stored.encode())
+        _, iterations, salt, _ = stored.split("$")
+        expected = self._hash_password(password, bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(expected, stored)
+
+    def _append(self, username, stored, new_account=False):
+        """Appends an account line under the file lock; a new account fails if the name got taken."""
+        with locked(self.file_name):
+            self._refresh()  # Pick up accounts other processes created meanwhile
+            if new_account and username in self.accounts:
+                return False
+            with open(self.file_name, "a") as file:
+                file.write(f"{username},{stored}\n")
+            self._refresh()
+        return True
+
+    def exists(self, username):
+        """Returns True if the username is already taken."""
+        self._refresh()
+        return username in self.accounts
+
+    def create(self, username, password):
+        """Stores a new account with a salted password hash; returns False if the username is taken."""
+        if self.exists(username):
+            return False
+        return self._append(username, self._hash_password(password), new_account=True)
+
+    def verify(self, username, password):
+        """Returns None for an unknown username, otherwise whether the password is correct."""
+        if not self._refresh():
+            return None
+        stored = self.accounts.get(username)
+        if stored is None:
+            return None
+        if not self._check_password(password, stored):
+            return False
+        if not stored.startswith(HASH_PREFIX + "$"):
+            self._append(username, self._hash_password(password))  # Replace the plaintext password
+        return True
@@ -0,0 +1,1044 @@
+import argparse
+import builtins
+import contextlib
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+from datetime import datetime, timedelta
+
+import Main
+import Metrics
+from AccountStore import AccountStore
+from CartStore import CartStore
+from Cashier import CashierSystem
+from CatalogStore import CatalogStore
+from FeedbackAnalytics import FeedbackAnalytics
+from Inventory import InventoryEngine
+from Ledger import Ledger
+from Manager import Manager
+from OrderIndex import OrderIndex
+from OrderStore import OrderStore
+from SalesExport import export_sales, sale_rows
+from SalesHistory import SalesHistory
+from SalesJournal import RECORD_HEADER, SalesJournal
+from Storage import SQLiteStorage
+from TestSupport import load_cashier, make_baskets, make_products, make_sale_record, place_orders, working_directory
+
+
+def make_sales(products, count, days=7, seed=0):
+    """Builds (basket, timestamp) pairs spread evenly over a number of days."""
+    first = datetime(2024, 1, 1)
+    step = timedelta(days=days) / max(count, 1)
+    return [(basket, first + step * i) for i, basket in enumerate(make_baskets(products, count, seed=seed))]
+
+
+def make_order_lines(count):
+    """Builds Order.txt lines with unique order IDs."""
+    return [f"{i:08X} | Customer{i % 997} | B01, P02 | Pending\n" for i in range(count)]
+
+
+def make_customer_lines(count, record):
+    """Builds Customers.txt lines that all share one stored password record."""
+    return [f"user{i},{record}\n" for i in range(count)]
+
+
+def make_feedback_lines(count, seed=0):
+    """Builds Feedback.txt lines of username, dish and review."""
+    rng = random.Random(seed)
+    words = ["great", "cold", "sweet", "bitter", "perfect", "slow", "friendly", "creamy", "dry", "fresh"]
+    return [f"user{i % 5000},X{rng.randrange(1000):06d},{' '.join(rng.choices(words, k=6))}\n"
+            for i in range(count)]
+
+
+def time_call(func, repeat):
+    """Runs func repeat times and returns the mean latency in microseconds."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = time.perf_counter() - start
+    return elapsed / repeat * 1e6
+
+
+def bench_checkout(sizes=(16, 1000, 10000, 100000), basket_size=5, repeat=2000):
+    """Measures checkout latency as the catalog grows."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            products = make_products(size)
+            cashier = load_cashier(products, directory)
+            rng = random.Random(size)
+            basket = [rng.choice(products)["id"] for _ in range(basket_size)]
+            cashier.price_basket(basket)  # Build the price table outside the timed loop
+            results[size] = time_call(lambda: cashier.process_transaction(basket), repeat)
+            print(f"checkout  {size:>7} products: {results[size]:8.2f} us/transaction")
+    return results
+
+
+def bench_batch_pricing(catalog_size=1000, basket_count=1000000):
+    """Compares per-transaction checkout with price_baskets and checks the totals match."""
+    with tempfile.TemporaryDirectory() as directory:
+        products = make_products(catalog_size)
+        cashier = load_cashier(products, directory)
+        for product in products[::3]:
+            cashier.discounts[product["id"]] = 15
+        baskets = make_baskets(products, basket_count)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for basket in baskets:
+                cashier.process_transaction(basket)
+            single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        priced = cashier.price_baskets(baskets)
+        batch_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for sale, result in zip(cashier.sales, priced)
+                     if abs(sale["total"] - result["total"]) > 0.01)  # Sales are kept in whole cents
+    print(f"single    {basket_count / single_seconds:12,.0f} baskets/s")
+    print(f"batch     {basket_count / batch_seconds:12,.0f} baskets/s "
+          f"({single_seconds / batch_seconds:.1f}x, {mismatches} total mismatches)")
+    return {"single": basket_count / single_seconds, "batch": basket_count / batch_seconds,
+            "mismatches": mismatches}
+
+
+def bench_report(catalog_size=1000, sale_count=100000, days=7):
+    """Times generate_report over a week of sales."""
+    with tempfile.TemporaryDirectory() as directory:
+        products = make_products(catalog_size)
+        cashier = load_cashier(products, directory)
+    first = datetime(2024, 1, 1)
+    step = timedelta(days=days) / sale_count
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, basket in enumerate(make_baskets(products, sale_count)):
+            cashier.process_transaction(basket, first + step * i)
+
+    latency = time_call(cashier.generate_report, 20)
+    print(f"report    {sale_count:>7} sales: {latency / 1000:8.2f} ms/report")
+    return latency
+
+
+def bench_journal(record_count=20000):
+    """Measures journal append throughput (including the final sync) for several fsync policies."""
+    policies = {
+        "fsync every record": (1, None),
+        "fsync every 100": (100, None),
+        "fsync every 1000": (1000, None),
+        "fsync every 10 ms": (0, 10),
+        "100 records or 50 ms": (100, 50),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, (sync_every, sync_interval_ms) in policies.items():
+            journal = SalesJournal(os.path.join(directory, f"{label}.journal"), sync_every, sync_interval_ms)
+            count = record_count // 10 if sync_every == 1 else record_count
+            journal.open()
+            start = time.perf_counter()
+            for i in range(count):
+                journal.append(make_sale_record(i))
+            journal.close()
+            results[label] = count / (time.perf_counter() - start)
+            print(f"journal   {label:<22} {results[label]:12,.0f} records/s")
+    return results
+
+
+def bench_catalog_add(catalog_size=100000, adds=200):
+    """Measures the cost of logging one product change against rewriting the whole catalog."""
+    with tempfile.TemporaryDirectory() as directory:
+        cashier = load_cashier(make_products(catalog_size), directory)
+        store = cashier.catalog_store
+        store.compact_after = adds + 1  # Keep compaction out of the per-add measurement
+        start = time.perf_counter()
+        for i in range(adds):
+            product = {"id": f"N{i:06d}", "name": f"New {i}", "type": "Food", "details": "", "price": 9.5}
+            cashier.products.append(product)
+            cashier._index_product(product)
+            cashier._log_product_change(product)
+        logged = (time.perf_counter() - start) / adds
+        log_bytes = os.path.getsize(store.log_file) / adds
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cashier.save_products_to_file()
+        rewrite = time.perf_counter() - start
+        snapshot_bytes = os.path.getsize(cashier.file_name)
+    print(f"catalog   add to {catalog_size} SKUs: {logged * 1000:.3f} ms, {log_bytes:.0f} bytes logged "
+          f"(full rewrite: {rewrite * 1000:.0f} ms, {snapshot_bytes:,} bytes)")
+    return {"add": logged, "rewrite": rewrite}
+
+
+def bench_order_tracking(order_count=1000000, lookups=10000):
+    """Measures find_order latency on a large Order.txt and checks partial IDs do not match."""
+    with working_directory():
+        order_ids = [f"{i:08X}" for i in range(order_count)]
+        with open(Main.ORDER_FILE, "w") as file:
+            file.writelines(f"{order_id} | Customer{i % 997} | B01, P02 | Pending\n"
+                            for i, order_id in enumerate(order_ids))
+
+        start = time.perf_counter()
+        Main.load_order_index()
+        build = time.perf_counter() - start
+
+        rng = random.Random(2)
+        sample = [rng.choice(order_ids) for _ in range(lookups)]
+        start = time.perf_counter()
+        for order_id in sample:
+            assert Main.find_order(order_id).startswith(order_id)
+        latency = (time.perf_counter() - start) / lookups
+        assert Main.find_order(order_ids[-1][:6]) is None
+
+        Main.order_index = OrderIndex(Main.ORDER_INDEX_FILE, Main.ORDER_FILE)
+        start = time.perf_counter()
+        Main.load_order_index()
+        reload = time.perf_counter() - start
+    print(f"tracking  {order_count:>7} orders: {latency * 1e6:8.2f} us/lookup "
+          f"(index build {build:.2f} s, reload {reload:.2f} s)")
+    return latency
+
+
+def bench_login(sizes=(10, 1000, 100000, 1000000), lookups=2000, iterations=1):
+    """Measures account lookup plus password check as the number of accounts grows.
+
+    A single PBKDF2 round is used so the index, not the key derivation, is what gets timed.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            store = AccountStore(os.path.join(directory, f"customers_{size}.txt"), iterations)
+            record = store._hash_password("secret")
+            with open(store.file_name, "w") as file:
+                file.writelines(f"user{i},{record}\n" for i in range(size))
+            store.verify("user0", "secret")  # Initial load
+
+            rng = random.Random(size)
+            names = [f"user{rng.randrange(size)}" for _ in range(lookups)]
+            start = time.perf_counter()
+            for name in names:
+                assert store.verify(name, "secret")
+            results[size] = (time.perf_counter() - start) / lookups * 1e6
+            assert not store.create("user0", "other")
+            print(f"login     {size:>7} accounts: {results[size]:8.2f} us/login")
+    return results
+
+
+def price_by_scanning_rules(cashier, basket, now):
+    """Prices a basket by checking every discount rule for every item, as a table-less engine would."""
+    engine = cashier.discount_engine
+    items = []
+    for pid in basket:
+        product = cashier.get_product(pid)
+        if product is None:
+            continue
+        best = {}
+        for rule in engine.rules.values():
+            if (rule["start"] is not None and now < rule["start"]) or (rule["end"] is not None and now >= rule["end"]):
+                continue
+            if (rule["scope"] == "store" or (rule["scope"] == "category" and rule["target"] == product["type"])
+                    or (rule["scope"] == "product" and rule["target"] == pid)):
+                best[rule["scope"]] = max(best.get(rule["scope"], 0), rule["percent"])
+        if pid in cashier.discounts:
+            best["product"] = max(best.get("product", 0), cashier.discounts[pid])
+        discount = best.get("product", best.get("category", best.get("store")))
+        price = product["price"]
+        if discount is not None:
+            price -= price * (discount / 100)
+        items.append((pid, product["name"], price))
+    items = engine.apply_bundles(items)
+    total = 0
+    for item in items:
+        total += item[2]
+    return total
+
+
+def bench_discount_rules(catalog_size=10000, rule_count=1000, basket_count=20000):
+    """Compares table-based pricing with scanning all rules per item, with 1k active rules."""
+    with tempfile.TemporaryDirectory() as directory:
+        products = make_products(catalog_size)
+        cashier = load_cashier(products, directory)
+    engine = cashier.discount_engine
+    rng = random.Random(4)
+    now = datetime.now()
+    engine.add_rule("store", 5)
+    for i in range(rule_count - 1):
+        kind = i % 4
+        if kind == 0:
+            engine.add_rule("category", rng.randint(1, 30), rng.choice(["Beverage", "Food", "Pastry"]))
+        elif kind == 1:
+            engine.add_rule("product", rng.randint(1, 50), rng.choice(products)["id"],
+                            now - timedelta(days=1), now + timedelta(days=1))
+        elif kind == 2:
+            engine.add_rule("product", rng.randint(1, 50), rng.choice(products)["id"])
+        else:
+            engine.set_bundle(rng.choice(products)["id"], rng.randint(1, 3), 1)
+    baskets = make_baskets(products, basket_count)
+
+    start = time.perf_counter()
+    expected = [price_by_scanning_rules(cashier, basket, now) for basket in baskets]
+    scanning = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cashier._price_table = None  # Include compiling the table in the measurement
+    priced = cashier.price_baskets(baskets)
+    table = time.perf_counter() - start
+
+    mismatches = sum(1 for total, result in zip(expected, priced) if total != result["total"])
+    print(f"discounts {len(engine.rules) + len(engine.bundles)} rules: scanning {basket_count / scanning:10,.0f} baskets/s, "
+          f"table {basket_count / table:10,.0f} baskets/s ({scanning / table:.0f}x, {mismatches} mismatches)")
+    return {"scanning": basket_count / scanning, "table": basket_count / table}
+
+
+def bench_order_store(order_count=1000000, operations=200000):
+    """Loads 1M orders into a logged OrderStore, then runs a mixed status-update/status-query workload."""
+    statuses = ["Pending", "Preparing", "Ready", "Completed"]
+    with tempfile.TemporaryDirectory() as directory:
+        store = OrderStore(os.path.join(directory, "orders.log"))
+        start = time.perf_counter()
+        for first in range(0, order_count, 1000):  # Imported in batches, one fsync each
+            store.add_many((f"{i:08X}", {"status": "Completed" if i < order_count - 1000 else "Pending",
+                                         "items": ["B01", "P02"]})
+                           for i in range(first, min(first + 1000, order_count)))
+        load = time.perf_counter() - start
+
+        rng = random.Random(5)
+        recent = [f"{i:08X}" for i in range(order_count - 1000, order_count)]
+        queried = 0
+        start = time.perf_counter()
+        for _ in range(operations):
+            if rng.random() < 0.8:
+                store.update_status(rng.choice(recent), rng.choice(statuses))
+            else:
+                queried += len(store.with_status(rng.choice(statuses[:3])))
+        mixed = time.perf_counter() - start
+        store.close()
+
+        assert sum(len(ids) for ids in store.by_status.values()) == order_count
+        start = time.perf_counter()
+        reloaded = OrderStore(store.file_name)
+        replay = time.perf_counter() - start
+        assert {s: list(ids) for s, ids in reloaded.by_status.items()} == \
+            {s: list(ids) for s, ids in store.by_status.items()}
+    print(f"orderstore {order_count} orders: {order_count / load:,.0f} batched adds/s, "
+          f"{operations / mixed:,.0f} mixed ops/s (avg {queried / (operations * 0.2):.0f} ids per query), "
+          f"replay {replay:.1f} s")
+    return operations / mixed
+
+
+def bench_inventory(thread_counts=(1, 2, 4, 8, 16), sku_count=1000, baskets_per_thread=20000):
+    """Measures concurrent basket purchase and reservation throughput by thread count."""
+    results = {}
+    for threads in thread_counts:
+        engine = InventoryEngine()
+        skus = [f"X{i:06d}" for i in range(sku_count)]
+        for sku in skus:
+            engine.set_quantity(sku, 200)
+
+        def shopper(worker):
+            rng = random.Random(worker)
+            for i in range(baskets_per_thread):
+                basket = {}
+                for sku in rng.sample(skus, rng.randint(1, 4)):
+                    basket[sku] = rng.randint(1, 3)
+                if i % 10 == 0:
+                    reservation_id = engine.reserve(basket, ttl=0.001 if i % 20 == 0 else None)
+                    if reservation_id is not None and i % 20:  # Every other one is abandoned and times out
+                        engine.commit(reservation_id)
+                else:
+                    engine.purchase(basket)
+
+        workers = [threading.Thread(target=shopper, args=(worker,)) for worker in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        results[threads] = threads * baskets_per_thread / elapsed
+        print(f"inventory {threads:>2} threads: {results[threads]:10,.0f} baskets/s")
+    return results
+
+
+def scan_feedback(lines, words, limit):
+    """Finds the newest reviews containing every word by scanning the whole file, as before."""
+    matches = []
+    for line in reversed(lines):
+        review = line.rstrip("\n").split(",", 2)[2]
+        if all(word in review.split() for word in words):
+            matches.append(review)
+            if len(matches) == limit:
+                break
+    return matches
+
+
+def bench_feedback(review_count=1000000, queries=2000):
+    """Ingests 1M dish reviews, then times keyword search and latest-N lookups against a full scan."""
+    lines = make_feedback_lines(review_count)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "Feedback.txt")
+        with open(file_name, "w") as file:
+            file.writelines(lines)
+        analytics = FeedbackAnalytics()
+        start = time.perf_counter()
+        analytics.ingest_feedback_file(file_name)
+        ingest = time.perf_counter() - start
+
+        # A later review is picked up incrementally without re-reading the rest of the file
+        with open(file_name, "a") as file:
+            file.write("late,X000001,fresh and friendly\n")
+        assert analytics.ingest_feedback_file(file_name) == 1
+        assert analytics.latest_for_dish("X000001", 1)[0]["text"] == "fresh and friendly"
+
+    rng = random.Random(3)
+    vocabulary = ["great", "cold", "sweet", "bitter", "perfect", "slow", "friendly", "creamy", "dry", "fresh"]
+    searches = [rng.sample(vocabulary, rng.randint(1, 3)) for _ in range(queries)]
+    dishes = [f"X{rng.randrange(1000):06d}" for _ in range(queries)]
+    lines.append("late,X000001,fresh and friendly\n")
+
+    for words in searches[:50]:
+        expected = scan_feedback(lines, words, 20)
+        assert [review["text"] for review in analytics.search(" ".join(words))] == expected, words
+    search = time_call(lambda: analytics.search(" ".join(rng.choice(searches))), queries)
+    latest = time_call(lambda: analytics.latest_for_dish(rng.choice(dishes), 5), queries)
+    scan = time_call(lambda: scan_feedback(lines, rng.choice(searches), 20), 20)
+
+    # A seasonal word used only in the newest reviews, none of which says "great": nothing matches both
+    for i in range(review_count // 20):
+        analytics.add_review("pumpkin spice", f"X{i % 1000:06d}", f"user{i % 5000}")
+    assert analytics.search("pumpkin great") == []
+    empty = time_call(lambda: analytics.search("pumpkin great"), queries)
+    print(f"feedback {review_count} reviews: ingest {review_count / ingest:,.0f} reviews/s, "
+          f"search {search:.1f} us (scan {scan:.1f} us), no match {empty:.1f} us, "
+          f"latest 5 for a dish {latest:.1f} us")
+    return search
+
+
+def bench_concurrent_orders(processes=8, orders_per_process=5000):
+    """Measures order placement throughput with several processes writing at once."""
+    with working_directory() as directory:
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=place_orders, args=(directory, worker, orders_per_process))
+                   for worker in range(processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+    total = processes * orders_per_process
+    print(f"orders    {processes} processes: {total / elapsed:12,.0f} orders/s, {total} written")
+    return total / elapsed
+
+
+# Suite: times every hot path at several data sizes and stores the results as JSON
+@contextlib.contextmanager
+def scripted_input(*answers):
+    """Answers input() prompts from a fixed cycle so interactive functions can be timed."""
+    replies = itertools.cycle(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(replies)
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def measure(func, min_time=0.2, max_repeat=100000):
+    """Calls func until min_time has passed and returns the mean seconds per call."""
+    repeat = 0
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        start = time.perf_counter()
+        while True:
+            func()
+            repeat += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or repeat >= max_repeat:
+                return elapsed / repeat
+
+
+def suite_cashier(size, directory):
+    """Times the cashier operations against a catalog and sales history of the given size."""
+    products = make_products(size)
+    cashier = load_cashier(products, directory)
+    for product in products[::10]:
+        cashier.set_discount(product["id"], 10)
+    for basket, timestamp in make_sales(products, size):
+        cashier.record_transaction(basket, timestamp)
+
+    basket = ",".join(product["id"] for product in random.Random(size).choices(products, k=5))
+    with scripted_input(basket):
+        complete_transaction = measure(cashier.complete_transaction)
+    return {
+        "complete_transaction": complete_transaction,
+        "generate_report": measure(cashier.generate_report),
+        "view_active_discounts": measure(cashier.view_active_discounts),
+    }
+
+
+def suite_customer(size):
+    """Times the customer functions in Main against files holding the given number of records."""
+    results = {}
+    with working_directory():
+        Main.accounts = AccountStore(Main.CUSTOMER_FILE, iterations=1)  # Time the lookup, not the KDF
+        with open(Main.CUSTOMER_FILE, "w") as file:
+            file.writelines(make_customer_lines(size, Main.accounts._hash_password("secret")))
+        with scripted_input(f"user{size // 2}", "secret"):
+            results["login"] = measure(Main.login)
+
+        with open(Main.ORDER_FILE, "w") as file:
+            file.writelines(make_order_lines(size))
+        with scripted_input(f"{size // 2:08X}"):
+            results["order_tracking"] = measure(Main.order_tracking)
+
+        with open(Main.PRODUCT_FILE, "w") as file:
+            json.dump(make_products(size), file)
+        results["product_browsing"] = measure(Main.product_browsing)
+    return results
+
+
+def suite_manager(size):
+    """Times credential checks with the given number of manager users."""
+    manager = Manager()
+    record = manager._hash_password("secret")
+    manager.users = {f"user{i}": record for i in range(size)}
+    return {"verify_credentials": measure(lambda: manager.verify_credentials(f"user{size // 2}", "secret"))}
+
+
+def run_suite(sizes):
+    """Runs every suite operation at every size and returns {operation: {size: seconds per call}}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            timings = {}
+            timings.update(suite_cashier(size, directory))
+            timings.update(suite_customer(size))
+            timings.update(suite_manager(size))
+            for operation, seconds in timings.items():
+                results.setdefault(operation, {})[str(size)] = seconds
+                print(f"{operation:<22} {size:>8}: {seconds * 1e6:12.2f} us")
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """Returns the (operation, size, ratio) entries that got slower than threshold x the baseline."""
+    regressions = []
+    for operation, timings in results.items():
+        for size, seconds in timings.items():
+            previous = baseline.get(operation, {}).get(size)
+            if previous and seconds / previous > threshold:
+                regressions.append((operation, size, seconds / previous))
+    return regressions
+
+
+def bench_ledger(entry_count=1000000, queries=10000, posts=20000, days=730):
+    """Reloads a 1M-entry ledger log and times range profitability queries against a full scan."""
+    rng = random.Random(11)
+    first = datetime(2024, 1, 1)
+    entries = []
+    for i in range(entry_count):
+        timestamp = first + timedelta(seconds=i * days * 86400 // entry_count)
+        entries.append((timestamp, "expense" if i % 4 == 0 else "income", rng.randint(100, 5000)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "Ledger.log")
+        with open(file_name, "w") as file:
+            file.writelines(f"{t.isoformat()}\t{kind}\t{cents}\tsale\n" for t, kind, cents in entries)
+        start = time.perf_counter()
+        ledger = Ledger(file_name)
+        reload = time.perf_counter() - start
+
+        appended = Ledger(os.path.join(directory, "Posted.log"))
+        start = time.perf_counter()
+        for i in range(posts):
+            appended.post("income", 250, first + timedelta(seconds=i))
+        post = (time.perf_counter() - start) / posts * 1e6
+        appended.close()
+
+    windows = []
+    for _ in range(queries):
+        window_start = first + timedelta(seconds=rng.randrange(days * 86400))
+        windows.append((window_start, window_start + timedelta(seconds=rng.randrange(1, 90 * 86400))))
+
+    def scan(window_start, window_end):
+        totals = {"income": 0, "expense": 0}
+        for timestamp, kind, cents in entries:
+            if window_start <= timestamp < window_end:
+                totals[kind] += cents
+        return totals
+
+    for window in windows[:5]:
+        assert ledger.totals_between(*window) == scan(*window), window
+    query = time_call(lambda: ledger.totals_between(*rng.choice(windows)), queries)
+    full_scan = time_call(lambda: scan(*rng.choice(windows)), 3)
+    print(f"ledger {entry_count} entries: reload {reload:.1f} s, post {post:.1f} us, "
+          f"window query {query:.1f} us (scan {full_scan / 1000:.0f} ms)")
+    return query
+
+
+def bench_storage(record_count=100000, lookups=5000, changes=200, threads=8):
+    """Compares the flat files with the SQLite backend for bulk loads, single writes and lookups."""
+    products = make_products(record_count)
+    rng = random.Random(17)
+    rows = {}
+
+    with working_directory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, "coffeehouse.db"))
+        record = AccountStore(Main.CUSTOMER_FILE, iterations=1)._hash_password("secret")
+
+        # Bulk loads: write a whole catalog, order history and account list
+        start = time.perf_counter()
+        CatalogStore(Main.PRODUCT_FILE).compact(products)
+        with open(Main.ORDER_FILE, "w") as file:
+            file.writelines(make_order_lines(record_count))
+        with open(Main.CUSTOMER_FILE, "w") as file:
+            file.writelines(make_customer_lines(record_count, record))
+        Main.load_order_index()
+        flat = time.perf_counter() - start
+        start = time.perf_counter()
+        storage.catalog_store(Main.PRODUCT_FILE).compact(products)
+        storage.customer_orders().add_many(tuple(line.rstrip("\n").split(" | "))
+                                           for line in make_order_lines(record_count))
+        storage.account_store().bulk_load((f"user{i}", record) for i in range(record_count))
+        rows["bulk load"] = (flat, time.perf_counter() - start, "s")
+
+        # Catalog: full load, then one logged change at a time
+        flat_store, sqlite_store = CatalogStore(Main.PRODUCT_FILE), storage.catalog_store(Main.PRODUCT_FILE)
+        rows["catalog load"] = (time_call(flat_store.load, 3) / 1e6, time_call(sqlite_store.load, 3) / 1e6, "s")
+        flat_store.compact_after = changes + 1
+        rows["product change"] = tuple(
+            time_call(lambda: store.record_put(dict(rng.choice(products), price=9.5), products), changes)
+            for store in (flat_store, sqlite_store)) + ("us",)
+
+        # Orders: place one, find one
+        order_ids = [f"{i:08X}" for i in range(record_count)]
+        flat_place = time_call(lambda: Main.place_order("Bench", ["B01", "P02"]), changes)
+        Main.order_writer.flush()
+        flat_find = time_call(lambda: Main.find_order(rng.choice(order_ids)), lookups)
+        Main.customer_orders = storage.customer_orders()
+        rows["place order"] = (flat_place, time_call(lambda: Main.place_order("Bench", ["B01", "P02"]), changes), "us")
+        rows["find order"] = (flat_find, time_call(lambda: Main.find_order(rng.choice(order_ids)), lookups), "us")
+        assert Main.find_order(order_ids[7]).startswith(order_ids[7])
+
+        # Accounts: one PBKDF2 round, so the lookup is what gets timed
+        flat_accounts, sqlite_accounts = AccountStore(Main.CUSTOMER_FILE, 1), storage.account_store()
+        flat_accounts.verify("user0", "secret")  # Initial load
+        rows["login"] = tuple(
+            time_call(lambda: accounts.verify(f"user{rng.randrange(record_count)}", "secret"), lookups)
+            for accounts in (flat_accounts, sqlite_accounts)) + ("us",)
+
+        # Concurrent lookups through the connection pool
+        def finder(count):
+            for i in range(count):
+                assert storage.customer_orders().find(order_ids[(i * 7919) % record_count])
+        workers = [threading.Thread(target=finder, args=(lookups,)) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        pooled = threads * lookups / (time.perf_counter() - start)
+        storage.close()
+
+    print(f"storage {record_count} records     flat files      sqlite")
+    for name, (flat, sqlite, unit) in rows.items():
+        print(f"  {name:<16} {flat:12.2f} {unit:<2} {sqlite:9.2f} {unit}")
+    print(f"  {threads} threads finding orders through the pool: {pooled:,.0f} lookups/s")
+    return rows
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux reports kilobytes
+
+
+def _export_journal(journal_file, base_name, fmt, compress, streaming):
+    """Worker process for bench_export: exports a journal and reports its time and peak memory."""
+    before = _peak_rss_mb()
+    start = time.perf_counter()
+    if streaming:
+        count = export_sales(SalesJournal(journal_file).records(), base_name, {"B01": "Americano"}, fmt, compress)[0]
+    else:
+        # Old style: gather the whole report in memory and write it as one string
+        rows = list(sale_rows(SalesJournal(journal_file).replay()))
+        with open(f"{base_name}_sales.{fmt}", "w") as file:
+            file.write("\n".join(",".join(str(value) for value in row.values()) for row in rows) + "\n")
+        count = len(rows)
+    return count, time.perf_counter() - start, before, _peak_rss_mb()
+
+
+def bench_export(sizes=(100000, 1000000)):
+    """Streams journal exports of growing size in fresh processes, checking peak memory stays flat."""
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            journal_file = os.path.join(directory, f"sales_{size}.journal")
+            with open(journal_file, "wb") as file:
+                for i in range(size):
+                    payload = json.dumps(make_sale_record(i), separators=(",", ":")).encode()
+                    file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+
+            for fmt, compress, streaming in (("csv", False, True), ("jsonl", True, True), ("csv", False, False)):
+                with context.Pool(1) as pool:  # A fresh process per run, so peak memory is this run's alone
+                    count, elapsed, before, peak = pool.apply(
+                        _export_journal, (journal_file, os.path.join(directory, "export"), fmt, compress, streaming))
+                assert count == size
+                label = f"{fmt}{'.gz' if compress else ''}{'' if streaming else ' (in memory)'}"
+                results[(size, label)] = count / elapsed
+                print(f"export {size:>8} sales to {label:<18}: {count / elapsed:10,.0f} sales/s, "
+                      f"peak RSS {peak:6.1f} MB ({peak - before:+.1f} MB during the export)")
+    return results
+
+
+def bench_sales_memory(catalog_size=1000, sale_count=200000):
+    """Measures bytes per logged sale with tracemalloc: per-sale dicts against the SalesHistory columns."""
+    products = make_products(catalog_size)
+    prices = {product["id"]: product["price"] for product in products}
+    baskets = make_baskets(products, sale_count)
+    first = datetime(2024, 1, 1)
+    sales = [(basket, [prices[pid] for pid in basket], first + timedelta(seconds=i))
+             for i, basket in enumerate(baskets)]
+
+    def as_dicts():
+        return [{"products": list(basket), "total": sum(basket_prices), "timestamp": timestamp}
+                for basket, basket_prices, timestamp in sales]
+
+    def as_columns():
+        history = SalesHistory()
+        for basket, basket_prices, timestamp in sales:
+            history.append(basket, basket_prices, sum(basket_prices), timestamp)
+        return history
+
+    results = {}
+    for label, build in (("dicts", as_dicts), ("columns", as_columns)):
+        tracemalloc.start()
+        kept = build()
+        results[label] = tracemalloc.get_traced_memory()[0] / sale_count
+        tracemalloc.stop()
+        del kept
+
+    history = as_columns()
+    assert history[5]["products"] == baskets[5] and len(history) == sale_count
+    window = (first + timedelta(seconds=sale_count // 3), first + timedelta(seconds=sale_count // 2))
+    scan = time_call(lambda: history.summary(*window), 5)
+    print(f"sales memory {sale_count} sales: {results['dicts']:.0f} bytes/sale as dicts, "
+          f"{results['columns']:.0f} bytes/sale as columns ({results['dicts'] / results['columns']:.1f}x smaller); "
+          f"column summary of {sale_count // 6} sales {scan / 1000:.1f} ms")
+    return results
+
+
+def bench_catalog_startup(catalog_size=100000, repeat=5):
+    """Times CashierSystem startup at 100k SKUs: the old JSON parse against cold and warm binary snapshots."""
+    products = make_products(catalog_size)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "products.json")
+        with open(file_name, "w") as file:
+            json.dump(products, file, indent=4)
+
+        def parse_json():
+            with open(file_name) as file:
+                catalog = json.load(file)
+            return {product["id"]: product for product in catalog}
+
+        def start(cold):
+            if cold and os.path.exists(file_name + ".snap"):
+                os.remove(file_name + ".snap")
+            with contextlib.redirect_stdout(io.StringIO()):
+                return CashierSystem(file_name)
+
+        results = {"json": min(measure(parse_json, 0) for _ in range(repeat)),
+                   "cold": min(measure(lambda: start(True), 0) for _ in range(repeat)),
+                   "warm": min(measure(lambda: start(False), 0) for _ in range(repeat))}
+
+        cashier = start(False)
+        basket = [products[i]["id"] for i in (0, catalog_size // 2, catalog_size - 1)]
+        first_sale = time_call(lambda: cashier.price_basket(basket), 1)
+        assert cashier.price_basket(basket)["total"] == sum(products[i]["price"] for i in (0, catalog_size // 2,
+                                                                                          catalog_size - 1))
+        assert [product["id"] for product in cashier.products] == [product["id"] for product in products]
+    print(f"catalog startup {catalog_size} SKUs: json.load {results['json'] * 1000:.0f} ms, "
+          f"cold snapshot {results['cold'] * 1000:.0f} ms, warm snapshot {results['warm'] * 1000:.1f} ms "
+          f"({results['json'] / results['warm']:.0f}x faster); first basket {first_sale / 1000:.2f} ms")
+    return results
+
+
+def bench_carts(sessions=10000, threads=8, operations_per_thread=100000, line_bound=20000):
+    """Runs many sessions' carts from several threads and checks isolation, quantities, LRU and TTL eviction."""
+    carts = CartStore(max_lines=sessions * 10)
+    items = [f"X{i:04d}" for i in range(200)]
+    expected = [dict() for _ in range(sessions)]  # Every session belongs to one thread, which tracks it here
+    checkouts = [0] * threads
+
+    def shopper(worker):
+        rng = random.Random(worker)
+        mine = range(worker, sessions, threads)
+        for _ in range(operations_per_thread):
+            session = rng.choice(mine)
+            cart = expected[session]
+            roll = rng.random()
+            if roll < 0.6:
+                item, quantity = rng.choice(items), rng.randint(1, 3)
+                carts.add(session, item, quantity)
+                cart[item] = cart.get(item, 0) + quantity
+            elif roll < 0.8 and cart:
+                item = rng.choice(list(cart))
+                carts.remove(session, item, 1)
+                cart[item] -= 1
+                if not cart[item]:
+                    del cart[item]
+            elif roll < 0.9 and cart:
+                item = rng.choice(list(cart))
+                carts.set_quantity(session, item, 5)
+                cart[item] = 5
+            elif roll >= 0.9:
+                assert carts.take(session) == cart, session  # Checkout sees exactly this session's cart
+                cart.clear()
+                checkouts[worker] += 1
+
+    workers = [threading.Thread(target=shopper, args=(worker,)) for worker in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    for session in range(sessions):
+        assert carts.get(session) == expected[session], session
+    assert carts.lines == sum(len(cart) for cart in expected)
+
+    # Add/remove cost against cart size
+    latency = {}
+    for size in (10, 10000):
+        store = CartStore()
+        for i in range(size):
+            store.add("big", f"Y{i:05d}")
+        latency[size] = time_call(lambda: (store.add("big", "Z"), store.remove("big", "Z")), 20000) / 2
+
+    # The line bound evicts the least recently used carts; idle carts expire
+    bounded = CartStore(max_lines=line_bound)
+    for session in range(line_bound):
+        bounded.add(session, "A")
+        bounded.add(session, "B")
+    assert bounded.lines <= line_bound and bounded.get(line_bound - 1) and not bounded.get(0)
+    idle = CartStore(ttl=0.05)
+    idle.add("old", "A")
+    time.sleep(0.06)
+    idle.add("new", "A")
+    assert not idle.get("old") and idle.get("new") == {"A": 1} and idle.lines == 1
+
+    total = threads * operations_per_thread
+    print(f"carts {sessions} sessions, {threads} threads: {total / elapsed:,.0f} ops/s, "
+          f"{sum(checkouts)} checkouts saw only their own cart; add+remove {latency[10]:.2f} us at 10 lines, "
+          f"{latency[10000]:.2f} us at 10k lines; LRU bound and TTL expiry hold")
+    return {"ops_per_sec": total / elapsed, **{f"us_{size}": value for size, value in latency.items()}}
+
+
+def bench_metrics(catalog_size=1000, calls=20000, rounds=7):
+    """Times instrumented operations with metrics off and on, interleaving rounds to cancel out drift.
+
+    While off the registered functions are the originals, so disabled metrics
+    add nothing to the call path; the off rounds assert exactly that.
+    """
+    original = vars(CashierSystem)["price_baskets"]
+    with tempfile.TemporaryDirectory() as directory:
+        cashier = load_cashier(make_products(catalog_size), directory)
+        baskets = [[basket] for basket in make_baskets(cashier.products, 100)]
+        cashier.price_baskets(baskets[0])  # Build the price table outside the timed loops
+        operations = {"price_baskets": lambda: [cashier.price_baskets(basket) for basket in baskets],
+                      "record_transaction": lambda: [cashier.record_transaction(basket[0]) for basket in baskets]}
+
+        results = {}
+        for _ in range(rounds):
+            for state in ("off", "enabled"):
+                if state == "enabled":
+                    Metrics.enable()
+                else:
+                    Metrics.disable()
+                    assert CashierSystem.price_baskets is original  # Nothing left in the call path
+                for operation, func in operations.items():
+                    per_call = time_call(func, calls // len(baskets)) / len(baskets) * 1000  # ns per call
+                    results[(operation, state)] = min(results.get((operation, state), per_call), per_call)
+        Metrics.disable()
+
+        histogram = Metrics.registry.histograms["CashierSystem.record_transaction"]
+        assert histogram.count == rounds * (calls // len(baskets)) * len(baskets)
+        file_name = os.path.join(directory, "metrics.prom")
+        Metrics.registry.write_prometheus(file_name)
+        with open(file_name) as file:
+            exported = file.read()
+        assert 'coffeehouse_operation_seconds_count{operation="CashierSystem.record_transaction"}' in exported
+        Metrics.registry.reset()
+
+    # Quantiles from the log-linear buckets stay within their 1/64 relative error
+    histogram = Metrics.LatencyHistogram()
+    values = list(range(1, 1000001, 7))
+    for value in values:
+        histogram.record(value)
+    for q in Metrics.QUANTILES:
+        exact = values[math.ceil(len(values) * q) - 1]
+        assert abs(histogram.quantile(q) - exact) <= exact / 64, q
+
+    for operation in operations:
+        off, on = results[(operation, "off")], results[(operation, "enabled")]
+        print(f"metrics {operation:<18}: {off:8.0f} ns/call off (original function, nothing wrapped), "
+              f"{on:8.0f} ns/call enabled ({on - off:+.0f} ns)")
+    return results
+
+def make_named_products(count, seed=0):
+    """Builds a catalog with varied, realistic-looking names for search benchmarks."""
+    rng = random.Random(seed)
+    flavors = ["Vanilla", "Caramel", "Hazelnut", "Matcha", "Mocha", "Salted", "Honey", "Cinnamon", "Pandan",
+               "Coconut", "Strawberry", "Blueberry", "Chocolate", "Almond", "Pistachio", "Lemon", "Ginger",
+               "Butterscotch", "Maple", "Raspberry"]
+    items = {"Beverage": ["Latte", "Cappuccino", "Americano", "Macchiato", "Frappe", "Espresso", "Tea", "Smoothie"],
+             "Food": ["Sandwich", "Bagel", "Wrap", "Salad", "Pasta", "Panini", "Quiche", "Toastie"],
+             "Pastry": ["Croissant", "Muffin", "Danish", "Scone", "Brownie", "Cheesecake", "Tart", "Waffle"]}
+    details = ["Hot/Cold", "Iced", "Oat milk", "Large", "Gluten free", "Vegan", "Seasonal", "Extra shot"]
+    syllables = ["ka", "lo", "mi", "ra", "te", "su", "no", "vi", "ba", "de", "zu", "po", "ri", "sa", "mo",
+                 "ne", "ta", "gu", "fe", "lu"]
+    products = []
+    for i in range(count):
+        type_ = rng.choice(list(items))
+        origin = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).capitalize()
+        products.append({"id": f"S{i:06d}", "name": f"{rng.choice(flavors)} {rng.choice(items[type_])} {origin}",
+                         "type": type_, "details": rng.choice(details), "price": round(rng.uniform(5, 25), 2)})
+    return products
+
+
+def bench_search(catalog_size=100000, queries=300, limit=10, adds=1000):
+    """Times per-keystroke type-ahead queries on a 100k catalog, then incremental adds through the cashier."""
+    products = make_named_products(catalog_size)
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        cashier = load_cashier(products, directory)
+        start = time.perf_counter()
+        index = cashier.search_index
+        build = time.perf_counter() - start
+
+        # Type product names one key at a time, some with a dropped or swapped letter
+        typed = []
+        for _ in range(queries):
+            name = rng.choice(products)["name"].lower()
+            if rng.random() < 0.3:
+                position = rng.randrange(1, len(name) - 1)
+                name = name[:position] + name[position + 1:]
+            typed.extend(name[:length] for length in range(1, len(name) + 1))
+        latencies = []
+        for query in typed:
+            begin = time.perf_counter()
+            index.search(query, limit)
+            latencies.append(time.perf_counter() - begin)
+        latencies.sort()
+
+        # Whole names should find their product first (ties between identical names aside)
+        for product in rng.sample(products, 100):
+            assert cashier.search_products(product["name"])[0]["name"] == product["name"]
+        assert cashier.search_products("capucino")[0]["name"].split()[1] == "Cappuccino"
+
+        # New products become searchable as soon as they are added
+        start = time.perf_counter()
+        for i in range(adds):
+            product = {"id": f"N{i:05d}", "name": f"Zesty Yuzu Cooler {i}", "type": "Beverage", "details": "Iced",
+                       "price": 9.0}
+            cashier.products.append(product)
+            cashier._index_product(product)
+        add = (time.perf_counter() - start) / adds
+        assert cashier.search_products("zesty yu", 3)[0]["name"].startswith("Zesty Yuzu")
+        cashier.remove_product("N00000")
+        assert all(product["id"] != "N00000" for product in cashier.search_products("zesty yuzu cooler 0", 5))
+
+    mean = sum(latencies) / len(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"search {catalog_size} products: index built in {build:.1f} s; {len(typed)} keystroke queries "
+          f"mean {mean * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms, max {latencies[-1] * 1000:.2f} ms; "
+          f"add {add * 1e6:.0f} us/product")
+    return {"build": build, "mean": mean, "p99": p99, "add": add}
+
+
+SCENARIOS = {
+    "checkout": bench_checkout,
+    "batch_pricing": bench_batch_pricing,
+    "report": bench_report,
+    "journal": bench_journal,
+    "catalog_add": bench_catalog_add,
+    "order_tracking": bench_order_tracking,
+    "login": bench_login,
+    "concurrent_orders": bench_concurrent_orders,
+    "discount_rules": bench_discount_rules,
+    "order_store": bench_order_store,
+    "inventory": bench_inventory,
+    "feedback": bench_feedback,
+    "ledger": bench_ledger,
+    "storage": bench_storage,
+    "export": bench_export,
+    "sales_memory": bench_sales_memory,
+    "catalog_startup": bench_catalog_startup,
+    "carts": bench_carts,
+    "metrics": bench_metrics,
+    "search": bench_search,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coffee house benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    suite = commands.add_parser("suite", help="time every hot path at several data sizes")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000],
+                       help="record counts to generate (up to 1000000)")
+    suite.add_argument("--output", help="write the results to this JSON file")
+    suite.add_argument("--compare", help="baseline JSON file from an earlier run")
+    suite.add_argument("--threshold", type=float, default=1.25,
+                       help="fail when an operation is this many times slower than the baseline")
+
+    scenarios = commands.add_parser("scenarios", help="run the focused benchmarks")
+    scenarios.add_argument("names", nargs="*", help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+
+    args = parser.parse_args()
+
+    if args.command == "scenarios":
+        unknown = [name for name in args.names if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+        for name in args.names or SCENARIOS:
+            SCENARIOS[name]()
+        return
+
+    results = run_suite(args.sizes)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"timestamp": datetime.now().isoformat(timespec="seconds"),
+                       "python": platform.python_version(),
+                       "sizes": args.sizes,
+                       "results": results}, file, indent=4)
+        print(f"Results saved to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_results(results, baseline, args.threshold)
+        for operation, size, ratio in regressions:
+            print(f"REGRESSION: {operation} at {size} records is {ratio:.2f}x slower than the baseline")
+        if regressions:
+            sys.exit(1)
+        print(f"No operation is more than {args.threshold:.2f}x slower than the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import secrets
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class CartStore:
+    def __init__(self, ttl=1800, max_lines=1000000):
+        self.ttl = ttl  # Seconds a cart may sit idle before it is dropped
+        self.max_lines = max_lines  # Item lines kept across all carts; least recently used carts go first
+        self.lines = 0  # Item lines currently held across all carts
+        self._carts = OrderedDict()  # Session ID -> [{item: quantity}, last used], least recently used first
+        self._lock = threading.Lock()  # Guards the carts, their LRU order and the line count
+
+    def new_session(self):
+        """Returns a fresh session ID for a customer's cart."""
+        return secrets.token_hex(8)
+
+    def _touch(self, session, create=False):
+        """Returns a session's cart, marking it most recently used; the caller must hold the lock.
+
+        Carts idle for longer than the TTL are dropped first. They sit at the
+        front of the LRU order, so this costs nothing when none are due.
+        """
+        now = time.monotonic()
+        carts = self._carts
+        while carts:
+            oldest = next(iter(carts.values()))
+            if oldest[1] + self.ttl > now:
+                break
+            self.lines -= len(carts.popitem(last=False)[1][0])
+
+        entry = carts.get(session)
+        if entry is None:
+            if not create:
+                return None
+            entry = carts[session] = [{}, now]
+        else:
+            entry[1] = now
+            carts.move_to_end(session)
+        return entry[0]
+
+    def _evict(self, session):
+        """Drops least recently used carts until the line bound holds; the caller must hold the lock."""
+        carts = self._carts
+        while self.lines > self.max_lines and len(carts) > 1:
+            victim = next(iter(carts))
+            if victim == session:
+                break  # Only the caller's own cart is left to give up
+            self.lines -= len(carts.pop(victim)[0])
+
+    def add(self, session, item, quantity=1):
+        """Adds units of an item to a session's cart and returns the item's new quantity."""
+        if quantity < 1:
+            raise ValueError("Quantity must be at least 1.")
+        with self._lock:
+            cart = self._touch(session, create=True)
+            if item not in cart:
+                self.lines += 1
+            cart[item] = cart.get(item, 0) + quantity
+            self._evict(session)
+            return cart[item]
+
+    def set_quantity(self, session, item, quantity):
+        """Sets an item's quantity in a session's cart; 0 removes it. Returns False if the item is not in the cart."""
+        if quantity < 0:
+            raise ValueError("Quantity cannot be negative.")
+        if quantity == 0:
+            return self.remove(session, item) is not None
+        with self._lock:
+            cart = self._touch(session)
+            if cart is None or item not in cart:
+                return False
+            cart[item] = quantity
+            return True
+
+    def remove(self, session, item, quantity=None):
+        """Removes units of an item (all of them by default) and returns how many are left.
+
+        Returns None if the item is not in the cart.
+        """
+        with self._lock:
+            cart = self._touch(session)
+            if cart is None or item not in cart:
+                return None
+            left = 0 if quantity is None else max(cart[item] - quantity, 0)
+            if left:
+                cart[item] = left
+                return left
+            del cart[item]
+            self.lines -= 1
+            if not cart:
+                del self._carts[session]
+            return 0
+
+    def get(self, session):
+        """Returns a copy of a session's cart as {item: quantity}."""
+        with self._lock:
+            cart = self._touch(session)
+            return dict(cart) if cart else {}
+
+    def take(self, session):
+        """Removes and returns a session's whole cart, e.g. to check it out."""
+        with self._lock:
+            if self._touch(session) is None:
+                return {}
+            cart = self._carts.pop(session)[0]
+            self.lines -= len(cart)
+            return cart
+
+    def restore(self, session, cart):
+        """Puts a taken cart back, merged with anything added since, e.g. after a failed checkout."""
+        for item, quantity in cart.items():
+            self.add(session, item, quantity)
+
+    def __len__(self):
+        return len(self._carts)
@@ -1,21 +1,62 @@
 import json
+import threading
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from CatalogSnapshot import LazyProducts
+from CatalogStore import CatalogStore
+from Discounts import DiscountEngine
+from Ledger import to_cents
+from Metrics import enable_from_env, instrument
+from ProductSearch import ProductSearchIndex
+from SalesExport import FORMATS, export_file_name, export_sales
+from SalesHistory import SalesHistory
+from Storage import PRODUCT_FILE, open_storage
 
 class CashierSystem:
-    def __init__(self, file_name):
+    def __init__(self, file_name, journal=None, inventory=None, ledger=None, storage=None):
         self.file_name = file_name  # Store the JSON file name
+        self.journal = journal  # Optional SalesJournal that makes completed sales durable
+        self.inventory = inventory  # Optional InventoryEngine that sales take stock from
+        self.ledger = ledger  # Optional Ledger that completed sales are posted to as income
+        # Snapshot plus change log behind the catalog, or the storage backend's catalog table
+        self.catalog_store = storage.catalog_store(file_name) if storage is not None else CatalogStore(file_name)
         self.products = []  # List to store product catalog
+        self.product_index = {}  # Dictionary to look up products by ID
+        self._type_index = None  # Products grouped by type, built on first use
+        self._search_index = None  # Type-ahead index over names, types and details, once built
+        self._search_builder = None  # Thread building the search index in the background, if one was started
+        self._search_changes = None  # (ID, product or None) changes made while it runs, applied when it is done
+        self._search_lock = threading.Lock()  # Guards the index and the pending changes
         self.discounts = {}  # Dictionary to store discounts by product ID
-        self.sales = []  # List to store completed transactions
+        self.discount_engine = DiscountEngine()  # Store-wide, category, time-windowed and bundle rules
+        self.sales = SalesHistory()  # Completed transactions in compact columns
+        self._price_table = None  # Cached effective prices, rebuilt after catalog or discount changes
+        self._price_version = None  # Discount engine version the cached table was built from
+        self._price_valid_until = None  # Next time a discount window opens or closes
+
+        # Running sales aggregates, updated as each sale is logged
+        self.total_revenue = 0
+        self.units_sold = {}  # Units sold by product ID
+        self.product_revenue = {}  # Revenue by product ID
+        self.hourly_sales = {}  # Sales buckets keyed by the start of each hour
+        self.daily_sales = {}  # Sales buckets keyed by date
 
         # Preloading products from the JSON file
         self.load_products_from_file()
 
+        # Recover the sales logged before the last exit or crash
+        if self.journal is not None:
+            self.replay_sales()
+            self.journal.open()
+
     def load_products_from_file(self):
         """Loads the product list from the JSON file."""
         try:
-            with open(self.file_name, 'r') as file:
-                self.products = json.load(file)
-                print(f"Products successfully loaded from '{self.file_name}'.")
+            self.products = self.catalog_store.load()
+            self._rebuild_indexes()
+            print(f"Products successfully loaded from '{self.file_name}'.")
         except FileNotFoundError:
             print(f"Error: '{self.file_name}' file not found.")
         except json.JSONDecodeError:
@@ -23,22 +64,121 @@ class CashierSystem:
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
 
+    def _rebuild_indexes(self):
+        """Rebuilds the ID index from the product list; the type index is rebuilt on first use."""
+        if isinstance(self.products, LazyProducts):
+            self.product_index = self.products  # The snapshot finds and decodes products by ID on demand
+        else:
+            self.product_index = {product['id']: product for product in self.products}
+        self._type_index = None
+        with self._search_lock:
+            self._search_index = None
+            self._search_changes = None  # A build still running for the old catalog is discarded
+        self._price_table = None
+
+    @property
+    def type_index(self):
+        """Products grouped by type, built on first use so startup does not decode every product."""
+        if self._type_index is None:
+            self._type_index = {}
+            for product in self.products:
+                self._type_index.setdefault(product['type'], []).append(product)
+        return self._type_index
+
+    def start_search_index(self):
+        """Builds the search index in a background thread, so neither a search nor a typo at the till waits for it."""
+        with self._search_lock:
+            if self._search_index is not None or self._search_changes is not None:
+                return
+            changes = self._search_changes = []
+        self._search_builder = threading.Thread(target=self._build_search_index, args=(changes,), daemon=True)
+        self._search_builder.start()
+
+    def _build_search_index(self, changes):
+        index = ProductSearchIndex(list(self.products))
+        with self._search_lock:
+            if self._search_changes is not changes:
+                return  # The catalog was reloaded while this build ran
+            for product_id, product in changes:
+                if product is None:
+                    index.remove(product_id)
+                else:
+                    index.add(product)
+            self._search_index, self._search_changes = index, None
+
+    @property
+    def search_ready(self):
+        """True once the search index can answer without building anything."""
+        return self._search_index is not None
+
+    @property
+    def search_index(self):
+        """Type-ahead search index over the catalog; waits for a background build, or builds it now if none ran."""
+        if self._search_builder is not None:
+            self._search_builder.join()
+        with self._search_lock:
+            if self._search_index is None:
+                self._search_index = ProductSearchIndex(self.products)
+            return self._search_index
+
+    def _index_product(self, product):
+        """Adds a single product to the ID and type indexes."""
+        if self.product_index is not self.products:
+            self.product_index[product['id']] = product
+        if self._type_index is not None:
+            self._type_index.setdefault(product['type'], []).append(product)
+        with self._search_lock:
+            if self._search_index is not None:
+                self._search_index.add(product)
+            elif self._search_changes is not None:
+                self._search_changes.append((product['id'], product))
+        self._price_table = None
+
+    def _unindex_product(self, product):
+        """Removes a single product from the ID and type indexes."""
+        if self.product_index is not self.products:
+            del self.product_index[product['id']]
+        if self._type_index is not None:
+            same_type = self._type_index.get(product['type'], [])
+            same_type.remove(product)
+            if not same_type:
+                self._type_index.pop(product['type'], None)
+        with self._search_lock:
+            if self._search_index is not None:
+                self._search_index.remove(product['id'])
+            elif self._search_changes is not None:
+                self._search_changes.append((product['id'], None))
+        self._price_table = None
+
+    def get_product(self, product_id):
+        """Returns the product with the given ID, or None if it does not exist."""
+        return self.product_index.get(product_id)
+
     def save_products_to_file(self):
-        """Saves the current product list to the JSON file."""
+        """Atomically rewrites the JSON file with the full product list and clears the change log."""
         try:
-            with open(self.file_name, 'w') as file:
-                json.dump(self.products, file, indent=4)
-                print(f"Products successfully saved to '{self.file_name}'.")
+            self.catalog_store.compact(self.products)
+            print(f"Products successfully saved to '{self.file_name}'.")
         except Exception as e:
             print(f"Error saving products to file: {e}")
 
+    def _log_product_change(self, product=None, removed_id=None):
+        """Appends a single catalog change to the change log instead of rewriting the catalog."""
+        try:
+            if removed_id is not None:
+                self.catalog_store.record_remove(removed_id, self.products)
+            else:
+                self.catalog_store.record_put(product, self.products)
+        except Exception as e:
+            print(f"Error saving product change: {e}")
+
     def add_product(self):
         """Adds a new product to the catalog."""
         print("\nAdd Product:")
         product_id = input("Enter product ID: ")
 
         # Check if the product ID already exists
-        if any(product['id'] == product_id for product in self.products):
+        if product_id in self.product_index:
             print(f"Error: Product ID '{product_id}' already exists in the catalog.")
             return
 
@@ -50,11 +190,43 @@ class CashierSystem:
         # Append the new product to the product catalog
         new_product = {"id": product_id, "name": name, "type": type_, "details": details, "price": price}
         self.products.append(new_product)
+        self._index_product(new_product)
 
-        # Save the updated products list to the JSON file
-        self.save_products_to_file()
+        # Log the new product; the JSON file is rewritten by periodic compaction
+        self._log_product_change(new_product)
         print(f"Product '{name}' added to catalog.")
 
+    def update_product(self, product_id, **changes):
+        """Updates fields of an existing product and keeps the indexes in sync."""
+        product = self.product_index.get(product_id)
+        if product is None:
+            print(f"Error: Product ID '{product_id}' does not exist in the catalog.")
+            return False
+
+        if changes.get('id', product_id) != product_id:
+            print("Error: Product ID cannot be changed.")
+            return False
+
+        self._unindex_product(product)
+        product.update(changes)
+        self._index_product(product)
+        self._log_product_change(product)
+        return True
+
+    def remove_product(self, product_id):
+        """Removes a product (and any discount on it) from the catalog."""
+        product = self.product_index.get(product_id)
+        if product is None:
+            print(f"Error: Product ID '{product_id}' does not exist in the catalog.")
+            return False
+
+        self._unindex_product(product)
+        self.products.remove(product)
+        self.discounts.pop(product_id, None)
+        self._price_table = None
+        self._log_product_change(removed_id=product_id)
+        return True
+
     def display_products(self):
         """Displays the product catalog."""
         print("\nProduct Catalog:")
@@ -66,7 +238,26 @@ class CashierSystem:
 
     def get_products_by_type(self, product_type):
         """Returns all products of a given type."""
-        return [prod for prod in self.products if prod["type"] == product_type]
+        return list(self.type_index.get(product_type, []))
+
+    def search_products(self, query, limit=10):
+        """Returns up to `limit` products matching a partly typed or misspelled query, best match first."""
+        return self.search_index.search(query, limit)
+
+    def find_products(self):
+        """Displays the best matches for a search over product names, types and details."""
+        print("\nSearch Products:")
+        query = input("Enter part of a product name, type or details: ")
+        results = self.search_products(query)
+
+        if results:
+            print(f"{'ID':<5} | {'Name':<25} | {'Type':<10} | {'Details':<20} | {'Price':<6}")
+            print("-" * 70)
+            for product in results:
+                print(f"{product['id']:<5} | {product['name']:<25} | {product['type']:<10} | "
+                      f"{product['details']:<20} | RM{product['price']:.2f}")
+        else:
+            print(f"No products match '{query.strip()}'.")
 
     def filter_products_by_category(self):
         """Displays products filtered by their category (type)."""
@@ -87,66 +278,133 @@ class CashierSystem:
     def add_discount(self):
         """Adds or modifies a discount for a product or all products."""
         print("\nAdd Discount:")
-        choice = input("1. Apply discount to a single product\n2. Apply discount to all products\nEnter your choice: ")
+        choice = input("1. Apply discount to a single product\n2. Apply discount to all products\n"
+                       "3. Apply discount to a category\n4. Apply a time-limited discount\n"
+                       "5. Add a buy X get Y free deal\nEnter your choice: ")
 
         if choice == "1":
             product_id = input("Enter product ID to apply discount: ")
 
             # Check if the product ID exists in the catalog
-            if not any(product['id'] == product_id for product in self.products):
+            if product_id not in self.product_index:
                 print(f"Error: Product ID '{product_id}' does not exist in the catalog.")
                 return
 
             try:
                 discount = float(input("Enter discount percentage (0-100): "))
-                if discount < 0 or discount > 100:
-                    print("Error: Discount percentage must be between 0 and 100.")
-                    return
-                self.discounts[product_id] = discount
-                print(f"Discount of {discount}% applied to product ID {product_id}.")
+                if self.set_discount(product_id, discount):
+                    print(f"Discount of {discount}% applied to product ID {product_id}.")
             except ValueError:
                 print("Invalid input. Please enter a valid percentage.")
 
         elif choice == "2":
             try:
                 discount = float(input("Enter discount percentage for all products (0-100): "))
-                if discount < 0 or discount > 100:
-                    print("Error: Discount percentage must be between 0 and 100.")
-                    return
-                # Apply discount to all products
-                for product in self.products:
-                    self.discounts[product['id']] = discount
-                print(f"Discount of {discount}% applied to all products.")
-            except ValueError:
-                print("Invalid input. Please enter a valid percentage.")
+                # One store-wide rule; product and category discounts still take precedence
+                rule_id = self.discount_engine.add_rule("store", discount)
+                print(f"Discount of {discount}% applied to all products (rule {rule_id}).")
+            except ValueError as e:
+                print(f"Invalid input: {e}")
+
+        elif choice == "3":
+            category = input("Enter product type (e.g., Beverage, Food, Pastry): ").strip()
+            if category not in self.type_index:
+                print(f"Error: No products found in the '{category}' category.")
+                return
+            try:
+                discount = float(input("Enter discount percentage (0-100): "))
+                rule_id = self.discount_engine.add_rule("category", discount, category)
+                print(f"Discount of {discount}% applied to the '{category}' category (rule {rule_id}).")
+            except ValueError as e:
+                print(f"Invalid input: {e}")
+
+        elif choice == "4":
+            scope = input("Apply to 1. all products, 2. a category or 3. a product: ").strip()
+            scope = {"1": "store", "2": "category", "3": "product"}.get(scope)
+            if scope is None:
+                print("Invalid choice. Please try again.")
+                return
+            target = input("Enter the product type or product ID: ").strip() if scope != "store" else None
+            try:
+                discount = float(input("Enter discount percentage (0-100): "))
+                start = datetime.strptime(input("Starts at (YYYY-MM-DD HH:MM): ").strip(), "%Y-%m-%d %H:%M")
+                end = datetime.strptime(input("Ends at (YYYY-MM-DD HH:MM): ").strip(), "%Y-%m-%d %H:%M")
+                rule_id = self.discount_engine.add_rule(scope, discount, target, start, end)
+                print(f"Discount of {discount}% scheduled from {start} to {end} (rule {rule_id}).")
+            except ValueError as e:
+                print(f"Invalid input: {e}")
+
+        elif choice == "5":
+            product_id = input("Enter product ID for the deal: ").strip()
+            if product_id not in self.product_index:
+                print(f"Error: Product ID '{product_id}' does not exist in the catalog.")
+                return
+            try:
+                buy = int(input("Buy how many: "))
+                free = int(input("Get how many free: "))
+                self.discount_engine.set_bundle(product_id, buy, free)
+                print(f"Buy {buy} get {free} free set on product ID {product_id}.")
+            except ValueError as e:
+                print(f"Invalid input: {e}")
         else:
             print("Invalid choice. Please try again.")
 
+    def set_discount(self, product_id, discount):
+        """Sets the discount percentage for one product; returns False if the input is invalid."""
+        if product_id not in self.product_index:
+            print(f"Error: Product ID '{product_id}' does not exist in the catalog.")
+            return False
+        if discount < 0 or discount > 100:
+            print("Error: Discount percentage must be between 0 and 100.")
+            return False
+        self.discounts[product_id] = discount
+        self._price_table = None
+        return True
+
     def view_active_discounts(self):
         """Displays all active discounts for products."""
         print("\nActive Discounts:")
-        if not self.discounts:
+        engine = self.discount_engine
+        if not self.discounts and not engine.rules and not engine.bundles:
             print("No active discounts.")
-        else:
+            return
+
+        if self.discounts:
             print(f"{'ID':<5} | {'Product Name':<25} | {'Discount (%)':<10}")
             print("-" * 50)
             for product_id, discount in self.discounts.items():
-                # Find the product by its ID
-                product = next((p for p in self.products if p['id'] == product_id), None)
+                product = self.product_index.get(product_id)
                 if product:
                     print(f"{product['id']:<5} | {product['name']:<25} | {discount:<10}")
                 else:
                     print(f"Product with ID {product_id} not found.")
 
+        if engine.rules:
+            print(f"\n{'Rule':<5} | {'Applies To':<25} | {'Discount (%)':<12} | Window")
+            print("-" * 70)
+            for rule_id, rule in engine.rules.items():
+                applies_to = "All products" if rule["scope"] == "store" else f"{rule['scope']} {rule['target']}"
+                window = f"{rule['start']} to {rule['end']}" if rule["start"] or rule["end"] else "Always"
+                print(f"{rule_id:<5} | {applies_to:<25} | {rule['percent']:<12} | {window}")
+
+        if engine.bundles:
+            print("\nBuy X Get Y Free:")
+            for product_id, (buy, free) in engine.bundles.items():
+                product = self.product_index.get(product_id)
+                name = product['name'] if product else product_id
+                print(f"{product_id:<5} | {name:<25} | buy {buy} get {free} free")
+
     def remove_discount(self):
         """Removes a discount from a product or all products."""
         print("\nRemove Discount:")
-        choice = input("1. Remove discount from a single product\n2. Remove discount from all products\nEnter your choice: ")
+        choice = input("1. Remove discount from a single product\n2. Remove discount from all products\n"
+                       "3. Remove a discount rule\n4. Remove a buy X get Y free deal\nEnter your choice: ")
 
         if choice == "1":
             product_id = input("Enter product ID to remove discount: ")
             if product_id in self.discounts:
                 del self.discounts[product_id]
+                self._price_table = None
                 print(f"Discount removed from product ID {product_id}.")
             else:
                 print("No discount found for this product.")
@@ -154,70 +412,279 @@ class CashierSystem:
         elif choice == "2":
             # Remove all discounts
             self.discounts.clear()
+            self.discount_engine.clear()
+            self._price_table = None
             print("All discounts have been removed from all products.")
 
+        elif choice == "3":
+            try:
+                rule_id = int(input("Enter rule number to remove: "))
+            except ValueError:
+                print("Invalid input. Please enter a rule number.")
+                return
+            if self.discount_engine.remove_rule(rule_id):
+                print(f"Discount rule {rule_id} removed.")
+            else:
+                print("No discount rule with this number.")
+
+        elif choice == "4":
+            product_id = input("Enter product ID to remove the deal from: ").strip()
+            if self.discount_engine.remove_bundle(product_id):
+                print(f"Deal removed from product ID {product_id}.")
+            else:
+                print("No deal found for this product.")
+
         else:
             print("Invalid choice. Please try again.")
 
+    def _get_price_table(self):
+        """Returns a product ID -> (ID, name, discounted price) table, building it if needed.
+
+        The table is rebuilt only after a catalog or discount change, or when a
+        time-limited discount starts or ends.
+        """
+        engine = self.discount_engine
+        if (self._price_table is None or self._price_version != engine.version
+                or (self._price_valid_until is not None and datetime.now() >= self._price_valid_until)):
+            self._price_version = engine.version
+            lookup = self.products.get if isinstance(self.products, LazyProducts) else None
+            self._price_table, self._price_valid_until = engine.compile(self.products, self.discounts,
+                                                                        lookup=lookup)
+        return self._price_table
+
+    def price_basket(self, product_ids):
+        """Prices one basket without logging a sale.
+
+        Returns a dictionary with the 'total', the priced 'items' as
+        (product ID, name, price) tuples and any 'invalid' product IDs.
+        """
+        return self.price_baskets([product_ids])[0]
+
+    def price_baskets(self, baskets):
+        """Prices many baskets (iterables of product IDs) in one pass without logging sales."""
+        table = self._get_price_table()
+        lookup = table.get
+        bundles = self.discount_engine.bundles
+        results = []
+        for basket in baskets:
+            entries = [lookup(pid) for pid in basket]
+            if None in entries:
+                items = [entry for entry in entries if entry is not None]
+                invalid = [pid for pid, entry in zip(basket, entries) if entry is None]
+            else:
+                items = entries
+                invalid = []
+            if bundles and not bundles.keys().isdisjoint(basket):
+                items = self.discount_engine.apply_bundles(items)
+            total = 0
+            for entry in items:
+                total += entry[2]
+            results.append({"total": total, "items": items, "invalid": invalid})
+        return results
+
     def complete_transaction(self):
         """Completes a transaction and generates a receipt."""
         product_ids = input("Enter product IDs (comma-separated): ")
         product_ids = [pid.strip() for pid in product_ids.split(",")]
-        total = 0
+        return self.process_transaction(product_ids)
+
+    def record_transaction(self, product_ids, timestamp=None):
+        """Prices a list of product IDs and logs the sale without printing anything.
+
+        Returns the same dictionary as price_basket, plus the 'out_of_stock'
+        product IDs if the inventory could not supply the basket (then no sale is logged).
+        """
+        priced = self.price_basket(product_ids)
+        priced["out_of_stock"] = []
+
+        # Log sale for reporting if there were valid items
+        if priced["total"] > 0:
+            valid_product_ids = [pid for pid, _, _ in priced["items"]]  # Use only valid IDs
+            if self.inventory is not None:
+                basket = Counter(valid_product_ids)
+                if not self.inventory.purchase(basket):
+                    priced["out_of_stock"] = [pid for pid, quantity in basket.items()
+                                              if self.inventory.get(pid) is not None
+                                              and self.inventory.get(pid) < quantity]
+                    return priced
+            self._record_sale(valid_product_ids, priced["items"], priced["total"], timestamp or datetime.now())
+        return priced
+
+    def process_transaction(self, product_ids, timestamp=None):
+        """Prices a list of product IDs, logs the sale and returns the receipt."""
+        priced = self.record_transaction(product_ids, timestamp)
+        if priced["out_of_stock"]:
+            print(f"\nNot enough stock for: {', '.join(priced['out_of_stock'])}")
+            print("Transaction cancelled. Please remove these items and try again.")
+            return None
+        total = priced["total"]
+        invalid_ids = priced["invalid"]  # To track invalid product IDs
+
         receipt = "\nReceipt:\n"
-        invalid_ids = []  # To track invalid product IDs
-        valid_product_ids = []  # To track valid product IDs for the report and sales log
-
-        for pid in product_ids:
-            product = next((p for p in self.products if p['id'] == pid), None)
-            if product:
-                price = product['price']
-                if pid in self.discounts:
-                    price -= price * (self.discounts[pid] / 100)
-                total += price
-                receipt += f"{product['name']}: RM{price:.2f}\n"
-                valid_product_ids.append(pid)  # Only add valid product IDs to the valid list
-            else:
-                invalid_ids.append(pid)
+        receipt += "".join(f"{name}: RM{price:.2f}\n" for _, name, price in priced["items"])
 
         # Handle invalid product IDs
         if invalid_ids:
             print(f"\nInvalid Product IDs: {', '.join(invalid_ids)}")
+            for pid in invalid_ids:
+                # Suggest only from a ready index; building one here would stall the checkout
+                suggestions = self.search_products(pid, 3) if pid and self.search_ready else []
+                if suggestions:
+                    print(f"Did you mean for '{pid}': "
+                          + ", ".join(f"{product['id']} ({product['name']})" for product in suggestions))
             print("Please ensure all product IDs are correct.")
 
         receipt += f"Total: RM{total:.2f}\n"
         print(receipt)
-
-        # Log sale for reporting if there were valid items
-        if total > 0:
-            self.sales.append({"products": valid_product_ids, "total": total})  # Use only valid IDs
         return receipt
 
-    def generate_report(self):
-        """Generates a basic sales report."""
-        report = "\nSales Report:\n"
-        total_sales = sum(sale["total"] for sale in self.sales)
-        product_popularity = {p['id']: 0 for p in self.products}
+    def replay_sales(self):
+        """Rebuilds the sales log and aggregates from the sales journal."""
+        records = self.journal.replay()
+        for record in records:
+            items = [(pid, None, price) for pid, price in zip(record["products"], record["prices"])]
+            self._record_sale(record["products"], items, record["total"],
+                              datetime.fromisoformat(record["timestamp"]), journal=False)
+        if records:
+            print(f"Recovered {len(records)} sales from '{self.journal.file_name}'.")
+
+    def close(self):
+        """Flushes the sales journal, the ledger and any catalog compaction before exiting."""
+        self.catalog_store.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.ledger is not None:
+            self.ledger.close()
+
+    def _record_sale(self, product_ids, items, total, timestamp, journal=True):
+        """Logs a sale and folds it into the running and time-bucketed aggregates."""
+        if journal and self.journal is not None:
+            self.journal.append({"products": product_ids, "prices": [price for _, _, price in items],
+                                 "total": total, "timestamp": timestamp.isoformat()})
+        if journal and self.ledger is not None and to_cents(total) > 0:
+            self.ledger.post("income", to_cents(total), timestamp, source="sale")
+        self.sales.append([pid for pid, _, _ in items], [price for _, _, price in items], total, timestamp)
+        self.total_revenue += total
+
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        hourly = self.hourly_sales.setdefault(hour, {"total": 0, "units": {}, "revenue": {}})
+        daily = self.daily_sales.setdefault(hour.date(), {"total": 0, "units": {}, "revenue": {}})
+        hourly["total"] += total
+        daily["total"] += total
+
+        for pid, _, price in items:
+            for units, revenue in ((self.units_sold, self.product_revenue),
+                                   (hourly["units"], hourly["revenue"]),
+                                   (daily["units"], daily["revenue"])):
+                units[pid] = units.get(pid, 0) + 1
+                revenue[pid] = revenue.get(pid, 0) + price
+
+    def _window_buckets(self, start, end):
+        """Yields the sales buckets covering [start, end), rounded out to whole hours.
+
+        Whole days inside the window come from the daily rollup and the
+        remaining hours from the hourly rollup.
+        """
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            next_day = hour + timedelta(days=1)
+            if hour.hour == 0 and next_day <= end:
+                bucket = self.daily_sales.get(hour.date())
+                hour = next_day
+            else:
+                bucket = self.hourly_sales.get(hour)
+                hour += timedelta(hours=1)
+            if bucket:
+                yield bucket
+
+    def sales_summary(self, start=None, end=None):
+        """Returns (total revenue, units by product ID, revenue by product ID) for start <= time < end.
+
+        Without a window the running totals are returned directly. Whole hours
+        come from the rollups and the partial hours at either edge straight from
+        the sales columns, so the window is exact.
+        """
+        if start is None and end is None:
+            return self.total_revenue, self.units_sold, self.product_revenue
+
+        start = start or min(self.hourly_sales, default=datetime.now())
+        end = end or datetime.now()
+        first_hour = start.replace(minute=0, second=0, microsecond=0)
+        if first_hour < start:
+            first_hour += timedelta(hours=1)
+        last_hour = end.replace(minute=0, second=0, microsecond=0)
+
+        total, units, revenue = 0, {}, {}
+        if first_hour < last_hour:
+            for bucket in self._window_buckets(first_hour, last_hour):
+                total += bucket["total"]
+                for pid, count in bucket["units"].items():
+                    units[pid] = units.get(pid, 0) + count
+                for pid, amount in bucket["revenue"].items():
+                    revenue[pid] = revenue.get(pid, 0) + amount
+            edges = [(start, first_hour), (last_hour, end)]
+        else:
+            edges = [(start, end)]  # The window lies within a single hour
+
+        for edge_start, edge_end in edges:
+            if edge_start >= edge_end:
+                continue
+            cents, edge_units, edge_revenue = self.sales.summary(edge_start, edge_end)
+            total += cents / 100
+            for pid, count in edge_units.items():
+                units[pid] = units.get(pid, 0) + count
+            for pid, amount in edge_revenue.items():
+                revenue[pid] = revenue.get(pid, 0) + amount / 100
+        return total, units, revenue
+
+    def generate_report(self, start=None, end=None):
+        """Generates a basic sales report, optionally limited to a time window."""
+        total_sales, product_popularity, _ = self.sales_summary(start, end)
+
+        lines = ["\nSales Report:", f"Total Sales: RM{total_sales:.2f}", "Product Popularity:"]
+        lines.extend(f"{product['name']}: {product_popularity.get(product['id'], 0)} sold"
+                     for product in self.products)
+        report = "\n".join(lines) + "\n"
 
-        for sale in self.sales:
-            for pid in sale["products"]:
-                product_popularity[pid] += 1
+        print(report)
+        return report
 
-        report += f"Total Sales: RM{total_sales:.2f}\n"
-        report += "Product Popularity:\n"
+    def export_sales(self, base_name="sales_export", fmt="csv", compress=False, from_journal=False):
+        """Streams the sales detail and product popularity to CSV or JSON Lines files.
+
+        from_journal reads the persisted sales log record by record instead of
+        the in-memory sales, so exports of any size run in bounded memory.
+        """
+        names = {product['id']: product['name'] for product in self.products}
+        if from_journal:
+            if self.journal is None:
+                print("Error: No sales journal to export from.")
+                return None
+            self.journal.close()  # Write out the queued sales so the export includes them
+            self.journal.open()
+            counts = export_sales(self.journal.records(), base_name, names, fmt, compress)
+        else:
+            counts = export_sales(self.sales, base_name, names, fmt, compress, self.units_sold, self.product_revenue)
+        print(f"Exported {counts[0]} sales to '{export_file_name(base_name, 'sales', fmt, compress)}' and "
+              f"{counts[1]} products to '{export_file_name(base_name, 'popularity', fmt, compress)}'.")
+        return counts
 
-        for product in self.products:
-            report += f"{product['name']}: {product_popularity[product['id']]} sold\n"
 
-        print(report)
-        return report
+# Timed while metrics are enabled (see Metrics.py)
+instrument(CashierSystem, "complete_transaction", "record_transaction", "process_transaction", "price_baskets",
+           "search_products", "generate_report", "sales_summary", "export_sales", "load_products_from_file",
+           "save_products_to_file", "replay_sales")
 
 
 # Main Menu
 def main():
-    cashier = CashierSystem("defaultproducts.json")
+    enable_from_env()  # Latency metrics if $COFFEEHOUSE_METRICS or $COFFEEHOUSE_METRICS_PORT is set
+    storage = open_storage()  # Flat files, or the SQLite database named by $COFFEEHOUSE_DB
+    cashier = CashierSystem(PRODUCT_FILE, storage.sales_journal(), inventory=storage.inventory(),
+                            ledger=storage.ledger(), storage=storage)
 
-    print("Welcome to the Cashier System. Products are loaded from 'defaultproducts.json'.")
+    cashier.start_search_index()  # Ready for searches and "Did you mean" by the time anyone types
+    print(f"Welcome to the Cashier System. Products are loaded from '{PRODUCT_FILE}'.")
 
     while True:
         print("\nMenu:")
@@ -228,7 +695,9 @@ def main():
         print("5. Complete Transaction")
         print("6. Generate Report")
         print("7. View All Active Discounts")
-        print("8. Exit")
+        print("8. Export Sales")
+        print("9. Search Products")
+        print("10. Exit")
 
         choice = input("Enter your choice: ")
         if choice == "1":
@@ -252,6 +721,18 @@ def main():
         elif choice == "7":
             cashier.view_active_discounts()  # Added new option for viewing active discounts
         elif choice == "8":
+            fmt = input(f"Export format ({'/'.join(FORMATS)}): ").strip().lower() or "csv"
+            if fmt not in FORMATS:
+                print("Invalid format.")
+                continue
+            compress = input("Compress with gzip? (yes/no): ").strip().lower() == "yes"
+            from_journal = input("Export from the sales log instead of this session? (yes/no): ").strip().lower() == "yes"
+            cashier.export_sales("sales_export", fmt, compress, from_journal)
+        elif choice == "9":
+            cashier.find_products()
+        elif choice == "10":
+            cashier.close()
+            storage.close()
             print("Exiting. Goodbye!")
             break
         else:
@@ -0,0 +1,198 @@
+import bisect
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+# File layout: header, then one (offset, length) entry per product in catalog order, then one
+# (padded ID, record number) entry per product sorted by ID, then the JSON of each product
+SNAPSHOT_MAGIC = b"CATSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sqq32sII")  # magic, JSON mtime_ns, JSON size, JSON blake2b, count, ID width
+ORDER_ENTRY = struct.Struct("<QI")
+
+
+class CatalogSnapshot:
+    def __init__(self, json_file):
+        self.json_file = json_file  # The catalog JSON this snapshot mirrors
+        self.file_name = json_file + ".snap"
+
+    def open(self):
+        """Returns the catalog as LazyProducts over a fresh snapshot, rebuilding the snapshot if it is stale."""
+        stat = os.stat(self.json_file)
+        products = self._open_if_fresh(stat)
+        if products is not None:
+            return products
+
+        with open(self.json_file, "rb") as file:
+            raw = file.read()
+            stat = os.fstat(file.fileno())
+        try:
+            self.write(json.loads(raw), stat, hashlib.blake2b(raw, digest_size=32).digest())
+        except OSError:
+            # Processes starting together all rebuild a stale snapshot; if ours could not be put
+            # in place, use the one another process just wrote
+            products = self._open_if_fresh(stat)
+            if products is None:
+                raise
+            return products
+        return self._open_if_fresh(stat)
+
+    def _open_if_fresh(self, stat):
+        """Maps the snapshot if it matches the JSON file; returns None if it is missing, damaged or stale."""
+        try:
+            with open(self.file_name, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file
+            return None
+        try:
+            magic, mtime_ns, size, digest, count, id_width = SNAPSHOT_HEADER.unpack_from(data)
+        except struct.error:
+            magic = None
+        if magic != SNAPSHOT_MAGIC:
+            data.close()
+            return None
+
+        if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+            # The JSON was touched or rewritten: only a changed hash makes the snapshot stale
+            with open(self.json_file, "rb") as file:
+                if hashlib.blake2b(file.read(), digest_size=32).digest() != digest:
+                    data.close()
+                    return None
+            with open(self.file_name, "r+b") as file:
+                file.write(SNAPSHOT_HEADER.pack(magic, stat.st_mtime_ns, stat.st_size, digest, count, id_width))
+        return LazyProducts(data, count, id_width)
+
+    def write(self, products, stat, digest):
+        """Writes a snapshot of `products` for the JSON file with the given stat and hash."""
+        payloads = [json.dumps(product, separators=(",", ":")).encode() for product in products]
+        ids = [str(product['id']).encode() for product in products]
+        id_width = max((len(pid) for pid in ids), default=1)
+        id_entry = struct.Struct(f"<{id_width}sI")
+
+        # A temporary file of our own, so processes rebuilding at the same time never share one
+        descriptor, temp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.file_name)),
+                                                 prefix=os.path.basename(self.file_name) + ".", suffix=".tmp")
+        try:
+            with open(descriptor, "wb") as file:
+                file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, stat.st_mtime_ns, stat.st_size, digest,
+                                                len(products), id_width))
+                offset = 0
+                for payload in payloads:
+                    file.write(ORDER_ENTRY.pack(offset, len(payload)))
+                    offset += len(payload)
+                for record in sorted(range(len(ids)), key=lambda record: ids[record].ljust(id_width, b"\0")):
+                    file.write(id_entry.pack(ids[record], record))
+                file.writelines(payloads)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_name, self.file_name)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_name)
+            raise
+
+
+# Sequence view of the ID table so bisect can search the mapped file directly.
+class _SortedIds:
+    def __init__(self, data, start, count, id_entry):
+        self.data, self.start, self.count, self.id_entry = data, start, count, id_entry
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        return self.data[self.start + position * self.id_entry.size:
+                         self.start + position * self.id_entry.size + self.id_entry.size - 4]
+
+
+# The product list backed by a mapped snapshot; each product is decoded on first access.
+# Behaves like the plain product list for iteration, len, append and remove,
+# and like the ID index for `in`, get and [] by product ID.
+class LazyProducts:
+    def __init__(self, data, count, id_width):
+        self._data = data
+        self._id_width = id_width
+        self._id_entry = struct.Struct(f"<{id_width}sI")
+        self._order_at = SNAPSHOT_HEADER.size
+        self._ids = _SortedIds(data, self._order_at + count * ORDER_ENTRY.size, count, self._id_entry)
+        self._payload_at = self._ids.start + count * self._id_entry.size
+        self._slots = list(range(count))  # Record number until decoded, then the product; None once removed
+        self._added = {}  # ID -> slot of products added after the snapshot was written
+        self._live = count
+
+    def _find_slot(self, product_id):
+        slot = self._added.get(product_id)
+        if slot is not None:
+            return slot
+        key = str(product_id).encode()
+        if len(key) > self._id_width:
+            return None
+        key = key.ljust(self._id_width, b"\0")
+        position = bisect.bisect_left(self._ids, key)
+        if position == len(self._ids) or self._ids[position] != key:
+            return None
+        _, record = self._id_entry.unpack_from(self._data, self._ids.start + position * self._id_entry.size)
+        return record
+
+    def _materialize(self, slot):
+        value = self._slots[slot]
+        if type(value) is int:
+            offset, length = ORDER_ENTRY.unpack_from(self._data, self._order_at + value * ORDER_ENTRY.size)
+            start = self._payload_at + offset
+            value = self._slots[slot] = json.loads(self._data[start:start + length])
+        return value
+
+    # ID lookups
+    def get(self, product_id, default=None):
+        slot = self._find_slot(product_id)
+        product = None if slot is None else self._materialize(slot)
+        return default if product is None else product
+
+    def __contains__(self, product_id):
+        return self.get(product_id) is not None
+
+    def __getitem__(self, product_id):
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return product
+
+    # List behaviour
+    def __len__(self):
+        return self._live
+
+    def __iter__(self):
+        for slot in range(len(self._slots)):
+            product = self._materialize(slot)
+            if product is not None:
+                yield product
+
+    def append(self, product):
+        self._added[product['id']] = len(self._slots)
+        self._slots.append(product)
+        self._live += 1
+
+    def remove(self, product):
+        slot = self._find_slot(product['id'])
+        if slot is None or self._slots[slot] is None:
+            raise ValueError("product not in catalog")
+        self._slots[slot] = None
+        self._added.pop(product['id'], None)
+        self._live -= 1
+
+    def put(self, product):
+        """Replaces the product with the same ID, or appends it."""
+        slot = self._find_slot(product['id'])
+        if slot is None or self._slots[slot] is None:
+            self.append(product)
+        else:
+            self._slots[slot] = product
+
+    def discard(self, product_id):
+        """Removes the product with an ID if there is one."""
+        product = self.get(product_id)
+        if product is not None:
+            self.remove(product)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+
+from CatalogSnapshot import CatalogSnapshot
+from RecordWriter import locked
+
+
+class CatalogStore:
+    def __init__(self, file_name, compact_after=1000):
+        self.file_name = file_name  # JSON snapshot of the whole catalog
+        self.log_file = file_name + ".log"  # One JSON line per catalog change since the snapshot
+        self.snapshot = CatalogSnapshot(file_name)  # Binary copy of the JSON that loads without parsing it
+        self.compact_after = compact_after  # Start a background compaction after this many changes
+        self.pending = 0  # Number of changes currently in the log
+        self._seen = None  # (log inode, bytes) of the log this store has read or written itself; None if never read
+        self._lock = threading.Lock()  # Guards pending, _seen and the compactor thread in this process
+        self._compactor = None
+
+    def load(self):
+        """Returns the catalog from the snapshot with the change log replayed on top of it.
+
+        The products come back as LazyProducts, decoded one by one as they are used.
+        """
+        with locked(self.log_file):  # Appends and compactions wait, so the snapshot and the log match
+            products = self.snapshot.open()
+            identity = self._log_identity()
+            changes, logged = self._read_log(0)
+            if identity is not None:
+                size = os.path.getsize(self.log_file)
+                if size > logged:  # Cut a torn last line off so the next append starts a fresh line
+                    print(f"Warning: discarding {size - logged} damaged bytes at the end of '{self.log_file}'.")
+                    os.truncate(self.log_file, logged)
+        with self._lock:
+            self.pending = len(changes)
+            self._seen = (identity, logged)
+        for change in changes:
+            if change['op'] == 'put':
+                products.put(change['product'])
+            elif change['op'] == 'remove':
+                products.discard(change['id'])
+        return products
+
+    def signature(self):
+        """Returns the modification time and size of the snapshot and its change log."""
+        signature = []
+        for name in (self.file_name, self.log_file):
+            try:
+                stat = os.stat(name)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _log_identity(self):
+        """Returns the inode of the change log, which changes whenever a compaction replaces it."""
+        try:
+            return os.stat(self.log_file).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _read_log(self, start):
+        """Reads the changes logged from byte `start` on, dropping a partially written last line.
+
+        Returns the changes and the offset just after the last one read.
+        """
+        changes = []
+        try:
+            with open(self.log_file, 'rb') as file:
+                file.seek(start)
+                for line in file:
+                    try:
+                        changes.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+                    start += len(line)
+        except FileNotFoundError:
+            pass
+        return changes, start
+
+    def record_put(self, product, products):
+        """Logs an added or updated product."""
+        self._append({'op': 'put', 'product': product})
+
+    def record_remove(self, product_id, products):
+        """Logs a removed product."""
+        self._append({'op': 'remove', 'id': product_id})
+
+    def _append(self, change):
+        """Appends one change record and compacts in the background once the log is long enough.
+
+        The log's file lock keeps appends from other processes and compactions apart.
+        """
+        line = (json.dumps(change) + "\n").encode()
+        with self._lock, locked(self.log_file):
+            with open(self.log_file, 'a+b') as file:
+                offset = _cut_torn_tail(file, self.log_file)  # Left by a process that crashed mid-append
+                identity = os.fstat(file.fileno()).st_ino
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            if self._seen == (identity, offset):
+                self._seen = (identity, offset + len(line))  # Nobody else logged anything in between
+            self.pending += 1
+
+            if self.pending >= self.compact_after and (self._compactor is None or not self._compactor.is_alive()):
+                # Rebuild from the snapshot and log on disk, so the caller never waits on a catalog copy
+                self._compactor = threading.Thread(target=self._compact, args=(None, None), daemon=True)
+                self._compactor.start()
+
+    def compact(self, products):
+        """Writes a fresh snapshot through a temporary file and atomic rename, then trims the log.
+
+        Changes other processes logged since this store last read the log are
+        replayed on top of `products` first, so they are kept.
+        """
+        self.close()  # Never let an older background snapshot land after this one
+        with self._lock:
+            seen = self._seen
+        self._compact(products, seen)
+
+    def _compact(self, products, seen):
+        """Replaces the snapshot with `products` plus every change logged after position `seen`.
+
+        `products` is None to rebuild from the snapshot and log on disk. `seen`
+        is None if the store never read the log, in which case `products` are
+        the whole catalog. One process at a time compacts, under the catalog
+        file's lock; changes logged while the snapshot is written stay in the log.
+        """
+        with locked(self.file_name):
+            with locked(self.log_file):
+                identity = self._log_identity()
+                from_disk = products is None or seen is not None and seen[0] != identity
+                if from_disk:  # Includes any compaction another process made since `products` were read
+                    products, start = self.snapshot.open(), 0
+                elif seen is None:
+                    start = os.path.getsize(self.log_file) if identity is not None else 0
+                else:
+                    start = seen[1]
+                changes, logged = self._read_log(start)
+            products = _apply_changes(products, changes)
+
+            raw = json.dumps(products, indent=4).encode()
+            temp_name = self.file_name + ".tmp"
+            with open(temp_name, 'wb') as file:
+                file.write(raw)
+                file.flush()
+                os.fsync(file.fileno())
+                stat = os.fstat(file.fileno())
+
+            with self._lock, locked(self.log_file):
+                os.replace(temp_name, self.file_name)
+                self.snapshot.write(products, stat, hashlib.blake2b(raw, digest_size=32).digest())
+
+                # Keep only the changes logged while the snapshot was being written
+                try:
+                    with open(self.log_file, 'rb') as file:
+                        file.seek(logged)
+                        newer = file.read()
+                except FileNotFoundError:
+                    newer = b""
+                with open(self.log_file + ".tmp", 'wb') as file:
+                    file.write(newer)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(self.log_file + ".tmp", self.log_file)
+                self.pending = newer.count(b"\n")
+                if self._seen is not None and self._seen[0] == identity and self._seen[1] >= logged:
+                    # This store's products already reflect everything the new snapshot holds
+                    self._seen = (self._log_identity(), self._seen[1] - logged)
+                elif seen is None and not from_disk and not changes:
+                    self._seen = (self._log_identity(), 0)
+                else:
+                    self._seen = (None, 0)  # Our products miss what was replayed; later compactions start from disk
+
+    def close(self):
+        """Waits for a running background compaction to finish."""
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+
+def _apply_changes(products, changes):
+    """Returns the products with logged changes applied; a put replaces a product in place or appends it."""
+    by_id = {product['id']: product for product in products}
+    for change in changes:
+        if change['op'] == 'put':
+            by_id[change['product']['id']] = change['product']
+        elif change['op'] == 'remove':
+            by_id.pop(change['id'], None)
+    return list(by_id.values())
+
+
+def _cut_torn_tail(file, name):
+    """Truncates a log opened for appending after its last complete line and returns the new size."""
+    size = file.seek(0, os.SEEK_END)
+    if size == 0:
+        return size
+    file.seek(size - 1)
+    if file.read(1) == b"\n":
+        return size
+    end = size
+    while end > 0:
+        start = max(0, end - 4096)
+        file.seek(start)
+        newline = file.read(end - start).rfind(b"\n")
+        if newline != -1:
+            end = start + newline + 1
+            break
+        end = start
+    print(f"Warning: discarding {size - end} damaged bytes at the end of '{name}'.")
+    file.truncate(end)
+    return end
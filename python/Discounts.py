@@ -0,0 +1,142 @@
+from datetime import datetime
+
+# Rule scopes from least to most specific; the most specific active rule sets a product's price
+SCOPES = ("store", "category", "product")
+
+
+class DiscountEngine:
+    def __init__(self):
+        self.rules = {}  # Rule ID -> percentage rule (scope, target, percent, optional start/end)
+        self.bundles = {}  # Product ID -> (buy, free) for "buy X get Y free" deals
+        self.version = 0  # Bumped on every change so cached price tables know to rebuild
+        self._next_id = 1
+
+    def add_rule(self, scope, percent, target=None, start=None, end=None):
+        """Adds a percentage rule and returns its ID.
+
+        scope is "store", "category" (target = product type) or "product"
+        (target = product ID). start/end limit the rule to a time window.
+        """
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown discount scope '{scope}'.")
+        if scope != "store" and not target:
+            raise ValueError(f"A {scope} discount needs a target.")
+        if percent < 0 or percent > 100:
+            raise ValueError("Discount percentage must be between 0 and 100.")
+        if start is not None and end is not None and end <= start:
+            raise ValueError("The discount window must end after it starts.")
+
+        rule_id = self._next_id
+        self._next_id += 1
+        self.rules[rule_id] = {"scope": scope, "target": target, "percent": percent, "start": start, "end": end}
+        self.version += 1
+        return rule_id
+
+    def remove_rule(self, rule_id):
+        """Removes a percentage rule; returns False if it does not exist."""
+        if self.rules.pop(rule_id, None) is None:
+            return False
+        self.version += 1
+        return True
+
+    def set_bundle(self, product_id, buy, free):
+        """Sets a "buy `buy` get `free` free" deal on a product."""
+        if buy < 1 or free < 1:
+            raise ValueError("A bundle needs at least one paid and one free item.")
+        self.bundles[product_id] = (buy, free)
+        self.version += 1
+
+    def remove_bundle(self, product_id):
+        """Removes a bundle deal; returns False if the product has none."""
+        if self.bundles.pop(product_id, None) is None:
+            return False
+        self.version += 1
+        return True
+
+    def clear(self):
+        """Removes every rule and bundle."""
+        self.rules.clear()
+        self.bundles.clear()
+        self.version += 1
+
+    def compile(self, products, product_discounts, now=None, lookup=None):
+        """Builds the effective price table for the catalog at `now`.
+
+        product_discounts holds the permanent per-product percentages
+        (CashierSystem.discounts). Returns (table, valid_until) where table maps
+        product ID -> (ID, name, price) and valid_until is the next time a rule
+        window opens or closes (None if no window is pending). With a `lookup`
+        (product ID -> product or None) the table prices each product the first
+        time it is asked for instead of walking the whole catalog up front.
+        """
+        now = now or datetime.now()
+        valid_until = None
+        store = None
+        by_category = {}
+        by_product = {}
+
+        for rule in self.rules.values():
+            start, end = rule["start"], rule["end"]
+            for boundary in (start, end):
+                if boundary is not None and boundary > now and (valid_until is None or boundary < valid_until):
+                    valid_until = boundary
+            if (start is not None and now < start) or (end is not None and now >= end):
+                continue
+
+            # Within one scope the largest active discount applies
+            percent = rule["percent"]
+            if rule["scope"] == "store":
+                store = percent if store is None else max(store, percent)
+            elif rule["scope"] == "category":
+                by_category[rule["target"]] = max(by_category.get(rule["target"], percent), percent)
+            else:
+                by_product[rule["target"]] = max(by_product.get(rule["target"], percent), percent)
+
+        def price(product):
+            pid = product['id']
+            price = product['price']
+            if pid in product_discounts or pid in by_product:
+                discount = max(product_discounts.get(pid, 0), by_product.get(pid, 0))
+            else:
+                discount = by_category.get(product['type'], store)
+            if discount is not None:
+                price -= price * (discount / 100)
+            return pid, product['name'], price
+
+        if lookup is not None:
+            return PriceTable(price, lookup), valid_until
+        return {product['id']: price(product) for product in products}, valid_until
+
+    def apply_bundles(self, items):
+        """Makes the free units of bundle deals cost nothing; items are (ID, name, price) tuples."""
+        counts = {}
+        for position, (pid, name, price) in enumerate(items):
+            deal = self.bundles.get(pid)
+            if deal is None:
+                continue
+            buy, free = deal
+            counts[pid] = counts.get(pid, 0) + 1
+            if (counts[pid] - 1) % (buy + free) >= buy:
+                items[position] = (pid, name, 0.0)
+        return items
+
+
+# Price table that prices products on first access, for catalogs that are themselves decoded lazily.
+class PriceTable(dict):
+    def __init__(self, price, lookup):
+        super().__init__()
+        self._price = price  # Product -> (ID, name, effective price)
+        self._lookup = lookup  # Product ID -> product, or None if there is no such product
+
+    def __missing__(self, pid):
+        product = self._lookup(pid)
+        if product is None:
+            raise KeyError(pid)
+        entry = self[pid] = self._price(product)
+        return entry
+
+    def get(self, pid, default=None):
+        try:
+            return self[pid]
+        except KeyError:
+            return default
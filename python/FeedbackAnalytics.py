@@ -0,0 +1,107 @@
+import bisect
+import re
+
+WORD = re.compile(r"[a-z0-9']+")
+
+
+class FeedbackAnalytics:
+    def __init__(self):
+        self.reviews = []  # Every review, oldest first; a review's ID is its position here
+        self.dish_counts = {}  # Dish -> number of reviews
+        self.dish_reviews = {}  # Dish -> review IDs, oldest first
+        self.word_index = {}  # Word -> review IDs containing it, oldest first
+        self.ingested = {}  # Feedback file -> bytes already read from it
+
+    def add_review(self, text, dish=None, username=None, timestamp=None, source="manager"):
+        """Adds one review and updates the counts and indexes incrementally; returns its ID."""
+        review_id = len(self.reviews)
+        self.reviews.append({"text": text, "dish": dish, "username": username,
+                             "timestamp": timestamp, "source": source})
+        if dish:
+            self.dish_counts[dish] = self.dish_counts.get(dish, 0) + 1
+            self.dish_reviews.setdefault(dish, []).append(review_id)
+        for word in set(WORD.findall(text.lower())):
+            self.word_index.setdefault(word, []).append(review_id)
+        return review_id
+
+    def ingest_feedback_file(self, file_name):
+        """Streams the dish reviews appended to a Feedback.txt file since the last call; returns how many."""
+        offset = self.ingested.get(file_name, 0)
+        added = 0
+        try:
+            with open(file_name, "rb") as file:
+                file.seek(offset)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break  # Half-written last line: read it next time
+                    offset += len(line)
+                    parts = line.decode().rstrip("\n").split(",", 2)
+                    if len(parts) == 3 and parts[2].strip():
+                        self.add_review(parts[2].strip(), parts[1].strip(), parts[0].strip(), source="customer")
+                        added += 1
+        except FileNotFoundError:
+            return 0
+        self.ingested[file_name] = offset
+        return added
+
+    def ingest_dish_reviews(self, dish_reviews):
+        """Adds the reviews a storage backend's dish review table gained since the last call; returns how many."""
+        seq = self.ingested.get(dish_reviews.file_name, 0)
+        added = 0
+        for seq, username, dish, text in dish_reviews.after(seq):
+            if text.strip():
+                self.add_review(text.strip(), dish, username, source="customer")
+                added += 1
+        self.ingested[dish_reviews.file_name] = seq
+        return added
+
+    def latest_for_dish(self, dish, count=5):
+        """Returns the newest reviews of a dish, newest first."""
+        review_ids = self.dish_reviews.get(dish, [])
+        return [self.reviews[review_id] for review_id in reversed(review_ids[-count:])]
+
+    def search(self, query, limit=20):
+        """Returns the newest reviews containing every word of the query, newest first."""
+        words = set(WORD.findall(query.lower()))
+        if not words:
+            return []
+        postings = [self.word_index.get(word, []) for word in words]
+        postings.sort(key=len)
+        if not postings[0]:
+            return []
+
+        # Leapfrog from the newest review down: every list gallops back to its newest ID no newer than the
+        # candidate, and a miss makes that ID the next candidate, so disjoint stretches are skipped whole
+        ends = [len(posting) for posting in postings]  # Each list is only searched below its end
+        candidate = postings[0][-1]
+        matches = []
+        while True:
+            for i, posting in enumerate(postings):
+                position = _newest_at_most(posting, candidate, ends[i])
+                if position < 0:
+                    return matches
+                ends[i] = position + 1
+                if posting[position] != candidate:
+                    candidate = posting[position]
+                    break
+            else:
+                matches.append(self.reviews[candidate])
+                ends[0] -= 1
+                if len(matches) == limit or not ends[0]:
+                    return matches
+                candidate = postings[0][ends[0] - 1]
+
+
+def _newest_at_most(sorted_ids, review_id, end):
+    """Returns the position of the largest ID <= review_id in sorted_ids[:end], or -1 if there is none.
+
+    Gallops back from `end` first, so a nearby answer costs O(log distance) rather than O(log n).
+    """
+    step = 1
+    high = end
+    low = end - 1
+    while low > 0 and sorted_ids[low] > review_id:
+        high = low
+        step *= 2
+        low = max(end - step, 0)
+    return bisect.bisect_right(sorted_ids, review_id, low, high) - 1
@@ -0,0 +1,223 @@
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from RecordWriter import locked
+
+
+# Stock is keyed by product ID. With a file name, every change is appended to a log that the
+# cashier, customer and manager processes all read, so they share one stock level per product.
+class InventoryEngine:
+    def __init__(self, stripes=64, reservation_ttl=30, file_name=None):
+        self.file_name = file_name  # Append-only log of stock changes; None keeps the stock in memory only
+        self.stock = {}  # Item -> quantity available to reserve
+        self.reservation_ttl = reservation_ttl  # Seconds before an unconfirmed reservation is released
+        self.reservations = {}  # Reservation ID -> (items, expiry time)
+        self._stripes = [threading.Lock() for _ in range(stripes)]  # Each item is guarded by one stripe
+        self._reservations_lock = threading.Lock()  # Guards reservations and the expiry heap
+        self._expiries = []  # Heap of (expiry time, reservation ID)
+        self._ids = itertools.count(1)
+        self._log_lock = threading.Lock()  # Orders this process's logged changes
+        self._offset = 0  # Bytes of the log already applied
+
+        if self.file_name is not None:
+            self.refresh()
+
+    def _stripe_indexes(self, items):
+        """Returns the stripes covering the items in a fixed order, so locking can never deadlock."""
+        return sorted({hash(item) % len(self._stripes) for item in items})
+
+    def _lock(self, items):
+        indexes = self._stripe_indexes(items)
+        for index in indexes:
+            self._stripes[index].acquire()
+        return indexes
+
+    def _unlock(self, indexes):
+        for index in reversed(indexes):
+            self._stripes[index].release()
+
+    # Stock levels
+    def get(self, item):
+        """Returns the available quantity of an item, or None if it is not stocked."""
+        return self.stock.get(item)
+
+    def set_quantity(self, item, quantity):
+        """Sets the available quantity of an item."""
+        with self._shared():
+            self._commit({'op': 'set', 'item': item, 'quantity': quantity})
+
+    def add_quantity(self, item, quantity):
+        """Adds to the available quantity of an item and returns the new quantity."""
+        with self._shared():
+            self._commit({'op': 'add', 'items': {item: quantity}})
+            return self.stock[item]
+
+    def remove(self, item):
+        """Stops stocking an item."""
+        with self._shared():
+            self._commit({'op': 'remove', 'item': item})
+
+    # Reservations
+    def reserve(self, items, ttl=None):
+        """Takes stock for a whole basket ({item: quantity}) at once, or nothing at all.
+
+        Items that are not stocked are not stock-controlled and are ignored.
+        Returns a reservation ID, or None if any stocked item is short.
+        """
+        self.release_expired()
+        items = self._take(items)
+        if items is None:
+            return None
+
+        reservation_id = next(self._ids)
+        expiry = time.monotonic() + (ttl if ttl is not None else self.reservation_ttl)
+        with self._reservations_lock:
+            self.reservations[reservation_id] = (items, expiry)
+            heapq.heappush(self._expiries, (expiry, reservation_id))
+        return reservation_id
+
+    def commit(self, reservation_id):
+        """Makes a reservation final; returns False if it already expired or was released."""
+        with self._reservations_lock:
+            return self.reservations.pop(reservation_id, None) is not None
+
+    def release(self, reservation_id):
+        """Returns a reservation's stock; returns False if it was already committed or released."""
+        with self._reservations_lock:
+            reservation = self.reservations.pop(reservation_id, None)
+        if reservation is None:
+            return False
+        self._restock(reservation[0])
+        return True
+
+    def purchase(self, items):
+        """Takes stock for a basket in one step, all or nothing; returns False if any stocked item is short."""
+        self.release_expired()
+        return self._take(items) is not None
+
+    def _take(self, items):
+        """Decrements every stocked item of a basket under its stripe locks, or none of them.
+
+        Returns the stocked part of the basket, or None if an item is short.
+        """
+        if self.file_name is not None:
+            with self._shared():  # Checked against the stock every process has logged so far
+                items = {item: quantity for item, quantity in items.items() if item in self.stock}
+                if any(self.stock[item] < quantity for item, quantity in items.items()):
+                    return None
+                self._commit({'op': 'add', 'items': {item: -quantity for item, quantity in items.items()}})
+            return items
+
+        items = {item: quantity for item, quantity in items.items() if item in self.stock}
+        indexes = self._lock(items)
+        try:
+            if any(self.stock.get(item, 0) < quantity for item, quantity in items.items()):
+                return None
+            for item, quantity in items.items():
+                self.stock[item] -= quantity
+        finally:
+            self._unlock(indexes)
+        return items
+
+    def release_expired(self):
+        """Releases every reservation whose time ran out."""
+        now = time.monotonic()
+        if not self._expiries or self._expiries[0][0] > now:
+            return  # Nothing due; skip the lock on the common path
+        expired = []
+        with self._reservations_lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                _, reservation_id = heapq.heappop(self._expiries)
+                reservation = self.reservations.pop(reservation_id, None)
+                if reservation is not None:
+                    expired.append(reservation[0])
+        for items in expired:
+            self._restock(items)
+
+    def _restock(self, items):
+        if self.file_name is not None:
+            with self._shared():
+                self._commit({'op': 'add', 'items': {item: quantity for item, quantity in items.items()
+                                                     if item in self.stock}})
+            return
+
+        indexes = self._lock(items)
+        try:
+            for item, quantity in items.items():
+                if item in self.stock:
+                    self.stock[item] += quantity
+        finally:
+            self._unlock(indexes)
+
+    # Shared log
+    @contextlib.contextmanager
+    def _shared(self):
+        """Holds the log's file lock with every other process's changes applied; a no-op in memory."""
+        if self.file_name is None:
+            yield
+            return
+        with self._log_lock, locked(self.file_name):
+            self.refresh()
+            yield
+
+    def refresh(self):
+        """Applies the changes other processes appended to the log since the last read."""
+        if self.file_name is None:
+            return
+        try:
+            if os.stat(self.file_name).st_size == self._offset:
+                return  # Nothing new; skip reading on the common path
+            with open(self.file_name, "rb") as file:
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+
+        complete = data.rfind(b"\n") + 1  # Leave a half-written last line for the next read
+        for line in data[:complete].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                print(f"Warning: ignoring a damaged entry in '{self.file_name}'.")
+        self._offset += complete
+
+    def _commit(self, change):
+        """Logs a change (while _shared() is held) and then applies it."""
+        self._write(change)
+        self._apply(change)
+
+    def _write(self, change):
+        """Appends one change to the log and fsyncs it before returning; a no-op in memory."""
+        if self.file_name is None:
+            return
+        line = (json.dumps(change) + "\n").encode()
+        with open(self.file_name, "ab") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size > self._offset:
+                # Half a change from a writer that crashed; nobody can still be writing it while we hold the lock
+                print(f"Warning: discarding {size - self._offset} damaged bytes at the end of '{self.file_name}'.")
+                file.truncate(self._offset)
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self._offset += len(line)
+
+    def _apply(self, change):
+        """Applies one set, add or remove change to the stock under its items' stripe locks."""
+        items = change['items'] if change['op'] == 'add' else {change['item']: None}
+        indexes = self._lock(items)
+        try:
+            if change['op'] == 'set':
+                self.stock[change['item']] = change['quantity']
+            elif change['op'] == 'remove':
+                self.stock.pop(change['item'], None)
+            elif change['op'] == 'add':
+                for item, quantity in items.items():
+                    self.stock[item] = self.stock.get(item, 0) + quantity
+        finally:
+            self._unlock(indexes)
@@ -0,0 +1,176 @@
+import bisect
+import os
+
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from RecordWriter import locked
+
+KINDS = ("income", "expense")
+
+
+def to_cents(amount):
+    """Converts an RM amount to whole cents, rounding half up like a till would."""
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+
+
+def format_cents(cents):
+    """Formats whole cents as an RM amount, e.g. 1234 -> '12.34'."""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+class Ledger:
+    def __init__(self, file_name=None):
+        self.file_name = file_name  # Append-only log of entries; None keeps the ledger in memory only
+        self.entries = []  # (timestamp, kind, cents, source) in posting order
+        self.totals = {kind: 0 for kind in KINDS}  # All-time cents by kind
+        self.days = {}  # Day ordinal -> {"times": sorted timestamps, kind: running cents within the day}
+        self._base = None  # Day ordinal at position 0 of the Fenwick trees
+        self._trees = {kind: [] for kind in KINDS}  # Fenwick trees of daily cents, one per kind
+        self._offset = 0  # Bytes of the log already applied
+        self._file = None
+
+        if self.file_name is not None:
+            self.refresh()
+
+    def refresh(self):
+        """Applies the entries other processes appended to the log since the last read."""
+        if self.file_name is None:
+            return
+        try:
+            if os.stat(self.file_name).st_size == self._offset:
+                return  # Nothing new; skip reading on the common path
+            with open(self.file_name, "rb") as file:
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+
+        complete = data.rfind(b"\n") + 1  # Leave a half-written last line for the next read
+        for line in data[:complete].decode().splitlines():
+            parts = line.split("\t")
+            if len(parts) != 4 or parts[1] not in self.totals:
+                print(f"Warning: ignoring a damaged entry in '{self.file_name}'.")
+                continue
+            self._apply(datetime.fromisoformat(parts[0]), parts[1], int(parts[2]), parts[3])
+        self._offset += complete
+
+    def post(self, kind, cents, timestamp=None, source="manager"):
+        """Records an income or expense of a positive number of cents."""
+        if kind not in self.totals:
+            raise ValueError(f"Unknown ledger entry kind '{kind}'.")
+        if not isinstance(cents, int) or cents <= 0:
+            raise ValueError("A ledger amount must be a positive number of cents.")
+        timestamp = timestamp or datetime.now()
+
+        if self.file_name is not None:
+            self._write(timestamp, kind, cents, source)
+        self._apply(timestamp, kind, cents, source)
+
+    def _write(self, timestamp, kind, cents, source):
+        """Appends one entry to the log under the shared file lock and fsyncs it before returning."""
+        line = f"{timestamp.isoformat()}\t{kind}\t{cents}\t{source}\n".encode()
+        with locked(self.file_name):
+            self.refresh()  # Apply other processes' entries first so our offset stays in step
+            if self._file is None:
+                self._file = open(self.file_name, "ab")
+            size = os.fstat(self._file.fileno()).st_size
+            if size > self._offset:
+                # Half an entry from a writer that crashed; nobody can still be writing it while we hold the lock
+                print(f"Warning: discarding {size - self._offset} damaged bytes at the end of '{self.file_name}'.")
+                self._file.truncate(self._offset)
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._offset += len(line)
+
+    def _apply(self, timestamp, kind, cents, source):
+        """Folds one entry into the totals, its day's running sums and the Fenwick trees."""
+        self.entries.append((timestamp, kind, cents, source))
+        self.totals[kind] += cents
+
+        ordinal = timestamp.toordinal()
+        day = self.days.get(ordinal)
+        if day is None:
+            day = self.days[ordinal] = {"times": [], **{k: [] for k in KINDS}}
+            self._cover(ordinal)
+
+        times = day["times"]
+        if not times or timestamp >= times[-1]:
+            times.append(timestamp)
+            for k in KINDS:
+                running = day[k]
+                running.append((running[-1] if running else 0) + (cents if k == kind else 0))
+        else:
+            # Backdated entry: insert it in time order and shift the later running sums of its kind
+            position = bisect.bisect_right(times, timestamp)
+            times.insert(position, timestamp)
+            for k in KINDS:
+                running = day[k]
+                running.insert(position, running[position - 1] if position else 0)
+            running = day[kind]
+            for i in range(position, len(running)):
+                running[i] += cents
+
+        tree = self._trees[kind]
+        i = ordinal - self._base + 1
+        while i <= len(tree):
+            tree[i - 1] += cents
+            i += i & -i
+
+    def _cover(self, ordinal):
+        """Grows the Fenwick trees so they have a slot for the given day, rebuilding them if needed."""
+        size = len(self._trees[KINDS[0]])
+        if self._base is not None and self._base <= ordinal < self._base + size:
+            return
+        first = ordinal if self._base is None else min(self._base, ordinal)
+        last = ordinal if self._base is None else max(self._base + size - 1, ordinal)
+        size = max(size, 512)
+        while first + size <= last:
+            size *= 2
+        self._base = first
+
+        for kind in KINDS:
+            tree = [0] * size
+            for day_ordinal, day in self.days.items():
+                if day[kind]:
+                    tree[day_ordinal - first] = day[kind][-1]
+            for i in range(1, size + 1):  # Linear-time Fenwick construction
+                parent = i + (i & -i)
+                if parent <= size:
+                    tree[parent - 1] += tree[i - 1]
+            self._trees[kind] = tree
+
+    def _before(self, moment, kind):
+        """Returns the cents of one kind posted strictly before a moment."""
+        if self._base is None:
+            return 0
+        tree = self._trees[kind]
+        total = 0
+        i = min(max(moment.toordinal() - self._base, 0), len(tree))  # Whole days before the moment's day
+        while i > 0:
+            total += tree[i - 1]
+            i -= i & -i
+
+        day = self.days.get(moment.toordinal())
+        if day is not None:
+            position = bisect.bisect_left(day["times"], moment)
+            if position:
+                total += day[kind][position - 1]
+        return total
+
+    def totals_between(self, start=None, end=None):
+        """Returns {kind: cents} for the entries with start <= timestamp < end; None means unbounded."""
+        totals = {}
+        for kind in KINDS:
+            upper = self.totals[kind] if end is None else self._before(end, kind)
+            lower = 0 if start is None else self._before(start, kind)
+            totals[kind] = upper - lower
+        return totals
+
+    def close(self):
+        """Closes the log file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,16 +1,102 @@
-import random
-import string #is mean text, which can combine with letters, numbers, and symbols.
+import mmap
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+
+from AccountStore import AccountStore
+from CartStore import CartStore
+from Metrics import enable_from_env, instrument
+from OrderIndex import OrderIndex
+from ProductCatalog import ProductCatalog
+from RecordWriter import BatchedWriter, locked
+from Storage import PRODUCT_FILE, open_storage
 
 # Global variables
-cart = []  # Cart for storing selected items
+carts = CartStore()  # One item -> quantity cart per customer session
+inventory = None  # Optional InventoryEngine shared with the manager; checkouts take stock from it
+
+ORDER_FILE = "Order.txt"
+ORDER_INDEX_FILE = "Order.idx"  # Sorted binary (order ID, offset) entries, searched through mmap
+order_index = OrderIndex(ORDER_INDEX_FILE, ORDER_FILE)
+customer_orders = None  # Storage backend's order table, or None to keep orders in Order.txt
+dish_reviews = None  # Storage backend's dish review table, or None to keep reviews in Feedback.txt
+
+catalog = ProductCatalog(PRODUCT_FILE)  # Cached catalog, reloaded only when the file changes
+
+CUSTOMER_FILE = "Customers.txt"
+accounts = AccountStore(CUSTOMER_FILE)  # Customer accounts with salted password hashes
+
+# Order IDs: 8 characters of milliseconds since 2024, 2 of process tag, 2 of sequence number
+ORDER_NODE_FILE = "Order.node"  # Next process tag to hand out, so processes running together never share one
+ORDER_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32, sorts in numeric order
+ORDER_ID_EPOCH_MS = 1704067200000  # 2024-01-01 00:00 UTC
+ORDER_ID_LENGTH = 12
+order_id_lock = threading.Lock()
+order_id_state = {"pid": None, "node": 0, "ms": 0, "sequence": 0}
 
-# Generate a unique 8-character Order ID
+def use_storage(storage):
+    """Points accounts, the catalog, orders, dish reviews and stock at a storage backend from Storage.open_storage()."""
+    global accounts, catalog, customer_orders, dish_reviews, inventory
+    accounts = storage.account_store()
+    catalog = ProductCatalog(PRODUCT_FILE, storage.catalog_store(PRODUCT_FILE))
+    customer_orders = storage.customer_orders()
+    dish_reviews = storage.dish_reviews()
+    inventory = storage.inventory()
+
+def _encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ORDER_ID_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+def _order_id_floor(moment):
+    """Returns the smallest order ID that could have been generated at the given datetime."""
+    ms = max(0, int(moment.timestamp() * 1000) - ORDER_ID_EPOCH_MS)
+    return _encode_base32(ms, 8) + "0000"
+
+def _claim_order_node():
+    """Takes the next process tag from Order.node under its file lock."""
+    with locked(ORDER_NODE_FILE):
+        try:
+            with open(ORDER_NODE_FILE) as file:
+                node = int(file.read().strip() or 0) % (32 * 32)
+        except (FileNotFoundError, ValueError):
+            node = 0
+        with open(ORDER_NODE_FILE, "w") as file:
+            file.write(f"{node + 1}\n")
+    return node
+
+# Generate a unique 12-character Order ID
 def generate_order_id():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))  #provided by Python, is mean uppercase letters
+    """Returns an order ID that is unique and sorts after every ID this process generated before."""
+    with order_id_lock:
+        state = order_id_state
+        if state["pid"] != os.getpid():  # New process (or forked child): claim a fresh process tag
+            state["pid"] = os.getpid()
+            state["node"] = _claim_order_node()
+
+        ms = int(time.time() * 1000) - ORDER_ID_EPOCH_MS
+        if ms <= state["ms"]:
+            # Same millisecond (or the clock went back): count up, borrowing the next millisecond if full
+            ms = state["ms"]
+            state["sequence"] += 1
+            if state["sequence"] == 32 * 32:
+                ms += 1
+                state["sequence"] = 0
+        else:
+            state["sequence"] = 0
+        state["ms"] = ms
+        return (_encode_base32(ms, 8) + _encode_base32(state["node"], 2)
+                + _encode_base32(state["sequence"], 2))
 
 # 1. Customer Menu
 def customer_menu():
     print("Welcome to our Customer System")
+    session = carts.new_session()  # This customer's cart, kept apart from every other session
 
     while True:
         print("\nCustomer Menu")  # \n it is used to go next line
@@ -27,7 +113,7 @@ def customer_menu():
         elif choice == '2':
             product_browsing()
         elif choice == '3':
-            cart_management()
+            cart_management(session)
         elif choice == '4':
             order_tracking()
         elif choice == '5':
@@ -66,9 +152,10 @@ def create_account():
         print("Username and password cannot be empty. Please try again.")
         return
 
-    with open("Customers.txt", "a") as file:
-        file.write(f"{username},{password}\n")
-    print("Account created successfully.")
+    if accounts.create(username, password):
+        print("Account created successfully.")
+    else:
+        print(f"Username '{username}' is already taken. Please choose another.")
 
 
 def login():
@@ -76,118 +163,214 @@ def login():
     username = input("Enter username: ").strip()
     password = input("Enter password: ").strip()
 
-    try:
-        with open("Customers.txt", "r") as file:
-            accounts = file.readlines()
-            for account in accounts:
-                if ',' not in account or not account.strip():
-                    continue
-                saved_username, saved_password = account.strip().split(",", 1) #The 1 in split(",", 1) means splitting only once
-                if username == saved_username:
-                    if password == saved_password:
-                        print("Login successful!")
-                        return
-                    else:
-                        print("Incorrect password. Please try again.")
-                        return
-            print("Username not found. Please create an account first.")
-    except FileNotFoundError:
+    if not os.path.exists(accounts.file_name):
         print("No accounts found. Please create an account first.")
+        return
+
+    result = accounts.verify(username, password)
+    if result is None:
+        print("Username not found. Please create an account first.")
+    elif result:
+        print("Login successful!")
+    else:
+        print("Incorrect password. Please try again.")
 
 
 # 3. Product Browsing
 def product_browsing():
     print("\nProduct Menu")
     try:
-        with open("Product Menu.txt", "r") as file: #"r" mean is just read, cannot modify
-            products = file.readlines()
-            if products:
-                print("Available Products:")
-                for product in products:
-                     print(product.strip())
-            else:
-                     print("No products available.")
-
+        print(catalog.menu_text())
     except FileNotFoundError:
        print("Product menu file not found. Please contact support.")
 
 # 4. Cart Management
-valid_item_codes = [
-    "B01", "B02", "B03", "B04", "B05", "B06", "B07",
-    "F01", "F02", "F03",
-    "P01", "P02", "P03", "P04", "P05", "P06"
-]
 
-def cart_management():
+def is_valid_item(item):
+    """Checks an item code against the cached product catalog."""
+    try:
+        return catalog.is_valid(item)
+    except FileNotFoundError:
+        print("Product menu file not found. Please contact support.")
+        return False
+
+def _read_quantity(prompt):
+    """Reads a whole-number quantity; a blank answer means 1. Returns None if the answer is invalid."""
+    answer = input(prompt).strip()
+    if not answer:
+        return 1
+    if not answer.isdigit():
+        print("Quantity must be a whole number.")
+        return None
+    return int(answer)
+
+def cart_management(session):
     print("\nCart Management")
     while True:
         print("1.Add Item")
         print("2.Remove Item")
-        print("3.View Cart")
-        print("4.Checkout")
-        print("5.Exit Cart Management")
+        print("3.Change Quantity")
+        print("4.View Cart")
+        print("5.Checkout")
+        print("6.Exit Cart Management")
 
-        choice = input("Choose an option (1-5): ")
+        choice = input("Choose an option (1-6): ")
         if choice == '1':
             item = input("Enter item code to add: ").strip()
             if not item:
                 print("Item code cannot be empty.")
-            elif item in cart:
-                print(f"'{item}' is already in the cart.")
-            elif item not in valid_item_codes:
+            elif not is_valid_item(item):
                 print(f"'{item}' is an invalid item code. Please enter a valid code.")
             else:
-                cart.append(item)
-                print(f"'{item}' has been added to the cart.")
+                quantity = _read_quantity("Enter quantity (default 1): ")
+                if quantity == 0:
+                    print("Quantity must be at least 1.")
+                elif quantity is not None:
+                    total = carts.add(session, item, quantity)
+                    print(f"'{item}' has been added to the cart (quantity {total}).")
         elif choice == '2':
             item = input("Enter item code to remove: ").strip()
-            if item in cart:
-                cart.remove(item)
+            if carts.remove(session, item) is not None:
                 print(f"'{item}' has been removed from the cart.")
             else:
                 print("Item is not in the cart.")
         elif choice == '3':
-            print("\nYour Cart:", cart if cart else "Cart is empty.")
+            item = input("Enter item code: ").strip()
+            quantity = _read_quantity("Enter new quantity (0 removes the item): ")
+            if quantity is not None:
+                if carts.set_quantity(session, item, quantity):
+                    print(f"Quantity of '{item}' set to {quantity}.")
+                else:
+                    print("Item is not in the cart.")
         elif choice == '4':
-           if cart:
-               checkout()
+            cart = carts.get(session)
+            print("\nYour Cart:", ", ".join(f"{item} x{quantity}" for item, quantity in cart.items())
+                  if cart else "Cart is empty.")
+        elif choice == '5':
+           if carts.get(session):
+               checkout(session)
                break
            else:
                 print("Your Cart is empty,Pls add items before checking out.")
                 break
-        elif choice == '5':
+        elif choice == '6':
             print("Exiting Cart Management.")
             break
         else:
             print("Invalid choice. Please try again.")
 
 #Checkout: Save order details
-def checkout():
+def checkout(session):
     customer_name = input("Enter your name: ").strip()
-    order_id = generate_order_id()
 
+    cart = carts.take(session)  # Only this session's cart is cleared
     try:
-        with open("Order.txt", "a") as file:
-            file.write(f"{order_id} | {customer_name} | {', '.join(cart)} | Pending\n")
+        order_id = place_order(customer_name, list(Counter(cart).elements()))
+        if order_id is None:
+            carts.restore(session, cart)  # Let the customer adjust the cart
+            print("Sorry, some items in your cart are out of stock. Your order was not placed.")
+            return
         print(f"Order placed successfully! Your Order ID is: {order_id}")
     except Exception as e:
+        carts.restore(session, cart)  # The order was not placed; keep the cart for a retry
         print(f"Failed to save the order: {e}")
-    cart.clear()  # Clear the cart after checkout
+
+def _index_written_orders(records, offsets):
+    """Indexes a batch of orders right after the writer appended it to Order.txt, still under its lock."""
+    order_index.add({record.split(" | ", 1)[0]: offset for record, offset in zip(records, offsets)},
+                    offsets[0], offsets[-1] + len(records[-1].encode()))
+
+# Shared writers: each batches its records and appends them under a cross-process file lock.
+# Every order waits for its own write, so orders are not held back to fill a batch; orders that
+# arrive together are still written together.
+order_writer = BatchedWriter(ORDER_FILE, max_delay_ms=0, on_flush=_index_written_orders)
+feedback_writer = BatchedWriter("Feedback.txt")
+
+def place_order(customer_name, items):
+    """Writes an order to Order.txt (indexed as it is written) and returns its order ID once it is there.
+
+    Returns None without placing the order if the inventory cannot supply every item.
+    A failed write raises and gives the reserved stock back.
+    """
+    reservation_id = None
+    if inventory is not None:
+        reservation_id = inventory.reserve(Counter(items))
+        if reservation_id is None:
+            return None
+
+    try:
+        order_id = generate_order_id()
+        while order_exists(order_id):  # Only after 1024 processes share the tags; never hand out a used ID
+            order_id = generate_order_id()
+        if customer_orders is not None:
+            customer_orders.add(order_id, customer_name, items)
+        else:
+            order_writer.write(f"{order_id} | {customer_name} | {', '.join(items)} | Pending\n").result()
+    except Exception:
+        if reservation_id is not None:
+            inventory.release(reservation_id)
+        raise
+    if reservation_id is not None:
+        inventory.commit(reservation_id)
+    return order_id
+
+def load_order_index():
+    """Brings the order index up to date with Order.txt and returns it."""
+    order_index.ensure_current()
+    return order_index
+
+def order_exists(order_id):
+    """Returns True if an order with this ID has been stored, by this or any other process."""
+    if customer_orders is not None:
+        return customer_orders.find(order_id) is not None
+    return order_index.find(order_id) is not None
+
+def _read_order_line(data, offset):
+    end = data.find(b"\n", offset)
+    return data[offset:end if end != -1 else len(data)].decode()
+
+def find_order(order_id):
+    """Returns the Order.txt line for an exact order ID, or None if there is no such order."""
+    if customer_orders is not None:
+        return customer_orders.find(order_id)
+    order_writer.flush()  # Make this process's own recent orders visible
+    for exclusive in (False, True):  # A miss is checked again under the writers' lock
+        offset = order_index.find(order_id, exclusive)
+        if offset is not None:
+            with open(ORDER_FILE, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    line = _read_order_line(data, offset)
+            if line.split(" | ", 1)[0].strip() == order_id:
+                return line
+    return None
+
+def orders_between(start, end):
+    """Returns the order lines placed in [start, end), located by binary search over the sorted index."""
+    if customer_orders is not None:
+        return customer_orders.between(_order_id_floor(start), _order_id_floor(end))
+    order_writer.flush()
+    offsets = order_index.between(_order_id_floor(start), _order_id_floor(end), ORDER_ID_LENGTH)
+    if not offsets:
+        return []
+
+    with open(ORDER_FILE, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return [_read_order_line(data, offset) for offset in offsets]
 
 # 5. Order Tracking
 def order_tracking():
     print("\nOrder Tracking")
     order_id = input("Enter your Order ID to track: ").strip()
-    try:
-        with open("Order.txt", "r") as file:
-            orders = file.readlines()
-            for line in orders:
-                if line.startswith(order_id):  #Is to check whether the user starts with order id
-                    print(f"Order Details: {line.strip()}")
-                    return
-        print("Order not found. Please check your Order ID.")
-    except FileNotFoundError:
+    order_writer.flush()
+    if customer_orders is None and not os.path.exists(ORDER_FILE):
         print("Order file not found. Please contact support.")
+        return
+
+    line = find_order(order_id)  #Only an exact Order ID matches, not a prefix of one
+    if line:
+        print(f"Order Details: {line.strip()}")
+    else:
+        print("Order not found. Please check your Order ID.")
 
 
 # 6. Dish Review
@@ -197,11 +380,24 @@ def dish_review():
     dish = input("Enter your dish name: ").strip()
     review = input("Enter your feedback: ").strip()
 
-    with open("Feedback.txt", "a") as file:
-        file.write(f"{username},{dish},{review}\n")
+    if dish_reviews is not None:
+        dish_reviews.add(username, dish, review)
+    else:
+        try:
+            feedback_writer.write(f"{username},{dish},{review}\n").result()
+        except OSError as e:
+            print(f"Failed to save your feedback: {e}")
+            return
     print("Thank you for your feedback :)")
 
 
+# Timed while metrics are enabled (see Metrics.py)
+instrument(sys.modules[__name__], "create_account", "login", "checkout", "place_order", "find_order",
+           "orders_between", "load_order_index", prefix="Main")
+
+
 # Run
 if __name__ == "__main__":
+   enable_from_env()  # Latency metrics if $COFFEEHOUSE_METRICS or $COFFEEHOUSE_METRICS_PORT is set
+   use_storage(open_storage())  # Flat files, or the SQLite database named by $COFFEEHOUSE_DB
    customer_menu()
@@ -1,23 +1,44 @@
 import hashlib
+import secrets
+import time
 
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from FeedbackAnalytics import FeedbackAnalytics
+from Inventory import InventoryEngine
+from Ledger import Ledger, format_cents, to_cents
+from Metrics import enable_from_env, instrument
+from OrderStore import OrderStore
+from Storage import open_storage
 
 class Manager:
-    def __init__(self):
+    def __init__(self, session_ttl=900, max_sessions=1000, order_store=None, inventory=None, ledger=None,
+                 dish_reviews=None):
         # System administration data
         self.users = {}  # Dictionary to store user accounts with hashed passwords
 
+        # Session data
+        self.sessions = OrderedDict()  # Token -> (username, expiry time), least recently used first
+        self.user_sessions = {}  # Username -> set of that user's tokens, for revocation
+        self.session_ttl = session_ttl  # Seconds a session stays valid after its last use
+        self.max_sessions = max_sessions  # Oldest sessions are evicted beyond this many
+
         # Order management data
-        self.orders = {}  # Dictionary to store orders, by order ID
+        self.order_store = order_store or OrderStore()  # Order log with an index by status
+        self.orders = self.order_store.orders  # Dictionary to store orders, by order ID
 
         # Financial management data
-        self.finances = {'income': 0, 'expenses': 0}  # Track income and expenses
+        self.ledger = ledger or Ledger()  # Timestamped income and expenses in cents, shared with the cashier
 
         # Inventory data
-        self.inventory = {}  # Dictionary to store inventory items
+        self.inventory_engine = inventory or InventoryEngine()  # Thread-safe stock shared with checkouts
+        self.inventory = self.inventory_engine.stock  # Dictionary to store inventory items
 
         # Customer feedback data
         self.feedback = []  # List to store customer feedback
+        self.feedback_analytics = FeedbackAnalytics()  # Search and per-dish stats over all feedback
+        self.dish_reviews = dish_reviews  # Storage backend's dish review table, or None to read Feedback.txt
 
     # Utility method for password hashing
     def _hash_password(self, password):
@@ -41,6 +62,7 @@ class Manager:
         """Removes a user if they exist."""
         if username in self.users:
             del self.users[username]
+            self.revoke_user_sessions(username)
             print(f"User '{username}' removed.")
         else:
             print("User not found.")
@@ -59,6 +81,54 @@ class Manager:
         print("Incorrect username or password.")
         return False
 
+    def login(self, username, password):
+        """Verifies credentials once and returns a session token, or None if they are wrong."""
+        if not self.verify_credentials(username, password):
+            return None
+
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = (username, time.monotonic() + self.session_ttl)
+        self.user_sessions.setdefault(username, set()).add(token)
+        while len(self.sessions) > self.max_sessions:
+            self._drop_session(next(iter(self.sessions)))
+        return token
+
+    def validate_session(self, token):
+        """Returns the username for a live session token, or None if it is unknown or expired."""
+        session = self.sessions.get(token)
+        if session is None:
+            return None
+
+        username, expiry = session
+        now = time.monotonic()
+        if now >= expiry:
+            self._drop_session(token)
+            return None
+
+        # Sliding expiry: each use extends the session and marks it recently used
+        self.sessions[token] = (username, now + self.session_ttl)
+        self.sessions.move_to_end(token)
+        return username
+
+    def logout(self, token):
+        """Ends a session."""
+        if token in self.sessions:
+            self._drop_session(token)
+
+    def revoke_user_sessions(self, username):
+        """Ends every session belonging to a user."""
+        for token in self.user_sessions.pop(username, set()):
+            self.sessions.pop(token, None)
+
+    def _drop_session(self, token):
+        """Removes a token from both session dictionaries."""
+        username, _ = self.sessions.pop(token)
+        tokens = self.user_sessions.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.user_sessions[username]
+
     # 2. Order Management
     def add_order(self, order_id, details):
         """Adds a new order if it doesn't already exist and validates the details."""
@@ -74,7 +144,7 @@ class Manager:
             print("Invalid order details. Please provide a dictionary with 'status' and 'items'.")
             return
 
-        self.orders[order_id] = details
+        self.order_store.add(order_id, details)
         print(f"Order '{order_id}' added with details: {details}")
 
     def update_order_status(self, order_id, status):
@@ -85,88 +155,104 @@ class Manager:
 
         if order_id in self.orders:
             if "status" in self.orders[order_id]:
-                self.orders[order_id]["status"] = status
+                self.order_store.update_status(order_id, status)
                 print(f"Order '{order_id}' updated successfully. New status: '{status}'.")
             else:
                 print(f"Order '{order_id}' does not have a 'status' field.")
         else:
             print(f"Order '{order_id}' not found. Unable to update status.")
 
+    def orders_by_status(self, status):
+        """Returns the IDs of all orders in a status (e.g. 'Pending'), oldest first."""
+        return self.order_store.with_status(status)
+
+    def import_customer_orders(self, order_file="Order.txt"):
+        """Imports the orders customers placed at checkout since the last import."""
+        added = self.order_store.ingest_customer_orders(order_file)
+        print(f"Imported {added} new customer order(s).")
+        return added
+
     # 3. Financial Management
-    def add_income(self, amount):
-        """Adds income to the finances if the amount is valid."""
-        if not isinstance(amount, (int, float)) or amount <= 0:
+    def add_income(self, amount, timestamp=None):
+        """Posts income to the ledger if the amount is valid."""
+        if not isinstance(amount, (int, float)) or to_cents(amount) <= 0:
             print("Error: Income amount must be a positive number.")
             return
 
-        self.finances['income'] += amount
-        print(f"Income updated. Total income: {self.finances['income']}.")
+        self.ledger.post("income", to_cents(amount), timestamp)
+        print(f"Income updated. Total income: RM{format_cents(self.ledger.totals['income'])}.")
 
-    def add_expense(self, amount):
-        """Adds an expense to the finances if the amount is valid."""
-        if not isinstance(amount, (int, float)) or amount <= 0:
+    def add_expense(self, amount, timestamp=None):
+        """Posts an expense to the ledger if the amount is valid."""
+        if not isinstance(amount, (int, float)) or to_cents(amount) <= 0:
             print("Error: Expense amount must be a positive number.")
             return
 
-        self.finances['expenses'] += amount
-        print(f"Expenses updated. Total expenses: {self.finances['expenses']}.")
+        self.ledger.post("expense", to_cents(amount), timestamp)
+        print(f"Expenses updated. Total expenses: RM{format_cents(self.ledger.totals['expense'])}.")
 
-    def check_profitability(self):
-        """Calculates and prints the profitability."""
-        profit = self.finances['income'] - self.finances['expenses']
-        print(f"Profitability: {profit}")
+    def check_profitability(self, start=None, end=None):
+        """Calculates and prints the profit in cents for start <= time < end (all time by default)."""
+        self.ledger.refresh()  # Pick up sales the cashier posted since the last check
+        totals = self.ledger.totals_between(start, end)
+        profit = totals["income"] - totals["expense"]
+        print(f"Income: RM{format_cents(totals['income'])}, Expenses: RM{format_cents(totals['expense'])}")
+        print(f"Profitability: RM{format_cents(profit)}")
         return profit
 
-    def add_inventory_item(self, item_name, quantity):
-        """Adds a new inventory item if the name and quantity are valid."""
-        if not item_name.strip():
-            print("Error: Item name cannot be empty.")
+    def add_inventory_item(self, product_id, quantity):
+        """Starts stocking a product if the product ID and quantity are valid."""
+        if not product_id.strip():
+            print("Error: Product ID cannot be empty.")
             return
 
         if not isinstance(quantity, int) or quantity <= 0:
             print("Error: Quantity must be a positive integer.")
             return
 
-        if item_name in self.inventory:
-            print(f"Error: Item '{item_name}' already exists in the inventory.")
+        self.inventory_engine.refresh()  # Pick up stock the cashiers and customers took since the last check
+        if product_id in self.inventory:
+            print(f"Error: Product '{product_id}' already exists in the inventory.")
             update_choice = input("Do you want to update its quantity instead? (yes/no): ").strip().lower()
             if update_choice == "yes":
-                new_quantity = int(input(f"Enter the additional quantity for '{item_name}': "))
-                self.inventory[item_name] += new_quantity  # Directly update the inventory
-                print(f"Inventory updated for '{item_name}': {self.inventory[item_name]}.")
+                new_quantity = int(input(f"Enter the additional quantity for '{product_id}': "))
+                self.inventory_engine.add_quantity(product_id, new_quantity)
+                print(f"Inventory updated for '{product_id}': {self.inventory[product_id]}.")
             else:
-                print(f"'{item_name}' was not added to the inventory.")
+                print(f"'{product_id}' was not added to the inventory.")
         else:
-            self.inventory[item_name] = quantity
-            print(f"Added '{item_name}' to inventory with quantity {quantity}.")
+            self.inventory_engine.set_quantity(product_id, quantity)
+            print(f"Added '{product_id}' to inventory with quantity {quantity}.")
 
-    def update_inventory(self, item_name, quantity):
-        """Updates the quantity of an existing inventory item."""
-        if not item_name.strip():
-            print("Error: Item name cannot be empty.")
+    def update_inventory(self, product_id, quantity):
+        """Updates the stocked quantity of a product."""
+        if not product_id.strip():
+            print("Error: Product ID cannot be empty.")
             return
 
         if not isinstance(quantity, int) or quantity <= 0:
             print("Error: Quantity must be a positive integer.")
             return
 
-        if item_name in self.inventory:
-            self.inventory[item_name] = quantity
-            print(f"Inventory updated for '{item_name}': {self.inventory[item_name]}.")
+        self.inventory_engine.refresh()
+        if product_id in self.inventory:
+            self.inventory_engine.set_quantity(product_id, quantity)
+            print(f"Inventory updated for '{product_id}': {self.inventory[product_id]}.")
         else:
-            print(f"Error: Item '{item_name}' not found in inventory.")
+            print(f"Error: Product '{product_id}' not found in inventory.")
 
-    def remove_inventory_item(self, item_name):
-        """Removes an item from the inventory."""
-        if not item_name.strip():
-            print("Error: Item name cannot be empty.")
+    def remove_inventory_item(self, product_id):
+        """Stops stocking a product."""
+        if not product_id.strip():
+            print("Error: Product ID cannot be empty.")
             return
 
-        if item_name in self.inventory:
-            del self.inventory[item_name]
-            print(f"'{item_name}' removed from inventory.")
+        self.inventory_engine.refresh()
+        if product_id in self.inventory:
+            self.inventory_engine.remove(product_id)
+            print(f"'{product_id}' removed from inventory.")
         else:
-            print(f"Error: Item '{item_name}' not found in inventory.")
+            print(f"Error: Product '{product_id}' not found in inventory.")
 
     # 5. Customer Feedback
 
@@ -182,8 +268,36 @@ class Manager:
 
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.feedback.append({"text": feedback_text, "timestamp": timestamp})
+        self.feedback_analytics.add_review(feedback_text, timestamp=timestamp)
         print("Feedback added successfully.")
 
+    def import_dish_reviews(self, feedback_file="Feedback.txt"):
+        """Streams new customer dish reviews into the feedback analytics."""
+        if self.dish_reviews is not None:
+            added = self.feedback_analytics.ingest_dish_reviews(self.dish_reviews)
+        else:
+            added = self.feedback_analytics.ingest_feedback_file(feedback_file)
+        print(f"Imported {added} new dish review(s).")
+        return added
+
+    def search_feedback(self, query, limit=20):
+        """Displays the newest feedback and reviews containing every word of the query."""
+        matches = self.feedback_analytics.search(query, limit)
+        if not matches:
+            print(f"No feedback mentions '{query}'.")
+        for review in matches:
+            print(_format_review(review))
+        return matches
+
+    def view_dish_reviews(self, dish, count=5):
+        """Displays the review count and newest reviews of a dish."""
+        total = self.feedback_analytics.dish_counts.get(dish, 0)
+        print(f"\n'{dish}' has {total} review(s).")
+        reviews = self.feedback_analytics.latest_for_dish(dish, count)
+        for review in reviews:
+            print(_format_review(review))
+        return reviews
+
     def view_feedback(self):
         """Displays all feedback, showing timestamps for context."""
         if self.feedback:
@@ -194,8 +308,24 @@ class Manager:
             print("No feedback available.")
 
 
+def _format_review(review):
+    """Formats a feedback entry or dish review on one line."""
+    who = f"{review['username']} on {review['dish']}: " if review["dish"] else ""
+    when = f" (Added on {review['timestamp']})" if review["timestamp"] else ""
+    return f"- {who}{review['text']}{when}"
+
+
+# Timed while metrics are enabled (see Metrics.py)
+instrument(Manager, "login", "validate_session", "add_order", "update_order_status", "orders_by_status",
+           "import_customer_orders", "add_income", "add_expense", "check_profitability", "update_inventory",
+           "add_feedback", "import_dish_reviews", "search_feedback")
+
+
 def main():
-    manager = Manager()
+    enable_from_env()  # Latency metrics if $COFFEEHOUSE_METRICS or $COFFEEHOUSE_METRICS_PORT is set
+    storage = open_storage()  # Flat files, or the SQLite database named by $COFFEEHOUSE_DB
+    manager = Manager(order_store=storage.order_store(), inventory=storage.inventory(), ledger=storage.ledger(),
+                      dish_reviews=storage.dish_reviews())
 
     # Add a sample user for testing login functionality
     manager.add_user("MsImpeccable", "Isha181901")
@@ -206,8 +336,9 @@ def main():
         username = input("Enter username: ")
         password = input("Enter password: ")
 
-        # Verify credentials
-        if manager.verify_credentials(username, password):
+        # Verify credentials once; the session token authorizes everything after that
+        token = manager.login(username, password)
+        if token:
             print("Login successful!\n")
             # Once logged in, enter the management menu
             while True:
@@ -220,6 +351,10 @@ def main():
                 print("6. Logout")
                 choice = input("Please select an option (1-6): ")
 
+                if choice != "6" and manager.validate_session(token) is None:
+                    print("Your session has expired or was revoked. Please log in again.")
+                    break
+
                 if choice == "1":
                     print("\n-- System Administration --")
                     sub_choice = input("1. Add User\n2. Remove User\nSelect option (1-2): ")
@@ -233,7 +368,8 @@ def main():
 
                 elif choice == "2":
                     print("\n-- Order Management --")
-                    sub_choice = input("1. Add Order\n2. Update Order Status\nSelect option (1-2): ")
+                    sub_choice = input("1. Add Order\n2. Update Order Status\n3. View Orders by Status\n"
+                                       "4. Import Customer Orders\nSelect option (1-4): ")
                     if sub_choice == "1":
                         order_id = input("Enter order ID: ")
                         status = input("Enter order status: ")
@@ -243,6 +379,16 @@ def main():
                         order_id = input("Enter order ID to update: ")
                         status = input("Enter new status: ")
                         manager.update_order_status(order_id, status)
+                    elif sub_choice == "3":
+                        status = input("Enter status (e.g., Pending): ")
+                        order_ids = manager.orders_by_status(status)
+                        if order_ids:
+                            for order_id in order_ids:
+                                print(f"{order_id}: {manager.orders[order_id]['items']}")
+                        else:
+                            print(f"No orders with status '{status}'.")
+                    elif sub_choice == "4":
+                        manager.import_customer_orders()
 
                 elif choice == "3":
                     print("\n-- Financial Management --")
@@ -254,36 +400,55 @@ def main():
                         amount = float(input("Enter expense amount: "))
                         manager.add_expense(amount)
                     elif sub_choice == "3":
-                        manager.check_profitability()
+                        try:
+                            start = input("Enter start date (YYYY-MM-DD, blank for all time): ").strip()
+                            end = input("Enter end date (YYYY-MM-DD, blank for no end): ").strip()
+                            start = datetime.strptime(start, "%Y-%m-%d") if start else None
+                            end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1) if end else None
+                        except ValueError:
+                            print("Error: Dates must look like 2024-01-31.")
+                        else:
+                            manager.check_profitability(start, end)
 
                 elif choice == "4":
                     print("\n-- Inventory Control --")
                     sub_choice = input("1. Add Inventory Item\n2. Update Inventory\n3. Remove Inventory Item\nSelect option (1-3): ")
                     if sub_choice == "1":
-                        item_name = input("Enter item name: ")
+                        product_id = input("Enter product ID: ").strip()
                         quantity = int(input("Enter quantity: "))
-                        manager.add_inventory_item(item_name, quantity)
+                        manager.add_inventory_item(product_id, quantity)
                     elif sub_choice == "2":
-                        item_name = input("Enter item name to update: ")
+                        product_id = input("Enter product ID to update: ").strip()
                         quantity = int(input("Enter new quantity: "))
-                        manager.update_inventory(item_name, quantity)
+                        manager.update_inventory(product_id, quantity)
                     elif sub_choice == "3":
-                        item_name = input("Enter item name to remove: ")
-                        manager.remove_inventory_item(item_name)
+                        product_id = input("Enter product ID to remove: ").strip()
+                        manager.remove_inventory_item(product_id)
 
                 elif choice == "5":
                     print("\n-- Customer Feedback --")
-                    sub_choice = input("1. Add Feedback\n2. View Feedback\nSelect option (1-2): ")
+                    sub_choice = input("1. Add Feedback\n2. View Feedback\n3. Search Feedback\n"
+                                       "4. View Dish Reviews\nSelect option (1-4): ")
                     if sub_choice == "1":
                         feedback_text = input("Enter feedback: ")
                         manager.add_feedback(feedback_text)
                     elif sub_choice == "2":
                         manager.view_feedback()
+                    elif sub_choice == "3":
+                        manager.import_dish_reviews()
+                        manager.search_feedback(input("Enter words to search for: "))
+                    elif sub_choice == "4":
+                        manager.import_dish_reviews()
+                        manager.view_dish_reviews(input("Enter dish name: ").strip())
 
                 elif choice == "6":
+                    manager.logout(token)
                     print("Logging out...")
                     logout_choice = input("\nWould you like to log back in? (yes/no): ").strip().lower()
                     if logout_choice != "yes":
+                        manager.order_store.close()
+                        manager.ledger.close()
+                        storage.close()
                         print("Exiting the system. Goodbye!")
                         return
                     else:
@@ -0,0 +1,190 @@
+import atexit
+import functools
+import math
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets: values below 2**PRECISION_BITS ns are exact; above that each power of two is split
+# into 2**(PRECISION_BITS - 1) buckets, so a recorded latency is off by at most 1/64 (about 1.6%)
+PRECISION_BITS = 7
+SUB_BUCKETS = 1 << PRECISION_BITS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+METRIC_PREFIX = "coffeehouse"
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}  # Bucket index -> number of values recorded in it
+        self.count = 0  # Calls recorded
+        self.errors = 0  # Calls that raised
+        self.total = 0  # Sum of all values in ns
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def record(self, value, failed=False):
+        """Records one latency in nanoseconds."""
+        if value < SUB_BUCKETS:
+            index = value
+        else:
+            shift = value.bit_length() - PRECISION_BITS
+            index = (shift << PRECISION_BITS) + (value >> shift)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.errors += failed
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Returns the latency in ns that q of the recorded calls did not exceed (0 if nothing was recorded)."""
+        with self._lock:
+            if not self.count:
+                return 0
+            rank = max(1, math.ceil(self.count * q))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    shift, mantissa = index >> PRECISION_BITS, index & (SUB_BUCKETS - 1)
+                    return min(((mantissa + 1) << shift) - 1, self.max)  # Top of the bucket, capped at the max
+            return self.max
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = False  # Operations are only wrapped (and timed) while this is True
+        self.histograms = {}  # Operation name -> LatencyHistogram
+        self._targets = []  # (owner, attribute name, operation name) registered by instrument()
+        self._originals = {}  # (owner, attribute name) -> attribute replaced while enabled
+        self._lock = threading.RLock()  # Reentrant so reset() can call disable() and enable()
+
+    def instrument(self, owner, *names, prefix=None):
+        """Registers functions of a module, or methods of a class, to be timed while metrics are enabled.
+
+        Operations are named prefix.name, the prefix defaulting to the owner's
+        name. Nothing is wrapped until enable(), so registered operations cost
+        nothing while metrics are off.
+        """
+        prefix = prefix or owner.__name__
+        with self._lock:
+            for name in names:
+                target = (owner, name, f"{prefix}.{name}")
+                self._targets.append(target)
+                if self.enabled:
+                    self._wrap(*target)
+
+    def _wrap(self, owner, name, operation):
+        original = vars(owner)[name]
+        histogram = self.histograms.setdefault(operation, LatencyHistogram())
+        clock = time.perf_counter_ns
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = clock()
+            failed = True
+            try:
+                result = original(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                histogram.record(clock() - start, failed)
+
+        self._originals[(owner, name)] = original
+        setattr(owner, name, timed)
+
+    def enable(self):
+        """Starts timing every registered operation."""
+        with self._lock:
+            if not self.enabled:
+                self.enabled = True
+                for target in self._targets:
+                    self._wrap(*target)
+
+    def disable(self):
+        """Puts the original functions back; recorded histograms are kept."""
+        with self._lock:
+            self.enabled = False
+            for (owner, name), original in self._originals.items():
+                setattr(owner, name, original)
+            self._originals.clear()
+
+    def reset(self):
+        """Clears every recorded value."""
+        with self._lock:
+            for operation in self.histograms:
+                self.histograms[operation] = LatencyHistogram()
+            if self.enabled:
+                self.disable()
+                self.enable()
+
+    def prometheus_text(self):
+        """Returns a snapshot of every operation in the Prometheus text exposition format."""
+        seconds = f"{METRIC_PREFIX}_operation_seconds"
+        errors = f"{METRIC_PREFIX}_operation_errors_total"
+        lines = [f"# HELP {seconds} Latency of instrumented operations.", f"# TYPE {seconds} summary"]
+        error_lines = [f"# HELP {errors} Instrumented operations that raised.", f"# TYPE {errors} counter"]
+        for operation, histogram in sorted(self.histograms.items()):
+            label = f'operation="{operation}"'
+            for q in QUANTILES:
+                lines.append(f'{seconds}{{{label},quantile="{q}"}} {histogram.quantile(q) / 1e9:.9f}')
+            lines.append(f"{seconds}_sum{{{label}}} {histogram.total / 1e9:.9f}")
+            lines.append(f"{seconds}_count{{{label}}} {histogram.count}")
+            error_lines.append(f"{errors}{{{label}}} {histogram.errors}")
+        return "\n".join(lines + error_lines) + "\n"
+
+    def write_prometheus(self, file_name):
+        """Atomically writes a snapshot to a file, e.g. for the node exporter's textfile collector."""
+        temp_name = file_name + ".tmp"
+        with open(temp_name, "w") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_name, file_name)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serves snapshots at http://host:port/metrics from a background thread; returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+registry = MetricsRegistry()  # Shared by every module in the process
+instrument = registry.instrument
+enable = registry.enable
+disable = registry.disable
+
+
+def enable_from_env():
+    """Enables metrics if $COFFEEHOUSE_METRICS names a file to write at exit or $COFFEEHOUSE_METRICS_PORT a port to serve on."""
+    file_name = os.environ.get("COFFEEHOUSE_METRICS")
+    port = os.environ.get("COFFEEHOUSE_METRICS_PORT")
+    if not file_name and not port:
+        return False
+    enable()
+    if file_name:
+        atexit.register(registry.write_prometheus, file_name)
+    if port:
+        registry.serve(int(port))
+    return True
@@ -0,0 +1,211 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+
+from RecordWriter import locked
+
+# File layout: header, then one (order ID padded with NUL bytes, byte offset in the order file)
+# entry per order, sorted by ID so lookups binary-search the mapped file without parsing it
+INDEX_MAGIC = b"ORDIDX01"
+INDEX_HEADER = struct.Struct("<8sQ")  # magic, bytes of the order file the entries cover
+ID_WIDTH = 12  # Longest order ID the index holds; legacy 8-character IDs are padded
+INDEX_ENTRY = struct.Struct(f"<{ID_WIDTH}sQ")
+
+
+def _key(order_id):
+    return order_id.encode().ljust(ID_WIDTH, b"\0")
+
+
+def _entry_key(entry):
+    return entry[:ID_WIDTH]
+
+
+# Sequence view of the entry IDs so bisect can search the mapped file directly.
+class _EntryKeys:
+    def __init__(self, data, count):
+        self.data, self.count = data, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        start = INDEX_HEADER.size + position * INDEX_ENTRY.size
+        return self.data[start:start + ID_WIDTH]
+
+
+class OrderIndex:
+    def __init__(self, file_name, order_file):
+        self.file_name = file_name  # The sorted binary index
+        self.order_file = order_file  # Text file of orders the offsets point into; its lock guards both files
+        self._checked = False  # True once this process made sure the index covers the whole order file
+        self._check_lock = threading.Lock()
+        self._map = None  # ((inode, size), mmap, entry count) of the index as last mapped
+
+    def _mapped(self):
+        """Returns (mapped index, entry count); the count is 0 if there is no index yet.
+
+        The mapping is reused until the file grows or is replaced, so a lookup
+        costs one stat and a binary search.
+        """
+        try:
+            stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return None, 0
+        mapped = self._map
+        if mapped is not None and mapped[0] == (stat.st_ino, stat.st_size):
+            return mapped[1], mapped[2]
+        if stat.st_size < INDEX_HEADER.size:
+            return None, 0
+        with open(self.file_name, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            identity = (os.fstat(file.fileno()).st_ino, len(data))
+        count = (len(data) - INDEX_HEADER.size) // INDEX_ENTRY.size if data[:len(INDEX_MAGIC)] == INDEX_MAGIC else 0
+        self._map = (identity, data, count)  # Replaced maps close once no reader still holds them
+        return data, count
+
+    def _covered(self):
+        """Returns how much of the order file the index covers, or None if there is no usable index."""
+        try:
+            with open(self.file_name, "rb") as file:
+                magic, covered = INDEX_HEADER.unpack(file.read(INDEX_HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return None
+        return covered if magic == INDEX_MAGIC else None
+
+    def add(self, offsets, start, end):
+        """Merges {order ID: offset} for the order file bytes [start, end) into the index.
+
+        The caller must hold the order file's lock. IDs longer than ID_WIDTH
+        cannot be indexed and are skipped.
+        """
+        self._merge([INDEX_ENTRY.pack(_key(order_id), offset) for order_id, offset in offsets.items()
+                     if len(order_id.encode()) <= ID_WIDTH], start, end)
+
+    def _merge(self, entries, start, end):
+        """Merges packed entries into the index; of two entries for one ID the later one wins.
+
+        New IDs are nearly always the largest, so usually only the few entries
+        after the first new ID are rewritten.
+        """
+        entries.sort(key=_entry_key)
+        covered = self._covered()
+        if covered is None:  # No index yet, or one in an older format: start an empty one
+            self._replace_with_empty()
+            covered = 0
+
+        with open(self.file_name, "r+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            count = (size - INDEX_HEADER.size) // INDEX_ENTRY.size
+            position = count
+            if entries and count:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    position = bisect.bisect_left(_EntryKeys(data, count), entries[0][:ID_WIDTH])
+                    at = INDEX_HEADER.size + position * INDEX_ENTRY.size
+                    tail = data[at:INDEX_HEADER.size + count * INDEX_ENTRY.size]
+                # Stable sort of two sorted runs keeps the tail's entry before a new one for the same ID
+                entries = sorted([tail[i:i + INDEX_ENTRY.size] for i in range(0, len(tail), INDEX_ENTRY.size)]
+                                 + entries, key=_entry_key)
+            file.seek(INDEX_HEADER.size + position * INDEX_ENTRY.size)
+            file.write(b"".join(entry for entry, following in zip(entries, entries[1:] + [b""])
+                                if following[:ID_WIDTH] != entry[:ID_WIDTH]))
+            if covered >= start:  # Nothing unindexed before this batch, so the index now reaches its end
+                covered = max(covered, end)
+            file.seek(0)
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, covered))
+
+    def _replace_with_empty(self):
+        """Swaps in an empty index; processes still reading the old file keep their mapping."""
+        temp_name = self.file_name + ".tmp"
+        with open(temp_name, "wb") as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, 0))
+        os.replace(temp_name, self.file_name)
+
+    def ensure_current(self):
+        """Indexes orders that reached the order file without reaching the index, e.g. after a crash.
+
+        Runs once per process; after that every writer keeps the index up to date itself.
+        """
+        if self._checked:
+            return
+        with self._check_lock:
+            if self._checked:
+                return
+            with locked(self.order_file):
+                self._catch_up()
+            self._checked = True
+
+    def _catch_up(self):
+        """Scans the order file from where the index stops; the caller must hold the order file's lock."""
+        try:
+            file = open(self.order_file, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            covered = self._covered()
+            if covered is None or covered > size:  # No index, an old format, or a replaced order file
+                self._replace_with_empty()
+                covered = 0
+            if covered == size:
+                return
+            file.seek(covered)
+            missing = []  # Packed entries, which take far less memory than a dict for a large backlog
+            offset = covered
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # Half-written last line: index it once it is complete
+                order_id = line.split(b" | ", 1)[0].strip()
+                if order_id and len(order_id) <= ID_WIDTH:
+                    missing.append(INDEX_ENTRY.pack(order_id.ljust(ID_WIDTH, b"\0"), offset))
+                offset += len(line)
+        self._merge(missing, covered, offset)
+
+    def find(self, order_id, exclusive=False):
+        """Returns the order file offset of an order ID, or None.
+
+        Lookups do not lock. A writer merging entries at the same moment can
+        hide one briefly, so callers that miss retry with exclusive=True, which
+        reads under the order file's lock.
+        """
+        self.ensure_current()
+        if exclusive:
+            with locked(self.order_file):
+                return self.find(order_id)
+        key = _key(order_id)
+        if len(key) > ID_WIDTH:
+            return None
+        data, count = self._mapped()
+        if not count:
+            return None
+        position = bisect.bisect_left(_EntryKeys(data, count), key)
+        if position == count:
+            return None
+        found, offset = INDEX_ENTRY.unpack_from(data, INDEX_HEADER.size + position * INDEX_ENTRY.size)
+        return offset if found == key else None
+
+    def between(self, first_id, last_id, length=ID_WIDTH):
+        """Returns the offsets of the orders with first_id <= ID < last_id and IDs of the given length, in ID order."""
+        self.ensure_current()
+        with locked(self.order_file):
+            data, count = self._mapped()
+            if not count:
+                return []
+            keys = _EntryKeys(data, count)
+            first, last = bisect.bisect_left(keys, _key(first_id)), bisect.bisect_left(keys, _key(last_id))
+            entries = data[INDEX_HEADER.size + first * INDEX_ENTRY.size:INDEX_HEADER.size + last * INDEX_ENTRY.size]
+        return [offset for order_id, offset in INDEX_ENTRY.iter_unpack(entries)
+                if len(order_id.rstrip(b"\0")) == length]
+
+    def __len__(self):
+        self.ensure_current()
+        return self._mapped()[1]
+
+    def __iter__(self):
+        """Yields every indexed order ID in ID order."""
+        self.ensure_current()
+        data, count = self._mapped()
+        for order_id, _ in INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:INDEX_HEADER.size + count * INDEX_ENTRY.size]
+                                                   if count else b""):
+            yield order_id.rstrip(b"\0").decode()
@@ -0,0 +1,150 @@
+import json
+import os
+
+
+class OrderStore:
+    def __init__(self, file_name=None):
+        self.file_name = file_name  # Append-only log of order changes; None keeps orders in memory only
+        self.orders = {}  # Order ID -> details with at least 'status' and 'items'
+        self.by_status = {}  # Status -> {order ID: None}, an insertion-ordered set per status
+        self.ingested_offset = 0  # How much of the customers' Order.txt has been imported
+        self._file = None
+
+        if self.file_name is not None:
+            self._replay()
+
+    def _replay(self):
+        """Rebuilds the orders and the status index from the log and cuts off a torn or corrupt tail.
+
+        Without the cut, the next change would be appended onto the damaged
+        line and skipped along with it on every later replay.
+        """
+        good_end = 0
+        try:
+            with open(self.file_name, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self._apply(change)
+                    good_end += len(line)
+                size = file.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return
+
+        if size > good_end:
+            print(f"Warning: discarding {size - good_end} damaged bytes at the end of '{self.file_name}'.")
+            with open(self.file_name, 'r+b') as file:
+                file.truncate(good_end)
+
+    def _apply(self, change):
+        """Applies one logged change to the in-memory state."""
+        if change['op'] == 'add':
+            self.orders[change['id']] = change['details']
+            self._index(change['id'], change['details']['status'])
+        elif change['op'] == 'status':
+            details = self.orders[change['id']]
+            self._unindex(change['id'], details['status'])
+            details['status'] = change['status']
+            self._index(change['id'], change['status'])
+        elif change['op'] == 'ingested':
+            self.ingested_offset = change['offset']
+
+    def _log(self, *changes):
+        """Appends changes to the log as one batch and applies them."""
+        if self.file_name is not None and changes:
+            self._write(changes)
+        for change in changes:
+            self._apply(change)
+
+    def _write(self, changes):
+        """Appends a batch of changes to the log file and fsyncs it, so a logged change survives a crash."""
+        if self._file is None:
+            self._file = open(self.file_name, 'a')
+        self._file.write("".join(json.dumps(change) + "\n" for change in changes))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _index(self, order_id, status):
+        self.by_status.setdefault(status, {})[order_id] = None
+
+    def _unindex(self, order_id, status):
+        same_status = self.by_status.get(status, {})
+        same_status.pop(order_id, None)
+        if not same_status:
+            self.by_status.pop(status, None)
+
+    def add(self, order_id, details):
+        """Stores a new order; returns False if the ID is already used."""
+        return self.add_many([(order_id, details)]) == 1
+
+    def add_many(self, orders, *changes):
+        """Stores (order ID, details) pairs whose IDs are not used yet, then any further changes, as one batch.
+
+        Returns how many orders were new.
+        """
+        new = {}
+        for order_id, details in orders:
+            if order_id not in self.orders and order_id not in new:
+                new[order_id] = details
+        self._log(*[{'op': 'add', 'id': order_id, 'details': details} for order_id, details in new.items()],
+                  *changes)
+        return len(new)
+
+    def update_status(self, order_id, status):
+        """Moves an order to a new status; returns False if the order does not exist."""
+        if order_id not in self.orders:
+            return False
+        self._log({'op': 'status', 'id': order_id, 'status': status})
+        return True
+
+    def with_status(self, status):
+        """Returns the IDs of the orders currently in a status, oldest first."""
+        return list(self.by_status.get(status, {}))
+
+    def ingest_customer_orders(self, order_file):
+        """Imports orders customers placed in Order.txt since the last import; returns how many were new."""
+        try:
+            with open(order_file, 'rb') as file:
+                file.seek(self.ingested_offset)
+                data = file.read()
+        except FileNotFoundError:
+            return 0
+
+        complete = data.rfind(b"\n") + 1  # Leave a half-written last line for the next import
+        if not complete:
+            return 0
+        orders = []
+        for line in data[:complete].decode().splitlines():
+            parts = [part.strip() for part in line.split(" | ")]
+            if len(parts) != 4 or not parts[0]:
+                continue
+            order_id, customer, items, status = parts
+            orders.append((order_id, {'status': status,
+                                      'items': [item.strip() for item in items.split(",") if item.strip()],
+                                      'customer': customer}))
+        # The new orders and the import position go to the log in one fsync'd batch
+        return self.add_many(orders, {'op': 'ingested', 'offset': self.ingested_offset + complete})
+
+    def compact(self):
+        """Rewrites the log as one entry per order through a temporary file and atomic rename."""
+        if self.file_name is None:
+            return
+        self.close()
+        temp_name = self.file_name + ".tmp"
+        with open(temp_name, 'w') as file:
+            for order_id, details in self.orders.items():
+                file.write(json.dumps({'op': 'add', 'id': order_id, 'details': details}) + "\n")
+            file.write(json.dumps({'op': 'ingested', 'offset': self.ingested_offset}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, self.file_name)
+
+    def close(self):
+        """Closes the log file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
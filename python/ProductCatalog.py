@@ -0,0 +1,46 @@
+from CatalogSnapshot import LazyProducts
+from CatalogStore import CatalogStore
+
+
+class ProductCatalog:
+    def __init__(self, file_name, store=None):
+        self.file_name = file_name  # Same catalog file (snapshot plus change log) CashierSystem uses
+        self.store = store or CatalogStore(file_name)  # Any catalog store; the SQLite one shares the database
+        self.products = []  # Products in catalog order
+        self.by_id = {}  # Product ID -> product
+        self.codes = frozenset()  # Valid item codes for cart validation
+        self._signature = None  # Store signature (e.g. mtime and size of the files) at the last load
+        self._menu_text = None  # Rendered menu, rebuilt lazily after a reload
+
+    def refresh(self):
+        """Reloads the catalog only if its files changed since the last load."""
+        signature = self.store.signature()
+        if signature[0] is None:
+            raise FileNotFoundError(self.file_name)
+        if signature != self._signature:
+            self.products = self.store.load()
+            if isinstance(self.products, LazyProducts):
+                self.by_id = self.codes = self.products  # Looks IDs up in the snapshot without decoding it all
+            else:
+                self.by_id = {product['id']: product for product in self.products}
+                self.codes = frozenset(self.by_id)
+            self._menu_text = None
+            self._signature = signature
+
+    def is_valid(self, code):
+        """Returns True if the item code is in the catalog."""
+        self.refresh()
+        return code in self.codes
+
+    def menu_text(self):
+        """Returns the rendered product menu, reusing it until the catalog changes."""
+        self.refresh()
+        if self._menu_text is None:
+            if self.products:
+                lines = ["Available Products:"]
+                lines.extend(f"{p['id']} | {p['name']} | {p['type']} | {p['details']} | RM{p['price']:g}"
+                             for p in self.products)
+                self._menu_text = "\n".join(lines)
+            else:
+                self._menu_text = "No products available."
+        return self._menu_text
@@ -0,0 +1,311 @@
+import bisect
+import re
+
+from collections import Counter
+
+# A word matching in the name counts most, then the type, then the details
+FIELD_WEIGHTS = (("name", 4), ("type", 2), ("details", 1))
+MAX_WEIGHT = 4
+EXACT_BONUS = 1  # Added when a query word is a whole catalog word rather than its beginning
+CACHED_RESULTS = 16  # Best products kept at every trie node; larger top-k are ranked from the postings
+SLOT_SET_DEPTH = 2  # Nodes this close to the root also keep, by field weight, every product below them
+GRAM_SIZE = 3
+MIN_SIMILARITY = 0.6  # How much a misspelled word must look like a catalog word (see similar())
+SORT_DIRECTLY = 64  # Tied results up to this many are sorted by name length directly
+SLOT_BITS = 32
+SLOT_MASK = (1 << SLOT_BITS) - 1
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Splits text into lowercase words."""
+    return WORD.findall(str(text).lower())
+
+
+def _grams(word, prefix=False):
+    """Returns the n-grams of a word padded with ^ and $; a prefix gets no end marker."""
+    padded = "^" + word + ("" if prefix else "$")
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+class _Node:
+    __slots__ = ("children", "best", "word", "slots")
+
+    def __init__(self, depth):
+        self.children = {}  # Next character -> node
+        self.best = []  # Sorted rank entries of the best products with a word starting here, at most CACHED_RESULTS
+        self.word = None  # The catalog word ending at this node, if any
+        self.slots = {} if depth <= SLOT_SET_DEPTH else None  # Field weight -> products with a word below here
+
+
+class ProductSearchIndex:
+    def __init__(self, products=()):
+        self.products = []  # Slot -> product, None once removed
+        self.words = []  # Slot -> {word: field weight} of the product, None once removed
+        self.slots = {}  # Product ID -> slot
+        self.ids = {}  # Lowercase product ID -> slot, so typing an exact ID finds it first
+        self.postings = {}  # Word -> {field weight: slots of the products with the word in such a field}
+        self.grams = {}  # N-gram -> words containing it, for typo-tolerant matches
+        self.root = _Node(0)  # Prefix trie over every word
+        self.name_lengths = {}  # Name length -> slots, to break ties between equally good matches
+        self.lengths = []  # Sorted keys of name_lengths
+        self.removed = 0  # Slots freed by removals, reclaimed by rebuilding once they pile up
+        for product in products:
+            self.add(product)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, product):
+        """Indexes one product; an already indexed ID is replaced."""
+        if product['id'] in self.slots:
+            self.remove(product['id'])
+        slot = len(self.products)
+        self.products.append(product)
+        self.slots[product['id']] = slot
+        self.ids[str(product['id']).lower()] = slot
+
+        words = {}
+        for field, weight in FIELD_WEIGHTS:
+            for word in tokenize(product.get(field, "")):
+                if weight > words.get(word, 0):
+                    words[word] = weight
+        self.words.append(words)
+
+        name_length = len(product.get('name', ""))
+        if name_length not in self.name_lengths:
+            self.name_lengths[name_length] = set()
+            bisect.insort(self.lengths, name_length)
+        self.name_lengths[name_length].add(slot)
+
+        for word, weight in words.items():
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = {}
+                for gram in _grams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+            postings.setdefault(weight, set()).add(slot)
+
+            # Rank entries sort best first: heavier field, shorter word, shorter name, catalog order
+            entry = ((((MAX_WEIGHT - weight) << 16 | min(len(word), 255) << 8 | min(name_length, 255))
+                      << SLOT_BITS) | slot)
+            node = self.root
+            for depth, char in enumerate(word, 1):
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node(depth)
+                node = child
+                if depth <= SLOT_SET_DEPTH:
+                    node.slots.setdefault(weight, set()).add(slot)
+                best = node.best
+                if len(best) < CACHED_RESULTS or entry < best[-1]:
+                    self._offer(best, entry)
+            node.word = word
+
+    @staticmethod
+    def _offer(best, entry):
+        """Puts a rank entry into a node's sorted cache, keeping one entry (the best) per product."""
+        slot = entry & SLOT_MASK
+        for i, other in enumerate(best):
+            if other & SLOT_MASK == slot:
+                if other <= entry:
+                    return
+                del best[i]
+                break
+        bisect.insort(best, entry)
+        if len(best) > CACHED_RESULTS:
+            best.pop()
+
+    def remove(self, product_id):
+        """Drops a product from the index; returns False if it is not indexed."""
+        slot = self.slots.pop(product_id, None)
+        if slot is None:
+            return False
+        self.ids.pop(str(product_id).lower(), None)
+        self.name_lengths[len(self.products[slot].get('name', ""))].discard(slot)
+        words = self.words[slot]
+        for word, weight in words.items():
+            self.postings[word][weight].discard(slot)
+        for prefix, weight in {(word[:depth], weight) for word, weight in words.items()
+                               for depth in range(1, min(len(word), SLOT_SET_DEPTH) + 1)}:
+            self._find(prefix).slots[weight].discard(slot)
+        self.products[slot] = self.words[slot] = None  # Trie caches skip the empty slot from now on
+        self.removed += 1
+        if self.removed > 1000 and self.removed > len(self.slots):
+            self.__init__([product for product in self.products if product is not None])
+        return True
+
+    def similar(self, token, prefix=False):
+        """Returns {catalog word: similarity} for words sharing enough n-grams with a possibly misspelled token.
+
+        Whole words are compared by the Dice coefficient of their n-grams. A
+        prefix is compared with the beginnings of words (the share of its
+        n-grams a word contains), so a half-typed word still matches.
+        """
+        grams = _grams(token, prefix)
+        if not grams:
+            return {}
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        similar = {}
+        for word, count in shared.items():
+            similarity = count / len(grams) if prefix else 2 * count / (len(grams) + len(word))
+            if similarity >= MIN_SIMILARITY:
+                similar[word] = similarity
+        return similar
+
+    def _find(self, token):
+        node = self.root
+        for char in token:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _subtree_words(self, node):
+        words = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.word is not None:
+                words.append(node.word)
+            stack.extend(node.children.values())
+        return words
+
+    def _classes(self, token, prefix):
+        """Returns {match value: [slot sets]} for one query word.
+
+        A whole catalog word is worth its field weight plus EXACT_BONUS and a
+        word the token begins (if it is a prefix, or has no exact match) its
+        field weight. Only when neither exists do n-gram look-alikes count, for
+        half their weight scaled by similarity.
+        """
+        classes = {}
+        postings = self.postings.get(token)
+        if postings:
+            for weight, slots in postings.items():
+                if slots:
+                    classes.setdefault(weight + EXACT_BONUS, []).append(slots)
+        if prefix or not classes:
+            node = self._find(token)
+            if node is not None:
+                if node.slots is not None:
+                    weighted = node.slots.items()
+                else:
+                    weighted = [item for word in self._subtree_words(node) for item in self.postings[word].items()]
+                for weight, slots in weighted:
+                    if slots:
+                        classes.setdefault(weight, []).append(slots)
+        if not classes:
+            for word, similarity in self.similar(token, prefix).items():
+                for weight, slots in self.postings[word].items():
+                    if slots:
+                        classes.setdefault(weight * similarity / 2, []).append(slots)
+        return classes
+
+    def _top(self, word_classes, limit, exclude=()):
+        """Returns the slots of the `limit` products matching every query word with the highest total value.
+
+        Works on whole sets of slots so the per-product work happens in C:
+        starting from the rarest word, products are grouped by their total
+        value so far and each group is intersected with the next word's
+        matches. Ties inside a group go to the shorter name, then catalog order.
+        """
+        sizes = [sum(len(slots) for sets in classes.values() for slots in sets) for classes in word_classes]
+        if not word_classes or not all(sizes):
+            return []
+        groups = None  # Total value -> products matching every word so far; None before the first word
+        order = sorted(range(len(word_classes)), key=sizes.__getitem__)
+        for i in order:
+            classes = word_classes[i]
+            matches = [(value, slots) for value in sorted(classes, reverse=True) for slots in classes[value]]
+            best_so_far = max(groups) if groups else 0
+            grouped = {}
+            matched = set()  # Products this word already matched at a higher value
+            for position, (value, slots) in enumerate(matches):
+                found = []
+                for total, group in (groups.items() if groups is not None else ((0, None),)):
+                    if group is None or group is slots:
+                        both = slots
+                    elif len(group) <= len(slots) and group <= slots:  # Fails fast; saves copying the group
+                        both = group
+                    else:
+                        both = group & slots
+                    if matched and both:
+                        both = both - matched
+                    if both:
+                        found.append((total + value, both))
+                for total, both in found:
+                    grouped[total] = grouped[total] | both if total in grouped else both
+                if position == len(matches) - 1:
+                    break
+                if i == order[-1]:
+                    # Last word: stop once `limit` products score more than any product still unmatched can reach
+                    reachable = best_so_far + matches[position + 1][0]
+                    if sum(len(group) for total, group in grouped.items() if total > reachable) >= limit:
+                        break
+                for _, both in found:
+                    matched |= both
+            groups = grouped
+            if not groups:
+                return []
+
+        ranked = []
+        for total in sorted(groups, reverse=True):
+            group = groups[total]
+            if len(group) <= SORT_DIRECTLY:
+                ranked.extend(slot for slot in sorted(
+                    group, key=lambda slot: (len(self.products[slot].get('name', "")), slot)) if slot not in exclude)
+            else:
+                for length in self.lengths:
+                    ranked.extend(slot for slot in sorted(group & self.name_lengths[length]) if slot not in exclude)
+                    if len(ranked) >= limit:
+                        break
+            if len(ranked) >= limit:
+                break
+        return ranked[:limit]
+
+    def _complete(self, token, limit):
+        """Top products for a single word, answered from the trie node's cache when possible."""
+        slots = []
+        exact_id = self.ids.get(token)
+        if exact_id is not None:
+            slots.append(exact_id)
+
+        node = self._find(token)
+        if node is not None:
+            live = [entry & SLOT_MASK for entry in node.best if self.products[entry & SLOT_MASK] is not None]
+            if len(node.best) < CACHED_RESULTS or len(live) >= limit + len(slots):
+                slots.extend(slot for slot in live if slot != exact_id)
+            else:
+                # The cache lost entries to removals or is too short for this limit
+                slots.extend(self._top([self._classes(token, True)], limit - len(slots), slots))
+        del slots[limit:]
+
+        if len(slots) < limit:  # Fill up with typo-tolerant matches
+            classes = {}
+            for word, similarity in self.similar(token, prefix=True).items():
+                if not word.startswith(token):
+                    for weight, matches in self.postings[word].items():
+                        if matches:
+                            classes.setdefault(weight * similarity, []).append(matches)
+            slots.extend(self._top([classes], limit - len(slots), slots))
+        return slots
+
+    def search(self, query, limit=10):
+        """Returns up to `limit` products matching every word of the query, best first.
+
+        The last word is treated as still being typed (a prefix) unless the
+        query ends with a space; misspelled words fall back to n-gram matches.
+        """
+        tokens = tokenize(query)
+        if not tokens or limit <= 0:
+            return []
+        if len(tokens) == 1:
+            slots = self._complete(tokens[0], limit)
+        else:
+            typing = not query[-1].isspace()
+            slots = self._top([self._classes(token, typing and position == len(tokens) - 1)
+                               for position, token in enumerate(tokens)], limit)
+        return [self.products[slot] for slot in slots]
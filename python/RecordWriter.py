@@ -0,0 +1,128 @@
+import atexit
+import contextlib
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+from Metrics import instrument
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def locked(file_name):
+    """Holds an exclusive lock on file_name (through a .lock file) that other processes respect too."""
+    with open(file_name + ".lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class BatchedWriter:
+    def __init__(self, file_name, max_batch=100, max_delay_ms=20, on_flush=None):
+        self.file_name = file_name  # Text file the records are appended to
+        self.max_batch = max_batch  # Write as soon as this many records are waiting
+        self.max_delay = max_delay_ms / 1000  # ...or once the oldest waiting record is this old
+        self.on_flush = on_flush  # Called as on_flush(records, offsets) while the file lock is held
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def write(self, record):
+        """Queues one record (a line ending in a newline) for the background writer.
+
+        Returns a Future that completes once the record's batch is in the file,
+        or fails with the error that kept it out, so callers can confirm a
+        record only after it was written.
+        """
+        self._ensure_started()
+        written = Future()
+        self._queue.put((record, written))
+        return written
+
+    def flush(self):
+        """Blocks until every record queued so far is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Writes whatever is still queued and stops the background writer."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Writer thread: gathers records into batches and appends each batch under the file lock."""
+        while True:
+            record = self._queue.get()
+            if record is None:
+                self._queue.task_done()
+                return
+
+            batch = [record]
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    record = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+
+            try:
+                self._write_batch([record for record, _ in batch])
+            except Exception as e:
+                for _, written in batch:
+                    written.set_exception(e)
+            else:
+                for _, written in batch:
+                    written.set_result(None)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, records):
+        """Appends a batch in one write and reports the byte offset of every record."""
+        data = [record.encode() for record in records]
+        with locked(self.file_name):
+            with open(self.file_name, "ab") as file:
+                offset = file.tell()
+                file.write(b"".join(data))
+            if self.on_flush is not None:
+                offsets = []
+                for encoded in data:
+                    offsets.append(offset)
+                    offset += len(encoded)
+                self.on_flush(records, offsets)
+
+
+# Timed while metrics are enabled (see Metrics.py)
+instrument(BatchedWriter, "flush", "_write_batch")
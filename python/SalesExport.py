@@ -0,0 +1,90 @@
+import csv
+import gzip
+import json
+import os
+
+from datetime import datetime
+
+FORMATS = ("csv", "jsonl")
+SALE_FIELDS = ("sale", "timestamp", "items", "products", "total")
+POPULARITY_FIELDS = ("product_id", "name", "units", "revenue")
+
+
+def export_file_name(base_name, kind, fmt="csv", compress=False):
+    """Returns the file name of one export, e.g. report_sales.csv.gz."""
+    return f"{base_name}_{kind}.{fmt}" + (".gz" if compress else "")
+
+
+def write_rows(file_name, fields, rows, fmt="csv", compress=False):
+    """Streams dict rows to a CSV or JSON Lines file, gzipped if asked; returns how many were written.
+
+    Rows are written as they are produced, through a temporary file that replaces
+    file_name only once the export is complete.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    temp_name = file_name + ".tmp"
+    opener = gzip.open if compress else open
+    count = 0
+    try:
+        with opener(temp_name, "wt", newline="", encoding="utf-8") as file:
+            if fmt == "csv":
+                writer = csv.writer(file)
+                writer.writerow(fields)
+                for row in rows:
+                    writer.writerow([row[field] for field in fields])
+                    count += 1
+            else:
+                for row in rows:
+                    file.write(json.dumps(row, separators=(",", ":")) + "\n")
+                    count += 1
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    return count
+
+
+def sale_rows(sales, units=None, revenue=None):
+    """Turns sales (logged sales or journal records) into export rows one at a time.
+
+    When units and revenue dicts are given, they are filled with per-product
+    totals on the way, so popularity needs no second pass over the sales.
+    """
+    for number, sale in enumerate(sales, 1):
+        timestamp = sale["timestamp"]
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        if units is not None:
+            prices = sale.get("prices") or [None] * len(sale["products"])
+            for pid, price in zip(sale["products"], prices):
+                units[pid] = units.get(pid, 0) + 1
+                revenue[pid] = revenue.get(pid, 0) + (price or 0)
+        yield {"sale": number, "timestamp": timestamp, "items": len(sale["products"]),
+               "products": " ".join(sale["products"]), "total": round(sale["total"], 2)}
+
+
+def popularity_rows(units, revenue, names):
+    """Yields one row per product sold, most units first."""
+    for pid in sorted(units, key=lambda pid: (-units[pid], pid)):
+        yield {"product_id": pid, "name": names.get(pid, ""), "units": units[pid],
+               "revenue": round(revenue.get(pid, 0), 2)}
+
+
+def export_sales(sales, base_name, names, fmt="csv", compress=False, units=None, revenue=None):
+    """Writes the sales detail and product popularity exports; returns (sales written, products written).
+
+    sales may be any iterable, including a generator over a persisted log. Pass
+    units/revenue to reuse running totals; otherwise they are gathered while the
+    detail is written. Memory stays bounded by the number of products.
+    """
+    if units is None:
+        units, revenue = {}, {}
+        rows = sale_rows(sales, units, revenue)
+    else:
+        rows = sale_rows(sales)
+    sale_count = write_rows(export_file_name(base_name, "sales", fmt, compress), SALE_FIELDS, rows, fmt, compress)
+    product_count = write_rows(export_file_name(base_name, "popularity", fmt, compress), POPULARITY_FIELDS,
+                               popularity_rows(units, revenue, names), fmt, compress)
+    return sale_count, product_count
@@ -0,0 +1,88 @@
+import bisect
+
+from array import array
+from collections import Counter
+from datetime import datetime
+
+from Ledger import to_cents
+
+
+class SalesHistory:
+    def __init__(self):
+        self.codes = []  # Product code of each interned ID
+        self.code_ids = {}  # Product code -> small integer ID
+        self.timestamps = array("d")  # POSIX time of each sale
+        self.totals = array("q")  # Total of each sale in cents
+        self.offsets = array("q", [0])  # Sale i's line items are items[offsets[i]:offsets[i + 1]]
+        self.items = array("I")  # Interned product ID of every line item, sale after sale
+        self.prices = array("i")  # Price of every line item in cents (up to RM21 million)
+        self.in_order = True  # False once a sale arrived with an earlier time than the one before
+
+    def _intern(self, code):
+        code_id = self.code_ids.get(code)
+        if code_id is None:
+            code_id = self.code_ids[code] = len(self.codes)
+            self.codes.append(code)
+        return code_id
+
+    def append(self, product_ids, prices, total, timestamp):
+        """Adds one sale; prices and total are in RM and stored as whole cents, rounded like the ledger."""
+        moment = timestamp.timestamp()
+        if self.timestamps and moment < self.timestamps[-1]:
+            self.in_order = False
+        self.timestamps.append(moment)
+        self.totals.append(to_cents(total))
+        self.items.extend(self._intern(code) for code in product_ids)
+        self.prices.extend(to_cents(price) for price in prices)
+        self.offsets.append(len(self.items))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        """Returns sale `index` in the same shape as the old per-sale dicts."""
+        if index < 0:
+            index += len(self)
+        first, last = self.offsets[index], self.offsets[index + 1]
+        return {"products": [self.codes[code_id] for code_id in self.items[first:last]],
+                "prices": [cents / 100 for cents in self.prices[first:last]],
+                "total": self.totals[index] / 100,
+                "timestamp": datetime.fromtimestamp(self.timestamps[index])}
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _range(self, start, end):
+        """Returns the sale indexes [first, last) with start <= time < end, by binary search on the times."""
+        first = 0 if start is None else bisect.bisect_left(self.timestamps, start.timestamp())
+        last = len(self) if end is None else bisect.bisect_left(self.timestamps, end.timestamp())
+        return first, max(first, last)
+
+    def summary(self, start=None, end=None):
+        """Returns (total cents, units by code, revenue cents by code) for start <= time < end."""
+        if not self.in_order:
+            return self._scan(start, end)
+        first, last = self._range(start, end)
+        lo, hi = self.offsets[first], self.offsets[last]
+        units = Counter(self.items[lo:hi])  # Counts in C, straight off the column
+        revenue = {}
+        for code_id, cents in zip(self.items[lo:hi], self.prices[lo:hi]):
+            revenue[code_id] = revenue.get(code_id, 0) + cents
+        codes = self.codes
+        return (sum(self.totals[first:last]), {codes[code_id]: count for code_id, count in units.items()},
+                {codes[code_id]: cents for code_id, cents in revenue.items()})
+
+    def _scan(self, start, end):
+        """Summary for sales logged out of time order: checks every sale's time."""
+        low = float("-inf") if start is None else start.timestamp()
+        high = float("inf") if end is None else end.timestamp()
+        total, units, revenue = 0, {}, {}
+        for index, moment in enumerate(self.timestamps):
+            if low <= moment < high:
+                total += self.totals[index]
+                for position in range(self.offsets[index], self.offsets[index + 1]):
+                    code = self.codes[self.items[position]]
+                    units[code] = units.get(code, 0) + 1
+                    revenue[code] = revenue.get(code, 0) + self.prices[position]
+        return total, units, revenue
@@ -0,0 +1,111 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+# Every record is stored as: payload length, CRC32 of the payload, JSON payload
+RECORD_HEADER = struct.Struct("<II")
+
+
+class SalesJournal:
+    def __init__(self, file_name, sync_every=100, sync_interval_ms=50):
+        self.file_name = file_name  # Journal file, created on first open
+        self.sync_every = sync_every  # fsync after this many records (0 = no count limit)
+        self.sync_interval = sync_interval_ms / 1000 if sync_interval_ms else None  # fsync at least this often
+        self._queue = queue.Queue()  # Records waiting for the writer thread
+        self._writer = None
+
+    def replay(self):
+        """Returns every intact record in the journal and cuts off a torn or corrupt tail."""
+        records = []
+        good_end = 0
+        try:
+            with open(self.file_name, "rb") as file:
+                for record in _read_records(file):
+                    records.append(record)
+                    good_end = file.tell()
+                file.seek(0, os.SEEK_END)
+                size = file.tell()
+        except FileNotFoundError:
+            return records
+
+        if size > good_end:
+            print(f"Warning: discarding {size - good_end} damaged bytes at the end of '{self.file_name}'.")
+            with open(self.file_name, "r+b") as file:
+                file.truncate(good_end)
+        return records
+
+    def records(self):
+        """Yields the intact records one at a time, so a journal of any size can be read in constant memory."""
+        try:
+            file = open(self.file_name, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            yield from _read_records(file)
+
+    def open(self):
+        """Starts the background writer that appends records to the journal."""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def append(self, record):
+        """Queues a record for writing without waiting for the disk."""
+        self._queue.put(record)
+
+    def close(self):
+        """Writes and syncs everything still queued, then stops the writer."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        """Writer thread: appends queued records and fsyncs them in groups."""
+        with open(self.file_name, "ab") as file:
+            pending = 0
+            last_sync = time.monotonic()
+            while True:
+                timeout = None
+                if pending and self.sync_interval is not None:
+                    timeout = max(0, last_sync + self.sync_interval - time.monotonic())
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    record = False  # Interval elapsed with nothing new to write
+
+                if record is None:
+                    break
+                if record is not False:
+                    payload = json.dumps(record, separators=(",", ":")).encode()
+                    file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                    pending += 1
+
+                due_by_count = self.sync_every and pending >= self.sync_every
+                due_by_time = (self.sync_interval is not None
+                               and time.monotonic() - last_sync >= self.sync_interval)
+                if pending and (due_by_count or due_by_time):
+                    file.flush()
+                    os.fsync(file.fileno())
+                    pending = 0
+                    last_sync = time.monotonic()
+
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def _read_records(file):
+    """Yields records from the file position onwards, stopping at the first torn or corrupt one."""
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, checksum = RECORD_HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield json.loads(payload)
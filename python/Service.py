@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from collections import Counter
+
+import Main
+from CartStore import CartStore
+from Cashier import CashierSystem
+from Manager import Manager
+from Metrics import enable_from_env
+from Storage import PRODUCT_FILE, FileStorage, open_storage
+
+
+@contextlib.contextmanager
+def quietly():
+    """Swallows the console messages printed by the interactive-era methods."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+class CoffeeHouseService:
+    def __init__(self, cashier, manager):
+        self.cashier = cashier
+        self.manager = manager
+        self.carts = CartStore()  # Session ID -> {item code: quantity}, with idle expiry and LRU eviction
+
+        # Handlers never await while holding these, except for file I/O run in worker threads
+        self.catalog_lock = asyncio.Lock()  # Guards cashier products, discounts and sales
+        self.inventory_lock = asyncio.Lock()  # Guards manager.inventory
+        self.order_lock = asyncio.Lock()  # Serializes Main's order writes and lookups
+        self.feedback_lock = asyncio.Lock()  # Guards manager.feedback
+
+        self.handlers = {
+            "catalog": self.handle_catalog,
+            "cart_add": self.handle_cart_add,
+            "cart_remove": self.handle_cart_remove,
+            "cart_update": self.handle_cart_update,
+            "cart_view": self.handle_cart_view,
+            "checkout": self.handle_checkout,
+            "transaction": self.handle_transaction,
+            "discount": self.handle_discount,
+            "order_status": self.handle_order_status,
+            "inventory": self.handle_inventory,
+            "inventory_update": self.handle_inventory_update,
+            "feedback": self.handle_feedback,
+        }
+
+    # Catalog and cashier operations
+    async def handle_catalog(self, request):
+        async with self.catalog_lock:
+            if request.get("type"):
+                return self.cashier.get_products_by_type(request["type"])
+            return list(self.cashier.products)
+
+    async def handle_transaction(self, request):
+        async with self.catalog_lock:  # The sale is posted to the ledger and stock log, so off the event loop
+            priced = await asyncio.to_thread(self.cashier.record_transaction, request["products"])
+        if priced["out_of_stock"]:
+            raise ValueError(f"Not enough stock for: {', '.join(priced['out_of_stock'])}")
+        return {"total": round(priced["total"], 2), "items": priced["items"], "invalid": priced["invalid"]}
+
+    async def handle_discount(self, request):
+        async with self.catalog_lock:
+            with quietly():
+                applied = self.cashier.set_discount(request["product_id"], float(request["percent"]))
+        if not applied:
+            raise ValueError("Unknown product ID or discount outside 0-100.")
+        return {"product_id": request["product_id"], "percent": float(request["percent"])}
+
+    # Customer operations
+    async def handle_cart_add(self, request):
+        item = request["item"]
+        if self.cashier.get_product(item) is None:
+            raise ValueError(f"'{item}' is an invalid item code.")
+        self.carts.add(request["session"], item, int(request.get("quantity", 1)))
+        return self.carts.get(request["session"])
+
+    async def handle_cart_remove(self, request):
+        quantity = request.get("quantity")
+        if self.carts.remove(request["session"], request["item"], quantity and int(quantity)) is None:
+            raise ValueError("Item is not in the cart.")
+        return self.carts.get(request["session"])
+
+    async def handle_cart_update(self, request):
+        if not self.carts.set_quantity(request["session"], request["item"], int(request["quantity"])):
+            raise ValueError("Item is not in the cart.")
+        return self.carts.get(request["session"])
+
+    async def handle_cart_view(self, request):
+        return self.carts.get(request["session"])
+
+    async def handle_checkout(self, request):
+        cart = self.carts.take(request["session"])
+        if not cart:
+            raise ValueError("Your cart is empty.")
+        try:
+            async with self.order_lock:
+                order_id = await asyncio.to_thread(Main.place_order, request["name"], list(Counter(cart).elements()))
+        except Exception:
+            self.carts.restore(request["session"], cart)  # The order was not placed; keep the cart for a retry
+            raise
+        if order_id is None:
+            self.carts.restore(request["session"], cart)  # Let the customer adjust the cart
+            raise ValueError("Some items in the cart are out of stock.")
+        return {"order_id": order_id}
+
+    async def handle_order_status(self, request):
+        async with self.order_lock:
+            line = await asyncio.to_thread(Main.find_order, request["order_id"])
+        if line is None:
+            raise ValueError("Order not found.")
+        return line.strip()
+
+    # Manager operations
+    async def handle_inventory(self, request):
+        async with self.inventory_lock:
+            return dict(self.manager.inventory)
+
+    async def handle_inventory_update(self, request):
+        async with self.inventory_lock:
+            with quietly():
+                if request["item"] in self.manager.inventory:
+                    await asyncio.to_thread(self.manager.update_inventory, request["item"], int(request["quantity"]))
+                else:
+                    await asyncio.to_thread(self.manager.add_inventory_item, request["item"], int(request["quantity"]))
+            return {request["item"]: self.manager.inventory.get(request["item"])}
+
+    async def handle_feedback(self, request):
+        async with self.feedback_lock:
+            before = len(self.manager.feedback)
+            with quietly():
+                self.manager.add_feedback(request["text"])
+            if len(self.manager.feedback) == before:
+                raise ValueError("Feedback must be 1-200 characters.")
+        return "Feedback added."
+
+    async def handle_request(self, request):
+        """Dispatches one request and wraps the outcome in a response dictionary."""
+        handler = self.handlers.get(request.get("op"))
+        if handler is None:
+            return {"ok": False, "error": f"Unknown operation '{request.get('op')}'."}
+        try:
+            return {"ok": True, "result": await handler(request)}
+        except (KeyError, ValueError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+        except (OSError, sqlite3.Error) as e:
+            return {"ok": False, "error": f"Storage error: {e}"}
+
+    async def handle_client(self, reader, writer):
+        """Serves newline-delimited JSON requests from one client connection."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except json.JSONDecodeError:
+                    response = {"ok": False, "error": "Request is not valid JSON."}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """Starts the TCP server and returns it."""
+        return await asyncio.start_server(self.handle_client, host, port, limit=1 << 20)
+
+
+# Load test client
+async def _client(host, port, client_id, request_count, product_ids, latencies, errors):
+    """Opens one connection and sends a mix of valid customer, cashier and manager requests.
+
+    Every request should succeed, so each failed response is added to `errors` as (op, error).
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    rng = random.Random(client_id)
+    session = f"load-{client_id}"
+    order_ids = []
+    cart_filled = False
+
+    for i in range(request_count):
+        roll = rng.random()
+        if roll < 0.3:
+            request = {"op": "catalog"}
+        elif roll < 0.5:
+            request = {"op": "cart_add", "session": session, "item": rng.choice(product_ids)}
+        elif roll < 0.55 and cart_filled:
+            request = {"op": "checkout", "session": session, "name": f"Customer{client_id}"}
+        elif roll < 0.55:
+            request = {"op": "cart_add", "session": session, "item": rng.choice(product_ids)}
+        elif roll < 0.8:
+            request = {"op": "transaction", "products": rng.choices(product_ids, k=rng.randint(1, 5))}
+        elif roll < 0.88 and order_ids:
+            request = {"op": "order_status", "order_id": rng.choice(order_ids)}
+        elif roll < 0.95:
+            # Restock far above what the test sells, so no sale fails for want of stock
+            request = {"op": "inventory_update", "item": rng.choice(product_ids),
+                       "quantity": rng.randint(1000000, 2000000)}
+        else:
+            request = {"op": "feedback", "text": f"Load test feedback {client_id}-{i}"}
+
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if not response["ok"]:
+            errors.append((request["op"], response["error"]))
+        elif request["op"] == "cart_add":
+            cart_filled = True
+        elif request["op"] == "checkout":
+            order_ids.append(response["result"]["order_id"])
+            cart_filled = False
+
+    writer.close()
+
+
+async def run_load_test(host, port, clients=200, requests_per_client=50, product_ids=("B01", "B02", "F01", "P01")):
+    """Runs concurrent clients against the service and reports p50/p99 latency, requests/sec and failed requests."""
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, i, requests_per_client, list(product_ids), latencies, errors)
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    report = {
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": len(errors),
+    }
+    print(f"{report['requests']} requests from {clients} clients: {report['requests_per_sec']:,.0f} req/s, "
+          f"p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, {report['errors']} failed")
+    for (op, error), count in Counter(errors).most_common(5):
+        print(f"  {count} x {op}: {error}")
+    return report
+
+
+def _build_service(products_file, storage):
+    """Creates the cashier, manager and customer functions on a storage backend, sharing one inventory and ledger."""
+    Main.use_storage(storage)
+    manager = Manager(order_store=storage.order_store(), inventory=storage.inventory(), ledger=storage.ledger(),
+                      dish_reviews=storage.dish_reviews())
+    Main.inventory = manager.inventory_engine
+    cashier = CashierSystem(products_file, storage.sales_journal(), inventory=manager.inventory_engine,
+                            ledger=manager.ledger, storage=storage)
+    return CoffeeHouseService(cashier, manager)
+
+
+async def _serve_forever(args):
+    service = _build_service(args.products, open_storage())  # Flat files, or the database named by $COFFEEHOUSE_DB
+    server = await service.serve(args.host, args.port)
+    print(f"Coffee house service listening on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+async def _self_hosted_load_test(args):
+    """Load tests a local service working in a scratch directory, so its orders never reach the real files."""
+    products_file = os.path.abspath(args.products)
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(products_file, directory)  # The catalog keeps its change log and snapshot beside the file
+        os.chdir(directory)
+        try:
+            with quietly():
+                service = _build_service(os.path.basename(products_file), FileStorage())
+            cashier = service.cashier
+            server = await service.serve(args.host, 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await run_load_test(args.host, port, args.clients, args.requests,
+                                           [product["id"] for product in cashier.products])
+        finally:
+            Main.order_writer.flush()
+            service.cashier.close()
+            os.chdir(previous)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coffee house asyncio service")
+    parser.add_argument("mode", choices=["serve", "loadtest"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", default=PRODUCT_FILE)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--connect", action="store_true", help="load test a running server instead of a local one")
+    args = parser.parse_args()
+
+    enable_from_env()  # Latency metrics if $COFFEEHOUSE_METRICS or $COFFEEHOUSE_METRICS_PORT is set
+    if args.mode == "serve":
+        asyncio.run(_serve_forever(args))
+    else:
+        if args.connect:
+            report = asyncio.run(run_load_test(args.host, args.port, args.clients, args.requests))
+        else:
+            report = asyncio.run(_self_hosted_load_test(args))
+        if report["errors"]:
+            sys.exit(1)  # Throughput of a run with failed requests says nothing about correctness
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from datetime import datetime
+
+from AccountStore import AccountStore
+from CatalogStore import CatalogStore
+from Inventory import InventoryEngine
+from Ledger import Ledger
+from OrderStore import OrderStore
+from SalesJournal import SalesJournal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS products (id TEXT PRIMARY KEY, position INTEGER NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS products_position ON products (position);
+CREATE TABLE IF NOT EXISTS sales (seq INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, record TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS sales_timestamp ON sales (timestamp);
+CREATE TABLE IF NOT EXISTS orders (seq INTEGER PRIMARY KEY, order_id TEXT NOT NULL UNIQUE,
+                                   customer TEXT NOT NULL, items TEXT NOT NULL, status TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS accounts (username TEXT PRIMARY KEY, stored TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS manager_orders (seq INTEGER PRIMARY KEY, change TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS ledger (seq INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, kind TEXT NOT NULL,
+                                   cents INTEGER NOT NULL, source TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS feedback (seq INTEGER PRIMARY KEY, username TEXT NOT NULL, dish TEXT NOT NULL,
+                                     review TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS inventory (seq INTEGER PRIMARY KEY, change TEXT NOT NULL);
+"""
+
+# The catalog shipped with the code, found wherever a program is started from
+PRODUCT_FILE = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "json_file",
+                                             "defaultproducts.json"))
+
+# Tables a migration fills; it refuses to run unless they are all empty
+MIGRATED_TABLES = ("products", "sales", "orders", "accounts", "manager_orders", "ledger", "feedback", "inventory")
+
+
+# The flat files each module has always used, behind the same factory methods as SQLiteStorage.
+class FileStorage:
+    def __init__(self, directory="."):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def catalog_store(self, file_name):
+        return CatalogStore(self._path(file_name))
+
+    def sales_journal(self):
+        return SalesJournal(self._path("sales.journal"))
+
+    def account_store(self):
+        return AccountStore(self._path("Customers.txt"))
+
+    def order_store(self):
+        return OrderStore(self._path("ManagerOrders.log"))
+
+    def ledger(self):
+        return Ledger(self._path("Ledger.log"))
+
+    def customer_orders(self):
+        return None  # Main keeps customer orders in Order.txt with its own index
+
+    def dish_reviews(self):
+        return None  # Main appends dish reviews to Feedback.txt through its batched writer
+
+    def inventory(self):
+        return InventoryEngine(file_name=self._path("Inventory.log"))
+
+    def close(self):
+        pass
+
+
+# Every store in one SQLite database in WAL mode, shared by all the modules and processes.
+class SQLiteStorage:
+    def __init__(self, file_name, pool_size=8):
+        self.file_name = file_name
+        self.pool_size = pool_size  # Connections kept open for concurrent callers
+        self._pool = queue.LifoQueue()  # Idle connections; the most recently used is reused first
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()  # The connection of the transaction this thread has open, if any
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.file_name, timeout=30, isolation_level=None,
+                                     check_same_thread=False, cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; fsync at checkpoints
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Lends out a pooled connection, opening a new one while the pool is below its size.
+
+        Inside a transaction, the thread gets that transaction's connection, so it reads its own writes.
+        """
+        current = getattr(self._local, "connection", None)
+        if current is not None:
+            yield current
+            return
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            connection = self._connect() if can_open else self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Runs a block as one write transaction, committed at the end or rolled back on error.
+
+        A transaction begun inside another on the same thread joins it and commits with it.
+        """
+        current = getattr(self._local, "connection", None)
+        if current is not None:
+            yield current
+            return
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.connection = connection
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.connection = None
+            connection.execute("COMMIT")
+
+    def query(self, sql, parameters=()):
+        """Returns every row of a read-only query."""
+        with self.connection() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def get_meta(self, key, default=0):
+        rows = self.query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def catalog_store(self, file_name):
+        return SQLiteCatalogStore(self)
+
+    def sales_journal(self):
+        return SQLiteSalesJournal(self)
+
+    def account_store(self):
+        return SQLiteAccountStore(self)
+
+    def order_store(self):
+        return SQLiteOrderStore(self)
+
+    def ledger(self):
+        return SQLiteLedger(self)
+
+    def customer_orders(self):
+        return SQLiteCustomerOrders(self)
+
+    def dish_reviews(self):
+        return SQLiteDishReviews(self)
+
+    def inventory(self):
+        return SQLiteInventory(self)
+
+    def close(self):
+        """Closes every idle pooled connection."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._opened = 0
+
+
+def _bump_catalog_version(connection):
+    connection.execute("INSERT INTO meta (key, value) VALUES ('catalog_version', 1) "
+                       "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+
+# CatalogStore for the products table: every change is one upsert, so there is no log to compact.
+class SQLiteCatalogStore:
+    def __init__(self, storage):
+        self.storage = storage
+        self.file_name = storage.file_name
+
+    def load(self):
+        return [json.loads(data) for data, in
+                self.storage.query("SELECT data FROM products ORDER BY position")]
+
+    def signature(self):
+        return (self.storage.get_meta("catalog_version"),)
+
+    def record_put(self, product, products):
+        with self.storage.transaction() as connection:
+            connection.execute("INSERT INTO products (id, position, data) "
+                               "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM products), ?) "
+                               "ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+                               (product['id'], json.dumps(product)))
+            _bump_catalog_version(connection)
+
+    def record_remove(self, product_id, products):
+        with self.storage.transaction() as connection:
+            connection.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            _bump_catalog_version(connection)
+
+    def compact(self, products):
+        """Replaces the whole catalog in one transaction with a bulk insert."""
+        with self.storage.transaction() as connection:
+            connection.execute("DELETE FROM products")
+            connection.executemany("INSERT INTO products (id, position, data) VALUES (?, ?, ?)",
+                                   ((product['id'], position, json.dumps(product))
+                                    for position, product in enumerate(products)))
+            _bump_catalog_version(connection)
+
+    def close(self):
+        pass
+
+
+# SalesJournal for the sales table: the writer thread bulk-inserts each batch in one transaction.
+class SQLiteSalesJournal(SalesJournal):
+    def __init__(self, storage, batch_size=500):
+        super().__init__(storage.file_name)
+        self.storage = storage
+        self.batch_size = batch_size  # Most records inserted per transaction
+
+    def replay(self):
+        return [json.loads(record) for record, in self.storage.query("SELECT record FROM sales ORDER BY seq")]
+
+    def records(self):
+        with self.storage.connection() as connection:
+            for record, in connection.execute("SELECT record FROM sales ORDER BY seq"):
+                yield json.loads(record)
+
+    def append_many(self, records):
+        """Inserts records straight away in one transaction."""
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT INTO sales (timestamp, record) VALUES (?, ?)",
+                                   ((record["timestamp"], json.dumps(record, separators=(",", ":")))
+                                    for record in records))
+
+    def _write_loop(self):
+        """Writer thread: drains the queue and inserts what it got as one batch."""
+        while True:
+            record = self._queue.get()
+            batch = []
+            while record is not None:
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.append_many(batch)
+            if record is None:
+                break
+
+
+# Read-only mapping view of the accounts table, looked up one primary key at a time.
+class _AccountTable:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get(self, username, default=None):
+        rows = self.storage.query("SELECT stored FROM accounts WHERE username = ?", (username,))
+        return rows[0][0] if rows else default
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+
+# AccountStore for the accounts table: lookups go to the primary key instead of a loaded file.
+class SQLiteAccountStore(AccountStore):
+    def __init__(self, storage, iterations=100000):
+        super().__init__(storage.file_name, iterations)
+        self.storage = storage
+        self.accounts = _AccountTable(storage)
+
+    def _refresh(self):
+        return True  # Nothing to reload: every lookup reads the table
+
+    def _append(self, username, stored, new_account=False):
+        with self.storage.transaction() as connection:
+            verb = "INSERT OR IGNORE" if new_account else "INSERT OR REPLACE"
+            cursor = connection.execute(f"{verb} INTO accounts (username, stored) VALUES (?, ?)",
+                                        (username, stored))
+        return cursor.rowcount == 1
+
+    def bulk_load(self, accounts):
+        """Inserts (username, stored record) pairs in one transaction, later pairs winning."""
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT OR REPLACE INTO accounts (username, stored) VALUES (?, ?)", accounts)
+
+
+# OrderStore whose change log is the manager_orders table; it imports customer orders from the orders table.
+class SQLiteOrderStore(OrderStore):
+    def __init__(self, storage):
+        self.storage = storage
+        super().__init__(None)
+        self.file_name = storage.file_name
+        self._replay()
+
+    def _replay(self):
+        for change, in self.storage.query("SELECT change FROM manager_orders ORDER BY seq"):
+            self._apply(json.loads(change))
+
+    def _write(self, changes):
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT INTO manager_orders (change) VALUES (?)",
+                                   ((json.dumps(change),) for change in changes))
+
+    def ingest_customer_orders(self, order_file=None):
+        """Imports customer orders added to the orders table since the last import; returns how many were new."""
+        rows = self.storage.query("SELECT seq, order_id, customer, items, status FROM orders "
+                                  "WHERE seq > ? ORDER BY seq", (self.ingested_offset,))
+        if not rows:
+            return 0
+        return self.add_many(((order_id, {'status': status, 'items': [item for item in items.split(", ") if item],
+                                          'customer': customer})
+                              for _, order_id, customer, items, status in rows),
+                             {'op': 'ingested', 'offset': rows[-1][0]})
+
+    def compact(self):
+        """Rewrites the change log as one entry per order in a single transaction."""
+        with self.storage.transaction() as connection:
+            connection.execute("DELETE FROM manager_orders")
+            changes = [{'op': 'add', 'id': order_id, 'details': details} for order_id, details in self.orders.items()]
+            changes.append({'op': 'ingested', 'offset': self.ingested_offset})
+            connection.executemany("INSERT INTO manager_orders (change) VALUES (?)",
+                                   ((json.dumps(change),) for change in changes))
+
+
+# Ledger for the ledger table; entries other processes posted are read by sequence number.
+class SQLiteLedger(Ledger):
+    def __init__(self, storage):
+        self.storage = storage
+        super().__init__(storage.file_name)
+
+    def refresh(self, connection=None):
+        if connection is None:
+            with self.storage.connection() as connection:
+                return self.refresh(connection)
+        rows = connection.execute("SELECT seq, timestamp, kind, cents, source FROM ledger WHERE seq > ? ORDER BY seq",
+                                  (self._offset,)).fetchall()
+        for seq, timestamp, kind, cents, source in rows:
+            self._apply(datetime.fromisoformat(timestamp), kind, cents, source)
+            self._offset = seq
+
+    def _write(self, timestamp, kind, cents, source):
+        with self.storage.transaction() as connection:
+            self.refresh(connection)  # Apply other processes' entries first so our position stays in step
+            cursor = connection.execute("INSERT INTO ledger (timestamp, kind, cents, source) VALUES (?, ?, ?, ?)",
+                                        (timestamp.isoformat(), kind, cents, source))
+            self._offset = cursor.lastrowid
+
+    def bulk_load(self, entries):
+        """Inserts (timestamp, kind, cents, source) entries in one transaction without applying them."""
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT INTO ledger (timestamp, kind, cents, source) VALUES (?, ?, ?, ?)",
+                                   ((timestamp.isoformat(), kind, cents, source)
+                                    for timestamp, kind, cents, source in entries))
+
+
+# Customer orders for Main, keyed by their time-sortable order IDs.
+class SQLiteCustomerOrders:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def add(self, order_id, customer_name, items, status="Pending"):
+        with self.storage.transaction() as connection:
+            connection.execute("INSERT INTO orders (order_id, customer, items, status) VALUES (?, ?, ?, ?)",
+                               (order_id, customer_name, ", ".join(items), status))
+
+    def add_many(self, orders):
+        """Inserts (order ID, customer, items text, status) rows in one transaction, skipping known IDs."""
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT OR IGNORE INTO orders (order_id, customer, items, status) "
+                                   "VALUES (?, ?, ?, ?)", orders)
+
+    def find(self, order_id):
+        """Returns the order as an Order.txt-style line, or None."""
+        rows = self.storage.query("SELECT order_id, customer, items, status FROM orders WHERE order_id = ?",
+                                  (order_id,))
+        return " | ".join(rows[0]) if rows else None
+
+    def between(self, first_id, last_id):
+        """Returns Order.txt-style lines for the IDs in [first_id, last_id), in ID order."""
+        rows = self.storage.query("SELECT order_id, customer, items, status FROM orders "
+                                  "WHERE order_id >= ? AND order_id < ? ORDER BY order_id", (first_id, last_id))
+        return [" | ".join(row) for row in rows]
+
+
+# Customer dish reviews for Main and the manager's feedback analytics, in the order they were written.
+class SQLiteDishReviews:
+    def __init__(self, storage):
+        self.storage = storage
+        self.file_name = storage.file_name
+
+    def add(self, username, dish, review):
+        with self.storage.transaction() as connection:
+            connection.execute("INSERT INTO feedback (username, dish, review) VALUES (?, ?, ?)",
+                               (username, dish, review))
+
+    def add_many(self, reviews):
+        """Inserts (username, dish, review) rows in one transaction."""
+        with self.storage.transaction() as connection:
+            connection.executemany("INSERT INTO feedback (username, dish, review) VALUES (?, ?, ?)", reviews)
+
+    def after(self, seq):
+        """Returns the (seq, username, dish, review) rows written after sequence number `seq`."""
+        return self.storage.query("SELECT seq, username, dish, review FROM feedback WHERE seq > ? ORDER BY seq",
+                                  (seq,))
+
+
+# InventoryEngine whose change log is the inventory table; a basket is checked and taken in one transaction.
+class SQLiteInventory(InventoryEngine):
+    def __init__(self, storage):
+        self.storage = storage
+        self._connection = None  # Connection of the transaction _shared() holds open
+        super().__init__(file_name=storage.file_name)
+
+    @contextlib.contextmanager
+    def _shared(self):
+        with self._log_lock:
+            try:
+                with self.storage.transaction() as connection:
+                    self._connection = connection
+                    self.refresh(connection)
+                    yield
+            except BaseException:
+                # The changes applied in memory were rolled back in the table: read the stock again
+                self.stock.clear()
+                self._offset = 0
+                self.refresh()
+                raise
+            finally:
+                self._connection = None
+
+    def refresh(self, connection=None):
+        if connection is None:
+            with self.storage.connection() as connection:
+                return self.refresh(connection)
+        for seq, change in connection.execute("SELECT seq, change FROM inventory WHERE seq > ? ORDER BY seq",
+                                              (self._offset,)).fetchall():
+            self._apply(json.loads(change))
+            self._offset = seq
+
+    def _write(self, change):
+        cursor = self._connection.execute("INSERT INTO inventory (change) VALUES (?)", (json.dumps(change),))
+        self._offset = cursor.lastrowid
+
+
+def open_storage():
+    """Returns the SQLite storage named by $COFFEEHOUSE_DB, or the flat files in the working directory."""
+    database = os.environ.get("COFFEEHOUSE_DB")
+    return SQLiteStorage(database) if database else FileStorage()
+
+
+def migrate(storage, directory=".", product_file=PRODUCT_FILE):
+    """Copies every flat file in `directory` into an empty SQLite storage; returns {table: rows copied}.
+
+    A relative `product_file` is looked up in `directory`, like the other files. Everything is
+    copied in one transaction, so a failed migration leaves the database empty.
+    """
+    with storage.transaction() as connection:
+        for table in MIGRATED_TABLES:
+            if storage.query(f"SELECT EXISTS (SELECT 1 FROM {table})")[0][0]:
+                raise ValueError(f"The database already holds {table}; migrate into a new database.")
+        files = FileStorage(directory)
+        counts = {}
+
+        try:
+            products = files.catalog_store(product_file).load()
+        except FileNotFoundError:
+            raise ValueError(f"The product file '{files._path(product_file)}' does not exist.") from None
+        storage.catalog_store(product_file).compact(products)
+        counts["products"] = len(products)
+
+        sales = files.sales_journal().replay()
+        storage.sales_journal().append_many(sales)
+        counts["sales"] = len(sales)
+
+        # Customer orders, remembering how many the manager had already imported from Order.txt
+        manager_orders = files.order_store()
+        orders = []
+        ingested = 0
+        try:
+            with open(os.path.join(directory, "Order.txt"), "rb") as file:
+                offset = 0
+                for line in file:
+                    offset += len(line)
+                    parts = [part.strip() for part in line.decode().split(" | ")]
+                    if len(parts) == 4 and parts[0]:
+                        orders.append(tuple(parts))
+                        if offset <= manager_orders.ingested_offset:
+                            ingested = len(orders)
+        except FileNotFoundError:
+            pass
+        storage.customer_orders().add_many(orders)
+        counts["orders"] = len(orders)
+
+        accounts = files.account_store()
+        accounts._refresh()
+        storage.account_store().bulk_load(accounts.accounts.items())
+        counts["accounts"] = len(accounts.accounts)
+
+        # Manager orders: the import position becomes the sequence number of the last imported order
+        changes = [{'op': 'add', 'id': order_id, 'details': details}
+                   for order_id, details in manager_orders.orders.items()]
+        if ingested:
+            changes.append({'op': 'ingested', 'offset': connection.execute(
+                "SELECT seq FROM orders ORDER BY seq LIMIT 1 OFFSET ?", (ingested - 1,)).fetchone()[0]})
+        connection.executemany("INSERT INTO manager_orders (change) VALUES (?)",
+                               ((json.dumps(change),) for change in changes))
+        counts["manager_orders"] = len(manager_orders.orders)
+
+        ledger = files.ledger()
+        storage.ledger().bulk_load(ledger.entries)
+        counts["ledger"] = len(ledger.entries)
+
+        # Dish reviews, skipping a half-written last line
+        reviews = []
+        try:
+            with open(os.path.join(directory, "Feedback.txt"), "rb") as file:
+                for line in file:
+                    parts = [part.strip() for part in line.decode().rstrip("\n").split(",", 2)]
+                    if line.endswith(b"\n") and len(parts) == 3:
+                        reviews.append(tuple(parts))
+        except FileNotFoundError:
+            pass
+        storage.dish_reviews().add_many(reviews)
+        counts["feedback"] = len(reviews)
+
+        stock = files.inventory().stock
+        connection.executemany("INSERT INTO inventory (change) VALUES (?)",
+                               ((json.dumps({'op': 'set', 'item': item, 'quantity': quantity}),)
+                                for item, quantity in stock.items()))
+        counts["inventory"] = len(stock)
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coffee house storage tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migration = commands.add_parser("migrate", help="copy the flat files into a new SQLite database")
+    migration.add_argument("--database", default="coffeehouse.db")
+    migration.add_argument("--directory", default=".", help="folder holding the flat files")
+    migration.add_argument("--products", default=PRODUCT_FILE, help="product catalog (relative to --directory)")
+    args = parser.parse_args()
+
+    storage = SQLiteStorage(args.database)
+    try:
+        counts = migrate(storage, args.directory, args.products)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        storage.close()
+    for table, count in counts.items():
+        print(f"{table}: {count} row(s) migrated")
+    print(f"Set COFFEEHOUSE_DB={args.database} to run the programs against the new database.")
+
+
+if __name__ == "__main__":
+    main()
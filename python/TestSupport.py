@@ -0,0 +1,79 @@
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+
+from datetime import datetime, timedelta
+
+import Main
+from AccountStore import AccountStore
+from Cashier import CashierSystem
+from OrderIndex import OrderIndex
+from ProductCatalog import ProductCatalog
+
+
+# Data builders and scratch setups shared by the tests and the benchmarks
+def make_products(count):
+    """Builds a synthetic product catalog with the same shape as defaultproducts.json."""
+    types = ["Beverage", "Food", "Pastry"]
+    return [
+        {
+            "id": f"X{i:06d}",
+            "name": f"Product {i}",
+            "type": types[i % len(types)],
+            "details": "Synthetic",
+            "price": round(5 + (i % 50) * 0.5, 2),
+        }
+        for i in range(count)
+    ]
+
+def make_baskets(products, count, max_size=6, seed=0):
+    """Builds random baskets of product IDs drawn from the catalog."""
+    rng = random.Random(seed)
+    ids = [product["id"] for product in products]
+    return [rng.choices(ids, k=rng.randint(1, max_size)) for _ in range(count)]
+
+def make_sale_record(i):
+    """Builds one journal record shaped like the ones CashierSystem writes."""
+    return {"products": ["B01", "P02"], "prices": [8.0, 6.5], "total": 14.5,
+            "timestamp": (datetime(2024, 1, 1) + timedelta(seconds=i)).isoformat()}
+
+def load_cashier(products, directory):
+    """Writes a catalog to a temporary JSON file and loads a CashierSystem from it."""
+    file_name = os.path.join(directory, f"products_{len(products)}.json")
+    with open(file_name, "w") as file:
+        json.dump(products, file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return CashierSystem(file_name)
+
+@contextlib.contextmanager
+def working_directory():
+    """Runs the Main functions inside a scratch directory so their files, the catalog included, stay isolated."""
+    previous, product_file = os.getcwd(), Main.PRODUCT_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        Main.PRODUCT_FILE = os.path.join(directory, os.path.basename(product_file))
+        Main.order_index = OrderIndex(Main.ORDER_INDEX_FILE, Main.ORDER_FILE)
+        Main.customer_orders = None
+        Main.accounts = AccountStore(Main.CUSTOMER_FILE)
+        Main.catalog = ProductCatalog(Main.PRODUCT_FILE)
+        try:
+            yield directory
+        finally:
+            Main.order_writer.flush()
+            Main.feedback_writer.flush()
+            Main.order_index = OrderIndex(Main.ORDER_INDEX_FILE, Main.ORDER_FILE)
+            Main.customer_orders = None
+            Main.accounts = AccountStore(Main.CUSTOMER_FILE)
+            Main.PRODUCT_FILE = product_file
+            Main.catalog = ProductCatalog(Main.PRODUCT_FILE)
+            os.chdir(previous)
+
+def place_orders(directory, worker, count):
+    """Worker process that places orders through Main.place_order from a shared directory."""
+    os.chdir(directory)
+    for i in range(count):
+        Main.place_order(f"worker{worker}", [f"W{worker}", f"N{i:06d}", "B01" * (i % 7)])
+    Main.order_writer.close()
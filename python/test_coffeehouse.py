@@ -0,0 +1,474 @@
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+import Main
+from CatalogStore import CatalogStore
+from FeedbackAnalytics import FeedbackAnalytics
+from Inventory import InventoryEngine
+from Ledger import Ledger, to_cents
+from Manager import Manager
+from OrderStore import OrderStore
+from SalesHistory import SalesHistory
+from SalesJournal import SalesJournal
+from Service import CoffeeHouseService
+from Storage import MIGRATED_TABLES, FileStorage, SQLiteLedger, SQLiteStorage, migrate
+from TestSupport import load_cashier, make_baskets, make_products, make_sale_record, place_orders, working_directory
+
+
+def recompute_summary(sales, start, end):
+    """Recomputes a report window by walking every logged sale."""
+    total, units = 0, {}
+    for sale in sales:
+        if start <= sale["timestamp"] < end:
+            total += sale["total"]
+            for pid in sale["products"]:
+                units[pid] = units.get(pid, 0) + 1
+    return total, units
+
+
+# Running and hourly/daily aggregates behind sales_summary and generate_report
+class SalesReportTest(unittest.TestCase):
+    def setUp(self):
+        self.products = make_products(20)
+        with tempfile.TemporaryDirectory() as directory:
+            self.cashier = load_cashier(self.products, directory)
+        self.first = datetime(2024, 1, 1)
+        step = timedelta(days=3) / 500
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, basket in enumerate(make_baskets(self.products, 500)):
+                self.cashier.process_transaction(basket, self.first + step * i)
+
+    def assert_window_matches(self, start, end):
+        total, units, _ = self.cashier.sales_summary(start, end)
+        expected_total, expected_units = recompute_summary(list(self.cashier.sales), start, end)
+        self.assertAlmostEqual(total, expected_total, places=6)
+        self.assertEqual(units, expected_units)
+
+    def test_whole_hour_windows(self):
+        hour = timedelta(hours=1)
+        for start, hours in [(0, 1), (5, 24), (23, 2), (0, 72)]:
+            self.assert_window_matches(self.first + hour * start, self.first + hour * (start + hours))
+
+    def test_windows_inside_and_across_hours(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            start = self.first + timedelta(seconds=rng.randint(0, 3 * 86400))
+            self.assert_window_matches(start, start + timedelta(seconds=rng.randint(1, 86400)))
+
+    def test_whole_history(self):
+        total, units, _ = self.cashier.sales_summary()
+        self.assertAlmostEqual(total, sum(sale["total"] for sale in self.cashier.sales), places=6)
+        self.assertEqual(sum(units.values()), sum(len(sale["products"]) for sale in self.cashier.sales))
+
+    def test_empty_window(self):
+        total, units, _ = self.cashier.sales_summary(self.first - timedelta(days=2), self.first - timedelta(days=1))
+        self.assertEqual((total, units), (0, {}))
+
+
+# Sales columns keep whole cents, rounded the same way as ledger entries
+class SalesHistoryTest(unittest.TestCase):
+    def test_cents_round_half_up_like_the_ledger(self):
+        history = SalesHistory()
+        amounts = [0.125, 2.675, 1.005, 0.5, 10.0]
+        for amount in amounts:
+            history.append(["B01"], [amount], amount, datetime(2024, 1, 1))
+        self.assertEqual([sale["total"] for sale in history], [0.13, 2.68, 1.01, 0.5, 10.0])
+        self.assertEqual(history.summary()[0], sum(to_cents(amount) for amount in amounts))
+
+
+# Ledger log recovery after a crash mid-append
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_name = os.path.join(directory.name, "Ledger.log")
+
+    def test_entry_posted_after_a_torn_line_survives_a_restart(self):
+        ledger = Ledger(self.file_name)
+        ledger.post("income", 100, datetime(2024, 1, 1))
+        ledger.close()
+        with open(self.file_name, "ab") as file:
+            file.write(b"2024-01-01T01:00:00\tinco")  # A crash in the middle of an append
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            ledger = Ledger(self.file_name)
+            ledger.post("income", 500, datetime(2024, 1, 2))
+            ledger.close()
+            reloaded = Ledger(self.file_name)
+        self.assertEqual(reloaded.totals["income"], 600)
+        self.assertEqual(len(reloaded.entries), 2)
+        with open(self.file_name, "rb") as file:
+            self.assertEqual(file.read().count(b"\n"), 2)
+
+
+# Manager order log recovery after a crash mid-append
+class OrderStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_name = os.path.join(directory.name, "ManagerOrders.log")
+
+    def test_changes_logged_after_a_torn_line_survive_a_restart(self):
+        store = OrderStore(self.file_name)
+        store.add("A", {"status": "Pending", "items": ["B01"]})
+        store.close()
+        with open(self.file_name, "a") as file:
+            file.write('{"op": "sta')  # A crash in the middle of an append
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            store = OrderStore(self.file_name)
+            store.add("B", {"status": "Pending", "items": ["P02"]})
+            store.update_status("A", "Ready")
+            store.close()
+            reloaded = OrderStore(self.file_name)
+        self.assertEqual({order_id: details["status"] for order_id, details in reloaded.orders.items()},
+                         {"A": "Ready", "B": "Pending"})
+        self.assertEqual(reloaded.with_status("Pending"), ["B"])
+
+
+# Catalog change log shared by several cashier processes
+class CatalogStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_name = os.path.join(directory.name, "defaultproducts.json")
+        CatalogStore(self.file_name).compact([{"id": "A", "name": "Espresso", "price": 2.5}])
+
+    def test_compaction_keeps_changes_logged_by_another_store(self):
+        first, second = CatalogStore(self.file_name), CatalogStore(self.file_name)
+        first_products, second_products = first.load(), second.load()
+        second_products.append({"id": "B", "name": "Latte", "price": 3.5})
+        second.record_put(second_products["B"], second_products)
+        first_products.append({"id": "C", "name": "Mocha", "price": 4.0})
+        first.record_put(first_products["C"], first_products)
+        first.compact(first_products)
+
+        self.assertEqual(sorted(product["id"] for product in CatalogStore(self.file_name).load()), ["A", "B", "C"])
+        second_products.discard("A")
+        second.record_remove("A", second_products)
+        second.compact(second_products)
+        self.assertEqual(sorted(product["id"] for product in CatalogStore(self.file_name).load()), ["B", "C"])
+
+    def test_background_compaction_keeps_every_logged_change(self):
+        store = CatalogStore(self.file_name, compact_after=2)
+        products = store.load()
+        for product_id in ("B", "C", "D"):
+            products.append({"id": product_id, "name": product_id, "price": 1.0})
+            store.record_put(products[product_id], products)
+        products.discard("A")
+        store.record_remove("A", products)
+        store.close()
+
+        reloaded = CatalogStore(self.file_name)
+        self.assertEqual(sorted(product["id"] for product in reloaded.load()), ["B", "C", "D"])
+        self.assertLess(reloaded.pending, 4)
+        store.compact(products)
+        self.assertEqual(sorted(product["id"] for product in CatalogStore(self.file_name).load()), ["B", "C", "D"])
+
+    def test_change_logged_after_a_torn_line_survives_a_restart(self):
+        store = CatalogStore(self.file_name)
+        products = store.load()
+        products.append({"id": "B", "name": "Latte", "price": 3.5})
+        store.record_put(products["B"], products)
+        with open(store.log_file, "ab") as file:
+            file.write(b'{"op": "put", "product": {"id": "X"')  # Another process crashed mid-append
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            products.append({"id": "C", "name": "Mocha", "price": 4.0})
+            store.record_put(products["C"], products)
+            self.assertEqual(sorted(product["id"] for product in CatalogStore(self.file_name).load()), ["A", "B", "C"])
+            with open(store.log_file, "ab") as file:
+                file.write(b'{"op": "remo')  # A crash before the restart
+            reloaded = CatalogStore(self.file_name)
+            reloaded_products = reloaded.load()
+            reloaded_products.discard("B")
+            reloaded.record_remove("B", reloaded_products)
+        self.assertEqual(sorted(product["id"] for product in CatalogStore(self.file_name).load()), ["A", "C"])
+
+
+# Replay of the sales journal after a crash mid-write
+class SalesJournalTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_name = os.path.join(directory.name, "sales.journal")
+
+    def write(self, records):
+        journal = SalesJournal(self.file_name)
+        journal.open()
+        for record in records:
+            journal.append(record)
+        journal.close()
+
+    def replay(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return SalesJournal(self.file_name).replay()
+
+    def test_replays_every_record(self):
+        records = [make_sale_record(i) for i in range(50)]
+        self.write(records)
+        self.assertEqual(self.replay(), records)
+
+    def test_torn_last_record_is_dropped(self):
+        self.write([make_sale_record(i) for i in range(50)])
+        size = os.path.getsize(self.file_name)
+        with open(self.file_name, "r+b") as file:
+            file.truncate(size - 5)
+
+        self.assertEqual(self.replay(), [make_sale_record(i) for i in range(49)])
+        self.assertEqual(os.path.getsize(self.file_name), size * 49 // 50)  # The torn bytes are cut off
+
+        # Records appended after recovery replay cleanly too
+        self.write([make_sale_record(50)])
+        self.assertEqual(self.replay(), [make_sale_record(i) for i in range(49)] + [make_sale_record(50)])
+
+    def test_missing_journal_replays_nothing(self):
+        self.assertEqual(self.replay(), [])
+
+
+# Orders placed from several processes through the locked, batched order writer
+class ConcurrentOrdersTest(unittest.TestCase):
+    processes = 4
+    orders_per_process = 300
+
+    def test_no_order_is_lost_torn_or_misindexed(self):
+        with working_directory() as directory:
+            context = multiprocessing.get_context("spawn")
+            workers = [context.Process(target=place_orders, args=(directory, worker, self.orders_per_process))
+                       for worker in range(self.processes)]
+            for process in workers:
+                process.start()
+            for process in workers:
+                process.join()
+            self.assertEqual([process.exitcode for process in workers], [0] * self.processes)
+
+            expected = {(f"worker{w}", f"W{w}, N{i:06d}, {'B01' * (i % 7)}".rstrip(", "))
+                        for w in range(self.processes) for i in range(self.orders_per_process)}
+            with open(Main.ORDER_FILE, "r") as file:
+                orders = [line.rstrip("\n").split(" | ") for line in file]
+            self.assertTrue(all(len(order) == 4 and order[3] == "Pending" for order in orders))
+            self.assertEqual(len(orders), len(expected))
+            self.assertEqual({(customer, items.rstrip(", ")) for _, customer, items, _ in orders}, expected)
+
+            index = Main.load_order_index()
+            self.assertEqual(sorted(index), sorted(order[0] for order in orders))
+            for order_id, customer, _, _ in orders:
+                self.assertIn(customer, Main.find_order(order_id))
+
+
+# An order is only confirmed once Order.txt holds it
+class PlaceOrderTest(unittest.TestCase):
+    def test_failed_write_raises_and_releases_the_reservation(self):
+        with working_directory(), mock.patch.object(Main, "inventory", InventoryEngine()):
+            Main.inventory.set_quantity("B01", 3)
+            with mock.patch.object(Main.order_writer, "_write_batch", side_effect=OSError(28, "No space left")):
+                with self.assertRaises(OSError):
+                    Main.place_order("amy", ["B01", "B01"])
+            self.assertEqual(Main.inventory.get("B01"), 3)
+            self.assertFalse(os.path.exists(Main.ORDER_FILE))
+
+            order_id = Main.place_order("amy", ["B01", "B01"])
+            self.assertEqual(Main.inventory.get("B01"), 1)
+            self.assertIn(" | amy | B01, B01 | Pending", Main.find_order(order_id))
+
+    def test_failed_checkout_keeps_the_cart(self):
+        Main.carts.add("failed-checkout", "B01", 2)
+        self.addCleanup(Main.carts.take, "failed-checkout")
+        with mock.patch.object(Main, "place_order", side_effect=OSError(28, "No space left")), \
+                mock.patch("builtins.input", return_value="amy"), contextlib.redirect_stdout(io.StringIO()) as output:
+            Main.checkout("failed-checkout")
+        self.assertIn("No space left", output.getvalue())
+        self.assertEqual(Main.carts.get("failed-checkout"), {"B01": 2})
+
+    def test_service_reports_a_failed_checkout_and_keeps_the_cart(self):
+        service = CoffeeHouseService(cashier=None, manager=None)
+        service.carts.add("s1", "B01", 2)
+        with mock.patch.object(Main, "place_order", side_effect=sqlite3.OperationalError("database is locked")):
+            response = asyncio.run(service.handle_request({"op": "checkout", "session": "s1", "name": "amy"}))
+        self.assertEqual(response, {"ok": False, "error": "Storage error: database is locked"})
+        self.assertEqual(service.carts.get("s1"), {"B01": 2})
+
+
+# Stripe-locked stock levels and basket reservations
+class InventoryEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = InventoryEngine(stripes=4)
+        self.engine.set_quantity("B01", 5)
+        self.engine.set_quantity("P02", 2)
+
+    def test_purchase_is_all_or_nothing(self):
+        self.assertFalse(self.engine.purchase({"B01": 1, "P02": 3}))
+        self.assertEqual((self.engine.get("B01"), self.engine.get("P02")), (5, 2))
+        self.assertTrue(self.engine.purchase({"B01": 1, "P02": 2}))
+        self.assertEqual((self.engine.get("B01"), self.engine.get("P02")), (4, 0))
+
+    def test_unstocked_items_are_not_controlled(self):
+        self.assertTrue(self.engine.purchase({"B01": 1, "Z99": 100}))
+        self.assertEqual(self.engine.get("B01"), 4)
+        self.assertIsNone(self.engine.get("Z99"))
+
+    def test_release_returns_stock_once(self):
+        reservation_id = self.engine.reserve({"B01": 3})
+        self.assertEqual(self.engine.get("B01"), 2)
+        self.assertTrue(self.engine.release(reservation_id))
+        self.assertFalse(self.engine.release(reservation_id))
+        self.assertFalse(self.engine.commit(reservation_id))
+        self.assertEqual(self.engine.get("B01"), 5)
+
+    def test_commit_keeps_stock_taken(self):
+        reservation_id = self.engine.reserve({"P02": 2})
+        self.assertIsNone(self.engine.reserve({"P02": 1}))
+        self.assertTrue(self.engine.commit(reservation_id))
+        self.assertFalse(self.engine.release(reservation_id))
+        self.assertEqual(self.engine.get("P02"), 0)
+
+    def test_expired_reservation_is_released(self):
+        reservation_id = self.engine.reserve({"B01": 5}, ttl=0.001)
+        time.sleep(0.01)
+        self.engine.release_expired()
+        self.assertEqual(self.engine.get("B01"), 5)
+        self.assertFalse(self.engine.commit(reservation_id))
+
+    def test_stock_is_shared_through_either_storage_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for storage in (FileStorage(directory), SQLiteStorage(os.path.join(directory, "coffeehouse.db"))):
+                manager, cashier = storage.inventory(), storage.inventory()  # As if in separate processes
+                manager.set_quantity("B01", 3)
+                self.assertTrue(cashier.purchase({"B01": 2}))
+                self.assertFalse(manager.purchase({"B01": 2}))
+                manager.release(manager.reserve({"B01": 1}))
+                self.assertEqual(storage.inventory().stock, {"B01": 1})
+                storage.close()
+
+    def test_concurrent_baskets_never_oversell(self):
+        skus = [f"X{i:03d}" for i in range(50)]
+        for sku in skus:
+            self.engine.set_quantity(sku, 30)
+        sold = [{} for _ in range(8)]
+        lowest = []
+
+        def shopper(worker):
+            rng = random.Random(worker)
+            for i in range(2000):
+                if i % 100 == 0:
+                    lowest.append(min(self.engine.stock.values()))
+                basket = {sku: rng.randint(1, 3) for sku in rng.sample(skus, rng.randint(1, 4))}
+                if i % 10 == 0:
+                    reservation_id = self.engine.reserve(basket, ttl=0.001 if i % 20 == 0 else None)
+                    if reservation_id is None or i % 20 == 0:
+                        continue  # Short, or abandoned: the reservation times out and the stock comes back
+                    self.engine.commit(reservation_id)
+                elif not self.engine.purchase(basket):
+                    continue
+                for sku, quantity in basket.items():
+                    sold[worker][sku] = sold[worker].get(sku, 0) + quantity
+
+        workers = [threading.Thread(target=shopper, args=(worker,)) for worker in range(len(sold))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        time.sleep(0.01)
+        self.engine.release_expired()
+
+        self.assertGreaterEqual(min(lowest), 0)
+        for sku in skus:
+            self.assertEqual(self.engine.stock[sku] + sum(counts.get(sku, 0) for counts in sold), 30, sku)
+
+
+# Keyword search over the review index
+class FeedbackSearchTest(unittest.TestCase):
+    def test_search_matches_a_scan_of_the_reviews(self):
+        rng = random.Random(7)
+        words = ["great", "cold", "sweet", "bitter", "slow", "dry"]
+        analytics = FeedbackAnalytics()
+        texts = [" ".join(rng.choices(words[:rng.randint(1, len(words))], k=rng.randint(1, 4))) for _ in range(500)]
+        texts += ["pumpkin spice"] * 50  # Newest reviews that share no word with the rest
+        for text in texts:
+            analytics.add_review(text)
+
+        for query in [rng.sample(words, rng.randint(1, 3)) for _ in range(200)] + [["pumpkin", "great"], ["tea"]]:
+            limit = rng.randint(1, 30)
+            expected = [text for text in reversed(texts) if all(word in text.split() for word in query)][:limit]
+            self.assertEqual([review["text"] for review in analytics.search(" ".join(query), limit)], expected, query)
+
+
+# Copying the flat files into a new SQLite database
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.storage = SQLiteStorage(os.path.join(self.directory, "coffeehouse.db"))
+        self.addCleanup(self.storage.close)
+        CatalogStore(os.path.join(self.directory, "defaultproducts.json")).compact(make_products(3))
+
+    def test_missing_product_file_is_an_error(self):
+        with self.assertRaises(ValueError):
+            migrate(self.storage, self.directory, "products.json")
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM products")[0][0], 0)
+
+    def test_failed_migration_leaves_the_database_empty(self):
+        with open(os.path.join(self.directory, "Order.txt"), "w") as file:
+            file.write("0001 | amy | B01 | Pending\n")
+        with open(os.path.join(self.directory, "Feedback.txt"), "w") as file:
+            file.write("amy,Latte,too sweet\n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            with mock.patch.object(SQLiteLedger, "bulk_load", side_effect=OSError(28, "No space left")):
+                with self.assertRaises(OSError):
+                    migrate(self.storage, self.directory, "defaultproducts.json")
+            self.assertEqual([self.storage.query(f"SELECT COUNT(*) FROM {table}")[0][0] for table in MIGRATED_TABLES],
+                             [0] * len(MIGRATED_TABLES))
+            counts = migrate(self.storage, self.directory, "defaultproducts.json")
+        self.assertEqual((counts["products"], counts["orders"], counts["feedback"]), (3, 1, 1))
+
+
+# Dish reviews in Feedback.txt and in the SQLite feedback table
+class DishReviewStorageTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.storage = SQLiteStorage(os.path.join(self.directory, "coffeehouse.db"))
+        self.addCleanup(self.storage.close)
+
+    def test_migration_copies_complete_reviews(self):
+        CatalogStore(os.path.join(self.directory, "defaultproducts.json")).compact([])
+        with open(os.path.join(self.directory, "Feedback.txt"), "w") as file:
+            file.write("amy,Latte,too sweet\nbob,Mocha,great, really great\ncat,Tea,half wri")
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts = migrate(self.storage, self.directory, "defaultproducts.json")
+        self.assertEqual(counts["feedback"], 2)
+        self.assertEqual([row[1:] for row in self.storage.dish_reviews().after(0)],
+                         [("amy", "Latte", "too sweet"), ("bob", "Mocha", "great, really great")])
+        with self.assertRaises(ValueError):
+            migrate(self.storage, self.directory, "defaultproducts.json")
+
+    def test_manager_imports_new_reviews_from_the_table(self):
+        reviews = self.storage.dish_reviews()
+        manager = Manager(dish_reviews=reviews)
+        reviews.add("amy", "Latte", "too sweet")
+        reviews.add("bob", "Latte", "")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(manager.import_dish_reviews(), 1)
+            self.assertEqual(manager.import_dish_reviews(), 0)
+            reviews.add("cat", "Latte", "just right")
+            self.assertEqual(manager.import_dish_reviews(), 1)
+        self.assertEqual([review["username"] for review in manager.feedback_analytics.latest_for_dish("Latte")],
+                         ["cat", "amy"])
+
+
+if __name__ == "__main__":
+    unittest.main()